@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the Nilsimsa and scoring hot paths.
+
+Corpora are the deterministic synthetic headers of imap_fixture (1k, 10k and
+100k messages by default; smaller corpora are prefixes of the largest). For
+every size the suite times HeaderNormalizer.normalize, Nilsimsa.update,
+hexdigest, compare_hexdigests, FolderCorpus.distances and .snapshot,
+score_folder (per-message list and the weighted Counter sync_and_distance
+returns) and an end-to-end "score one message against N stored digests"
+through the per-folder corpora, reporting throughput (best of --repeat
+runs) and the tracemalloc peak of one extra run. Per-message functions run
+over at most --max-items messages so the 100k corpus stays affordable; the
+comparison and scoring benchmarks always use all N digests.
+
+Results can be written as JSON and checked against a stored baseline: any
+throughput more than --tolerance below, or peak memory more than
+--tolerance above the baseline, is reported and makes the run exit 1.
+"""
+
+import argparse
+import collections
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List
+
+from corpus import FolderCorpus, digest_int
+from imap_fixture import synthetic_headers
+from imap_nilsimsa import HeaderNormalizer, IMAPAutoSorter, NEVER_CLASSIFIED, hash_headers
+from nilsimsa import Nilsimsa, compare_hexdigests
+
+SIZES = (1000, 10000, 100000)
+
+
+class Corpus:
+    """Synthetic raw headers with their normalized text and stored digests."""
+
+    def __init__(self, sorter: IMAPAutoSorter, size: int, seed: int = 0, workers: int = 0):
+        self.sorter = sorter
+        mails = list(synthetic_headers(size, sorter.imap_folders, seed))
+        self.folders = [m[0] for m in mails]
+        self.raw = [m[2] for m in mails]
+        args = sorter._normalize_args()
+        chunks = [self.raw[i:i + 1000] for i in range(0, size, 1000)]
+        workers = workers or os.cpu_count() or 1
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                hashed = [row for rows in pool.map(hash_headers, chunks, [args] * len(chunks),
+                                                   [sorter.weight_headers_re] * len(chunks),
+                                                   [sorter.weight_headers_by] * len(chunks)) for row in rows]
+        else:
+            hashed = [row for chunk in chunks
+                      for row in hash_headers(chunk, args, sorter.weight_headers_re, sorter.weight_headers_by)]
+        self.trimmed = [row[0] for row in hashed]
+        self.digests = [row[2] for row in hashed]
+
+    def prefix(self, n: int) -> "Corpus":
+        part = Corpus.__new__(Corpus)
+        part.sorter = self.sorter
+        for attr in ("folders", "raw", "trimmed", "digests"):
+            setattr(part, attr, getattr(self, attr)[:n])
+        return part
+
+    def corpora(self) -> Dict[str, FolderCorpus]:
+        """One resident FolderCorpus per folder, built with the sorter's [nilsimsa] knobs."""
+        sorter = self.sorter
+        rows = {f: [] for f in sorter.imap_folders}
+        for uid, (folder, digest) in enumerate(zip(self.folders, self.digests), 1):
+            rows[folder].append((uid, digest))
+        return {f: FolderCorpus(f, r, sorter.prefilter_prototypes, sorter.prefilter_radius, sorter.collapse_bits,
+                                sorter.sample_size, sorter.sample_half_life) for f, r in rows.items()}
+
+
+class Suite:
+    def __init__(self, sorter: IMAPAutoSorter, repeat: int = 3, max_items: int = 10000):
+        self.sorter = sorter
+        self.repeat = max(1, repeat)
+        self.max_items = max_items
+        self.results: Dict[str, dict] = {}
+
+    def measure(self, name: str, fn: Callable[[], None], work: float, unit: str) -> None:
+        """Best-of-repeat throughput of fn() doing *work* units, plus its tracemalloc peak."""
+        best = float("inf")
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.results[name] = {"ops_per_sec": work / best if best > 0 else 0.0, "unit": unit,
+                              "seconds": best, "peak_kib": peak / 1024.0}
+        print("%-28s %14.1f %-10s %10.3f s %10.1f KiB" % (name, work / best if best > 0 else 0.0,
+                                                         unit + "/s", best, peak / 1024.0))
+
+    def run(self, corpus: Corpus) -> None:
+        n = len(corpus.raw)
+        items = min(n, self.max_items)
+        raw, trimmed = corpus.raw[:items], corpus.trimmed[:items]
+        texts = ["X-LLM-Categories: %s\n%s" % (NEVER_CLASSIFIED, t) for t in trimmed]
+        args = self.sorter._normalize_args()
+        sorter = self.sorter
+        source = corpus.digests[0]
+        digests = corpus.digests
+        distances = [compare_hexdigests(source, d) for d in digests]
+        weighted = collections.Counter(distances)
+        folder = sorter.imap_folders[0]
+        whole = FolderCorpus(folder, enumerate(digests, 1), sorter.prefilter_prototypes, sorter.prefilter_radius,
+                             sorter.collapse_bits)  # every row, unsampled
+        corpora = corpus.corpora()
+        source_int = digest_int(source)
+
+        def normalize():
+            for r in raw:
+                HeaderNormalizer.normalize(r, *args)
+
+        def update():
+            for t in texts:
+                Nilsimsa().update(t)
+
+        states = []
+        for t in texts:
+            state = Nilsimsa()
+            state.update(t)
+            states.append(state)
+
+        def hexdigest():
+            for state in states:
+                state.hexdigest()
+
+        def compare():
+            for d in digests:
+                compare_hexdigests(source, d)
+
+        def corpus_distances():
+            whole.distances(source_int)
+
+        def corpus_snapshot():
+            whole.snapshot(source_int)
+
+        def score_folder():
+            for _ in range(20):  # a single pass is too short to time reliably
+                sorter.score_folder(folder, distances, sorter.threshold, quiet=True)
+
+        def score_weighted():
+            for _ in range(20):
+                sorter.score_folder(folder, weighted, sorter.threshold, quiet=True)
+
+        sources = corpus.raw[:5]
+
+        def score_one():
+            for r in sources:
+                src = sorter._digest(NEVER_CLASSIFIED, sorter.return_header(r))
+                src = digest_int(src)
+                dist_cache = {f: c.snapshot(src, floor=sorter.threshold)[2] for f, c in corpora.items()}
+                sorter.resolve_winner(dist_cache, quiet=True)
+
+        self.measure("normalize@%d" % n, normalize, items, "msgs")
+        self.measure("nilsimsa_update@%d" % n, update, sum(len(t) for t in texts) / 1e3, "kB")
+        self.measure("hexdigest@%d" % n, hexdigest, items, "calls")
+        self.measure("compare_hexdigests@%d" % n, compare, n, "pairs")
+        self.measure("corpus_distances@%d" % n, corpus_distances, n, "rows")
+        self.measure("corpus_snapshot@%d" % n, corpus_snapshot, n, "rows")
+        self.measure("score_folder@%d" % n, score_folder, 20 * n, "dists")
+        self.measure("score_folder_weighted@%d" % n, score_weighted, 20 * n, "dists")
+        self.measure("score_one@%d" % n, score_one, len(sources), "msgs")
+
+
+def check(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Names and reasons of benchmarks that regressed against *baseline*."""
+    regressions = []
+    for name, base in sorted(baseline.items()):
+        cur = results.get(name)
+        if cur is None:
+            continue
+        if cur["ops_per_sec"] < base["ops_per_sec"] * (1 - tolerance):
+            regressions.append("%s: %.1f %s/s, baseline %.1f" % (name, cur["ops_per_sec"], cur["unit"],
+                                                                  base["ops_per_sec"]))
+        if cur["peak_kib"] > base["peak_kib"] * (1 + tolerance) + 64:
+            regressions.append("%s: peak %.1f KiB, baseline %.1f" % (name, cur["peak_kib"], base["peak_kib"]))
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the Nilsimsa and scoring hot paths.")
+    parser.add_argument("--config", default="imap_autosort.conf.sample",
+                        help="Config providing folders and [nilsimsa] knobs (only read, nothing connects)")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="Comma-separated corpus sizes")
+    parser.add_argument("--seed", type=int, default=0, help="Synthetic corpus seed")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark (best counts)")
+    parser.add_argument("--max-items", type=int, default=10000,
+                        help="Cap for the per-message benchmarks (normalize, update, hexdigest)")
+    parser.add_argument("--workers", type=int, default=0, help="Processes for corpus preparation (0 = one per CPU)")
+    parser.add_argument("--json", metavar="FILE", help="Write results as JSON")
+    parser.add_argument("--baseline", metavar="FILE", help="Fail if results regress against this JSON")
+    parser.add_argument("--save-baseline", metavar="FILE", help="Write results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    sorter = IMAPAutoSorter(args.config, offline=True)
+    logging.getLogger("imap_nilsimsa").setLevel(logging.WARNING)
+    sizes = sorted(int(s) for s in args.sizes.split(",") if s.strip())
+
+    start = time.perf_counter()
+    full = Corpus(sorter, sizes[-1], args.seed, args.workers)
+    print("Prepared %d synthetic messages in %.1fs" % (sizes[-1], time.perf_counter() - start))
+    suite = Suite(sorter, args.repeat, args.max_items)
+    for size in sizes:
+        suite.run(full.prefix(size))
+
+    report = {
+        "meta": {"python": platform.python_version(), "machine": platform.machine(),
+                 "platform": platform.platform(), "seed": args.seed, "sizes": sizes,
+                 "repeat": args.repeat, "max_items": args.max_items,
+                 "when": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": suite.results,
+    }
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = check(suite.results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against %s:" % args.baseline)
+            for line in regressions:
+                print("  " + line)
+            sys.exit(1)
+        print("No regressions against %s" % args.baseline)
+
+
+if __name__ == "__main__":
+    main()
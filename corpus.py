@@ -0,0 +1,336 @@
+# corpus.py
+import bisect
+import collections
+import heapq
+import math
+import threading
+from array import array
+
+DIGEST_SIZE = 32  # bytes in a Nilsimsa digest (64 hex characters)
+MAX_COLLAPSE_BITS = 3  # keeps every duplicate-index band at least 8 bytes wide
+
+try:
+    _popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def _popcount(x):
+        return bin(x).count("1")
+
+
+def digest_int(hexdigest: str) -> int:
+    """A hexdigest as one 256-bit integer, the form distance() compares against."""
+    return int(hexdigest, 16)
+
+
+def _uniform(uid: int) -> float:
+    """A fixed pseudo-random number in (0, 1) for *uid* (murmur3 finalizer)."""
+    h = uid & 0xFFFFFFFF
+    h = ((h ^ (h >> 16)) * 0x85EBCA6B) & 0xFFFFFFFF
+    h = ((h ^ (h >> 13)) * 0xC2B2AE35) & 0xFFFFFFFF
+    return ((h ^ (h >> 16)) + 0.5) / 2 ** 32
+
+
+class FolderCorpus:
+    """Resident Nilsimsa digests of one folder.
+
+    UIDs are kept sorted in an ``array('I')`` that doubles as the UID -> row
+    index (bisect); a parallel ``array('I')`` holds each row's representative
+    slot. Representatives are raw 32-byte slots of one bytearray, each with a
+    count of the rows it stands for: copies of a digest share one slot, and
+    with *collapse_bits* > 0 so do digests within that many bits of it. A
+    folder of near-identical notifications is thus compared once per
+    representative, not once per message. A message with a digest of its
+    own costs about 44 bytes plus its entries in the duplicate index (keyed
+    by the whole digest, or with *collapse_bits* > 0 by each of the
+    *collapse_bits* + 1 bands that split it, every slot listed under its
+    band keys); there is no per-message object. distance() gives the same
+    value as nilsimsa.compare_hexdigests (128 minus differing bits) for
+    the representative, which is the row's own digest unless
+    *collapse_bits* > 0. All methods take the corpus lock, so the score and
+    commit stages may use one corpus from different threads.
+
+    With *prototypes* > 0 the corpus also keeps up to that many prototype
+    digests, each with the largest Hamming distance (radius) of a
+    representative it covers. By the triangle inequality no row can be more
+    similar to a source than 128 - (bits(source ^ prototype) - radius),
+    which gives bound() without touching the rows. Representatives are
+    covered as they are created; pruning never widens a radius, and the
+    prototypes are rebuilt once half of the covered rows have gone.
+
+    With *sample_size* > 0, a folder holding more rows than that is scored
+    from a recency-weighted sample of *sample_size* rows instead
+    (Efraimidis-Spirakis weighted reservoir). A row weighs half as much as
+    one *half_life* UIDs newer; 0 samples uniformly. Because the weight grows
+    exponentially, the ratio of two rows' weights never changes. Each UID
+    therefore keeps a fixed sampling key, and the sample is simply the
+    *sample_size* smallest keys. add() keeps it up to date; discarding a
+    sampled row refills it from all rows on the next snapshot.
+    """
+
+    __slots__ = ("folder", "uids", "row_rep", "rep_digests", "rep_counts", "lock", "collapse_bits", "_bands",
+                 "_free", "max_prototypes", "radius", "prototypes", "radii", "_discarded", "sample_size",
+                 "half_life", "_sampled", "_sample_heap", "_sample_dirty")
+
+    def __init__(self, folder: str, rows=(), prototypes: int = 0, radius: int = 40, collapse_bits: int = 0,
+                 sample_size: int = 0, half_life: int = 0):
+        """*rows* are (uid, hexdigest) pairs, e.g. straight from the nilsimsa table.
+
+        Rows without a UID or with an unusable digest are skipped; for a
+        repeated UID the last row wins. A representative more than *radius*
+        bits from every prototype starts a new one while fewer than
+        *prototypes* exist.
+        """
+        if not 0 <= collapse_bits <= MAX_COLLAPSE_BITS:
+            raise ValueError("collapse_bits must be 0..%d" % MAX_COLLAPSE_BITS)
+        self.folder = folder
+        self.lock = threading.Lock()
+        self.collapse_bits = collapse_bits
+        # pigeonhole: digests within collapse_bits bits agree on one of collapse_bits + 1 bands,
+        # which split the digest between them; with 0 the one band is the whole digest
+        edges = [j * DIGEST_SIZE // (collapse_bits + 1) for j in range(collapse_bits + 2)]
+        self._bands = [(start, end, {}) for start, end in zip(edges, edges[1:])]
+        self.rep_digests = bytearray()
+        self.rep_counts = array("I")
+        self._free = []
+        self.max_prototypes = prototypes
+        self.radius = radius
+        self.prototypes, self.radii = [], []
+        self._discarded = 0
+        self.sample_size = sample_size
+        self.half_life = half_life
+        self._sampled, self._sample_heap = set(), []
+        self._sample_dirty = bool(sample_size)
+        by_uid = {}
+        for uid, hexdigest in rows:
+            try:
+                raw = bytes.fromhex(hexdigest)
+            except (TypeError, ValueError):
+                continue
+            if uid is not None and len(raw) == DIGEST_SIZE:
+                by_uid[int(uid)] = raw
+        self.uids = array("I", sorted(by_uid))
+        self.row_rep = array("I", (self._assign(by_uid[u]) for u in self.uids))
+
+    def __len__(self) -> int:
+        return len(self.uids)
+
+    def __contains__(self, uid) -> bool:
+        with self.lock:
+            return self._row(int(uid)) >= 0
+
+    def _row(self, uid: int) -> int:
+        i = bisect.bisect_left(self.uids, uid)
+        return i if i < len(self.uids) and self.uids[i] == uid else -1
+
+    def _rep(self, slot: int) -> bytes:
+        return bytes(self.rep_digests[slot * DIGEST_SIZE:(slot + 1) * DIGEST_SIZE])
+
+    @property
+    def representatives(self) -> int:
+        """Distinct digests held (near-distinct with collapse_bits)."""
+        return len(self.rep_counts) - len(self._free)
+
+    # ------------------------------ representatives ------------------------------
+    def _find(self, raw: bytes) -> int:
+        if not self.collapse_bits:
+            return self._bands[0][2].get(raw, -1)  # exact copies: the digest is its own key
+        digest = int.from_bytes(raw, "big")
+        for start, end, index in self._bands:
+            for slot in index.get(raw[start:end], ()):
+                if _popcount(int.from_bytes(self._rep(slot), "big") ^ digest) <= self.collapse_bits:
+                    return slot
+        return -1
+
+    def _assign(self, raw: bytes) -> int:
+        """Slot of the representative of *raw*, counted once more; a new slot if none is close enough."""
+        slot = self._find(raw)
+        if slot < 0:
+            if self._free:
+                slot = self._free.pop()
+                self.rep_digests[slot * DIGEST_SIZE:(slot + 1) * DIGEST_SIZE] = raw
+            else:
+                slot = len(self.rep_counts)
+                self.rep_digests += raw
+                self.rep_counts.append(0)
+            if not self.collapse_bits:
+                self._bands[0][2][raw] = slot
+            else:
+                for start, end, index in self._bands:
+                    index.setdefault(raw[start:end], []).append(slot)  # every owner of a band key is tried
+            if self.max_prototypes:
+                self._cover(int.from_bytes(raw, "big"))
+        self.rep_counts[slot] += 1
+        return slot
+
+    def _release(self, slot: int) -> None:
+        self.rep_counts[slot] -= 1
+        if not self.rep_counts[slot]:
+            raw = self._rep(slot)
+            if not self.collapse_bits:
+                del self._bands[0][2][raw]
+            else:
+                for start, end, index in self._bands:
+                    owners = index[raw[start:end]]
+                    owners.remove(slot)
+                    if not owners:
+                        del index[raw[start:end]]
+            self._free.append(slot)
+
+    # ------------------------------ updates ------------------------------
+    def add(self, uid, hexdigest: str) -> None:
+        """Insert or replace the digest of *uid*."""
+        raw = bytes.fromhex(hexdigest)
+        if len(raw) != DIGEST_SIZE:
+            raise ValueError("not a Nilsimsa hexdigest: %r" % hexdigest)
+        uid = int(uid)
+        with self.lock:
+            i = bisect.bisect_left(self.uids, uid)
+            if i < len(self.uids) and self.uids[i] == uid:
+                old = self.row_rep[i]
+                self.row_rep[i] = self._assign(raw)  # before the release, so an unchanged digest keeps its slot
+                self._release(old)
+            elif i == len(self.uids):  # new mail: the common case, no shifting
+                self.uids.append(uid)
+                self.row_rep.append(self._assign(raw))
+                self._offer(uid)
+            else:
+                self.uids.insert(i, uid)
+                self.row_rep.insert(i, self._assign(raw))
+                self._offer(uid)
+
+    def discard(self, uid) -> None:
+        uid = int(uid)
+        with self.lock:
+            i = self._row(uid)
+            if i >= 0:
+                self._release(self.row_rep[i])
+                del self.uids[i]
+                del self.row_rep[i]
+                self._discarded += 1
+                if uid in self._sampled:
+                    self._sample_dirty = True
+
+    # ------------------------------ sampling ------------------------------
+    def _key(self, uid: int) -> float:
+        # log(-log(u) / w) with w = 2 ** (uid / half_life): smallest keys win
+        key = math.log(-math.log(_uniform(uid)))
+        return key - uid * math.log(2) / self.half_life if self.half_life else key
+
+    def _offer(self, uid: int) -> None:
+        if not self.sample_size or self._sample_dirty:
+            return  # the refill will consider it
+        key = self._key(uid)
+        if len(self._sampled) < self.sample_size:
+            self._sampled.add(uid)
+            heapq.heappush(self._sample_heap, (-key, uid))
+        elif key < -self._sample_heap[0][0]:
+            _, evicted = heapq.heapreplace(self._sample_heap, (-key, uid))
+            self._sampled.discard(evicted)
+            self._sampled.add(uid)
+
+    def _refill(self) -> None:
+        self._sample_heap = [(-self._key(uid), uid) for uid in heapq.nsmallest(self.sample_size, self.uids, self._key)]
+        heapq.heapify(self._sample_heap)
+        self._sampled = {uid for _, uid in self._sample_heap}
+        self._sample_dirty = False
+
+    # ------------------------------ prototypes ------------------------------
+    def _rebuild(self) -> None:
+        self.prototypes, self.radii = [], []
+        self._discarded = 0
+        if self.max_prototypes:
+            for slot, count in enumerate(self.rep_counts):
+                if count:
+                    self._cover(int.from_bytes(self._rep(slot), "big"))
+
+    def _cover(self, digest: int) -> None:
+        """Widen the prototype nearest to *digest* to reach it, or make *digest* a new prototype."""
+        nearest, bits = -1, 8 * DIGEST_SIZE + 1
+        for j, prototype in enumerate(self.prototypes):
+            b = _popcount(prototype ^ digest)
+            if b < bits:
+                nearest, bits = j, b
+        if bits > self.radius and len(self.prototypes) < self.max_prototypes:
+            self.prototypes.append(digest)
+            self.radii.append(0)
+        elif bits > self.radii[nearest]:
+            self.radii[nearest] = bits
+
+    def _bound(self, source: int) -> int:
+        if not self.max_prototypes:
+            return 128
+        if self._discarded * 2 > len(self.uids):
+            self._rebuild()
+        return max((128 - max(0, _popcount(p ^ source) - r) for p, r in zip(self.prototypes, self.radii)),
+                   default=-128)
+
+    def bound(self, source: int) -> int:
+        """Upper bound of distance(uid, *source*) over every row (128 without prototypes)."""
+        with self.lock:
+            return self._bound(source)
+
+    # ------------------------------ reads ------------------------------
+    def hexdigest(self, uid) -> str:
+        """Digest of *uid*'s representative (its own unless collapse_bits > 0)."""
+        with self.lock:
+            i = self._row(int(uid))
+            return self._rep(self.row_rep[i]).hex() if i >= 0 else None
+
+    def distance(self, uid, source: int):
+        """compare_hexdigests(source, digest of *uid*) for *source* from digest_int(); None if unknown."""
+        with self.lock:
+            i = self._row(int(uid))
+            if i < 0:
+                return None
+            row = int.from_bytes(self._rep(self.row_rep[i]), "big")
+        return 128 - _popcount(row ^ source)
+
+    def distances(self, source: int):
+        """Distances from *source* to every row, in UID order."""
+        with self.lock:
+            by_slot = {}
+            for slot in self.row_rep:
+                if slot not in by_slot:
+                    by_slot[slot] = 128 - _popcount(int.from_bytes(self._rep(slot), "big") ^ source)
+            return [by_slot[slot] for slot in self.row_rep]
+
+    def snapshot(self, source: int, live=None, floor: int = None):
+        """(copy of the UIDs, bound(*source*), Counter distance -> rows), taken under one lock.
+
+        The Counter holds one distance per representative, weighted by the
+        rows it stands for, and covers only rows whose UID is in *live* (all
+        rows when None). It stays empty when the bound is not above *floor*.
+        A sampled folder counts only its sample, each row scaled by rows /
+        sampled rows, so the Counter still adds up to the folder's size.
+        """
+        with self.lock:
+            uids = array("I", self.uids)
+            bound = self._bound(source)
+            weighted = collections.Counter()
+            if floor is not None and bound <= floor:
+                return uids, bound, weighted
+            counts, rows, scale = self.rep_counts, len(self.uids), 1
+            if self.sample_size and rows > self.sample_size:
+                if self._sample_dirty:
+                    self._refill()
+                counts = array("I", bytes(counts.itemsize * len(counts)))
+                sampled = 0
+                for uid in self._sampled:
+                    if live is None or uid in live:
+                        counts[self.row_rep[self._row(uid)]] += 1
+                        sampled += 1
+                if live is not None:
+                    rows = sum(1 for uid in self.uids if uid in live)
+                scale = rows / sampled if sampled else 0
+            elif live is not None:
+                counts = array("I", counts)
+                for uid, slot in zip(self.uids, self.row_rep):
+                    if uid not in live:
+                        counts[slot] -= 1
+            with memoryview(self.rep_digests) as digests:
+                for slot, count in enumerate(counts):
+                    if count:
+                        start = slot * DIGEST_SIZE
+                        weighted[128 - _popcount(int.from_bytes(digests[start:start + DIGEST_SIZE], "big") ^ source)] \
+                            += count * scale
+            return uids, bound, weighted
+
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+"""
+Seed the nilsimsa table straight from local mail, bypassing IMAP.
+
+Reads the server's Maildir tree (or an mbox export), parses only the header
+block of each message through mmap, normalizes and hashes on a process pool
+and bulk-inserts the rows the first sync_and_distance would have written
+(NEVER_CLASSIFIED categories). Maildir UIDs come from Dovecot's
+dovecot-uidlist and mbox UIDs from Dovecot's X-UID header; rows without a
+known UID are stored with a NULL uid and adopted by md5 on the first sync,
+so that sync still fetches the header but no longer hashes or inserts.
+
+Only \\Seen messages are imported by default, matching the UID SEARCH SEEN
+the sync uses. Run it while the sorter is stopped: it takes the same lock.
+"""
+
+import argparse
+import mmap
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from imap_nilsimsa import IMAPAutoSorter, NEVER_CLASSIFIED, hash_headers
+from replay import maildir_folders
+
+BATCH = 1000  # messages per worker task and per INSERT batch
+
+_X_UID = re.compile(rb"^X-UID:\s*(\d+)", re.I | re.M)
+_STATUS = re.compile(rb"^Status:\s*(\S+)", re.I | re.M)
+_X_IMAP = re.compile(rb"^X-IMAP:", re.M)
+
+# ------------------------------ header reading ------------------------------
+
+def header_end(buf, start: int = 0, stop: Optional[int] = None) -> int:
+    """Offset just past the blank line ending the header block that starts at *start*."""
+    stop = len(buf) if stop is None else stop
+    ends = [i + n for i, n in ((buf.find(b"\n\n", start, stop), 2), (buf.find(b"\r\n\r\n", start, stop), 4))
+            if i >= 0]
+    return min(ends) if ends else stop
+
+
+def read_header(path: str) -> bytes:
+    """Header block of one message file, read through mmap (never the body)."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return mm[:header_end(mm)]
+
+
+def hash_files(paths: List[str], normalize_args: tuple, weight_headers_re,
+               weight_headers_by: int) -> List[Tuple[str, str, Optional[str]]]:
+    """Process-pool worker: read, normalize and hash message files, in order."""
+    raw = [read_header(p).decode("utf-8", "backslashreplace") for p in paths]
+    return hash_headers(raw, normalize_args, weight_headers_re, weight_headers_by)
+
+# ------------------------------ Maildir ------------------------------
+
+def read_uidlist(folder_path: str) -> Tuple[Optional[int], Dict[str, int]]:
+    """(uidvalidity, basename -> UID) from dovecot-uidlist, or (None, {}) if there is none.
+
+    Version 3 lines are ``<uid> [<ext> ...] :<basename>``, version 1 lines
+    ``<uid> <basename>``; basenames never carry the ``:2,<flags>`` part.
+    """
+    path = os.path.join(folder_path, "dovecot-uidlist")
+    try:
+        f = open(path, encoding="utf-8", errors="replace")
+    except FileNotFoundError:
+        return None, {}
+    uids = {}
+    with f:
+        header = f.readline().split()
+        uidvalidity = None
+        if header and header[0] == "3":
+            uidvalidity = next((int(h[1:]) for h in header[1:] if h.startswith("V") and h[1:].isdigit()), None)
+        elif len(header) >= 2 and header[1].isdigit():
+            uidvalidity = int(header[1])
+        for line in f:
+            if not line[:1].isdigit():
+                continue
+            uid, _, rest = line.rstrip("\n").partition(" ")
+            if " :" in " " + rest:
+                name = (" " + rest).split(" :", 1)[1]
+            else:
+                name = rest.split()[-1] if rest.split() else ""
+            if uid.isdigit() and name:
+                uids[name] = int(uid)
+    return uidvalidity, uids
+
+
+def maildir_messages(folder_path: str, seen_only: bool = True) -> Iterator[Tuple[Optional[int], str]]:
+    """(uid or None, path) of the messages of one Maildir."""
+    _, uids = read_uidlist(folder_path)
+    for sub in ("cur",) if seen_only else ("cur", "new"):
+        with os.scandir(os.path.join(folder_path, sub)) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                base, _, info = entry.name.partition(":")
+                if seen_only and "S" not in info.partition(",")[2]:
+                    continue
+                yield uids.get(base), entry.path
+
+# ------------------------------ mbox ------------------------------
+
+def mbox_messages(path: str, seen_only: bool = True) -> Iterator[Tuple[Optional[int], str]]:
+    """(uid or None, raw header) of every message in an mbox file, scanning one mmap."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offsets = [0] if mm[:5] == b"From " else []
+            i = mm.find(b"\nFrom ")
+            while i >= 0:
+                offsets.append(i + 1)
+                i = mm.find(b"\nFrom ", i + 1)
+            offsets.append(len(mm))
+            for begin, stop in zip(offsets, offsets[1:]):
+                start = mm.find(b"\n", begin, stop) + 1  # skip the From_ line
+                if start == 0:
+                    continue
+                header = mm[start:header_end(mm, start, stop)]
+                if _X_IMAP.search(header):
+                    continue  # UW-IMAP/Dovecot pseudo message holding folder metadata
+                status = _STATUS.search(header)
+                if seen_only and not (status and b"R" in status.group(1)):
+                    continue
+                uid = _X_UID.search(header)
+                yield (int(uid.group(1)) if uid else None), header.decode("utf-8", "backslashreplace")
+
+
+def mbox_folders(path: str) -> Dict[str, str]:
+    """Folder name -> mbox file: the file itself, or every file below a directory."""
+    if os.path.isfile(path):
+        return {os.path.splitext(os.path.basename(path))[0]: path}
+    found = {}
+    for dirpath, _, filenames in os.walk(path):
+        for fn in filenames:
+            full = os.path.join(dirpath, fn)
+            found[os.path.splitext(os.path.relpath(full, path))[0].replace(os.sep, "/")] = full
+    return found
+
+# ------------------------------ import ------------------------------
+
+class CorpusImporter:
+    """Bulk-load one account's nilsimsa rows from local mail."""
+
+    def __init__(self, sorter: IMAPAutoSorter, workers: int, dry_run: bool = False):
+        self.sorter = sorter
+        self.workers = workers
+        self.dry_run = dry_run
+        self.args = sorter._normalize_args()
+        self.weights = (sorter.weight_headers_re, sorter.weight_headers_by)
+
+    def _existing(self, folder: str) -> Tuple[set, set]:
+        rows = self.sorter.db.fetchall("SELECT uid, md5sum FROM nilsimsa WHERE folder = %s AND account = %s",
+                                       (folder, self.sorter.account))
+        return {r[0] for r in rows if r[0] is not None}, {r[1] for r in rows}
+
+    def import_folder(self, pool: ProcessPoolExecutor, folder: str, items: List[Tuple[Optional[int], str]],
+                      from_files: bool) -> int:
+        """Hash *items* ((uid, path) or (uid, raw header)) and insert the rows not yet in the table."""
+        have_uids, have_md5 = self._existing(folder)
+        items = [it for it in items if it[0] is None or it[0] not in have_uids]
+        worker = hash_files if from_files else hash_headers
+        batches = [items[i:i + BATCH] for i in range(0, len(items), BATCH)]
+        futures = [pool.submit(worker, [it[1] for it in batch], self.args, *self.weights) for batch in batches]
+        inserted = 0
+        for batch, future in zip(batches, futures):
+            rows = []
+            for (uid, _), (trimmed, md5sum, hexdigest) in zip(batch, future.result()):
+                if hexdigest is None or (uid is None and md5sum in have_md5):
+                    continue
+                have_md5.add(md5sum)
+                rows.append((uid, folder, hexdigest, md5sum, trimmed, NEVER_CLASSIFIED, self.sorter.account))
+            if rows and not self.dry_run:
+                self.sorter.db.executemany(
+                    "INSERT INTO nilsimsa (uid, folder, hexdigest, md5sum, trimmed_header, categories, account) "
+                    "VALUES (%s, %s, %s, %s, %s, %s, %s)", rows)
+            inserted += len(rows)
+        return inserted
+
+    def run(self, sources: Dict[str, List[Tuple[Optional[int], str]]], from_files: bool) -> int:
+        total = 0
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for folder, items in sorted(sources.items()):
+                start = time.perf_counter()
+                n = self.import_folder(pool, folder, items, from_files)
+                without_uid = sum(1 for it in items if it[0] is None)
+                print("%-30s %7d messages, %7d rows %s in %.1fs (%d without UID)" % (
+                    folder, len(items), n, "would be inserted" if self.dry_run else "inserted",
+                    time.perf_counter() - start, without_uid))
+                total += n
+        return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import a local Maildir or mbox corpus into the nilsimsa table.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--maildir", metavar="PATH", help="The account's Maildir root")
+    source.add_argument("--mbox", metavar="PATH", help="mbox file, or directory of mbox files (one per folder)")
+    parser.add_argument("--config", type=str, default="etc/imap_autosort.conf", help="Path to configuration file")
+    parser.add_argument("--account", metavar="NAME", help="Import for this [account:NAME] section")
+    parser.add_argument("--prefix", default="", help="Prepend to Maildir subfolder names (e.g. 'INBOX.')")
+    parser.add_argument("--folders", metavar="LIST", help="Comma-separated folders (default: [imap] folders)")
+    parser.add_argument("--all", action="store_true", help="Also import unseen messages")
+    parser.add_argument("--workers", type=int, default=0, help="Hashing processes (0 = [nilsimsa] cold_build_workers)")
+    parser.add_argument("--dry-run", action="store_true", help="Hash everything but insert nothing")
+    args = parser.parse_args()
+
+    sorter = IMAPAutoSorter(args.config, args.account)  # flock: never import under a running sorter
+    folders = [f.strip() for f in args.folders.split(",") if f.strip()] if args.folders else sorter.imap_folders
+    seen_only = not args.all
+
+    if args.maildir:
+        found = maildir_folders(args.maildir, prefix=args.prefix)
+        sources = {f: list(maildir_messages(found[f], seen_only)) for f in folders if f in found}
+    else:
+        found = mbox_folders(args.mbox)
+        sources = {f: list(mbox_messages(found[f], seen_only)) for f in folders if f in found}
+    missing = [f for f in folders if f not in found]
+    if missing:
+        print("Not found locally, skipped: %s" % ", ".join(missing))
+    if not sources:
+        sys.exit("No folders to import")
+
+    start = time.perf_counter()
+    importer = CorpusImporter(sorter, args.workers or sorter.cold_build_workers, args.dry_run)
+    total = importer.run(sources, from_files=bool(args.maildir))
+    print("%d rows in %.1fs" % (total, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,34 @@
 # db_helper.py
 import sys
-import mysql.connector
+import threading
+from metrics import METRICS
 
 class DatabaseHelper:
+    # nilsimsa columns added in place on top of the base CREATE TABLE;
+    # account is '' for the classic single-[imap] setup
+    NILSIMSA_COLUMNS = (
+        ("categories", "TEXT"),
+        ("moved_from", "TEXT"),
+        ("message_id", "TEXT"),
+        ("account", "VARCHAR(64) NOT NULL DEFAULT ''"),
+    )
+    # considered doubles as the per-message checkpoint of autosort_inbox,
+    # one row per (account, UIDVALIDITY, UID) of the todo folder
+    CONSIDERED_COLUMNS = (
+        ("account", "VARCHAR(64) NOT NULL DEFAULT ''"),
+        ("uidvalidity", "BIGINT"),
+        ("stage", "VARCHAR(16)"),
+        ("categories", "TEXT"),
+        ("winner", "VARCHAR(255)"),
+    )
+
     def __init__(self, mysql_pass, version, logger,
                  host="localhost", user="imap_nilsimsa", db="imap_nilsimsa", autocommit=True):
         self.logger = logger
         self.version = version
+        # one connection shared by worker threads; every cursor use is serialized
+        self.lock = threading.RLock()
+        import mysql.connector  # deferred: only runs that reach the database pay for the driver
         try:
             self.conn = mysql.connector.connect(
                 host=host, user=user, passwd=mysql_pass, db=db, autocommit=autocommit
@@ -17,15 +39,28 @@ class DatabaseHelper:
             self.logger.error("Database connection error: %s", e)
             sys.exit("Database connection failed.")
 
+    @staticmethod
+    def _op(args, kwargs):
+        sql = args[0] if args else kwargs.get("operation", "")
+        return sql.split(None, 1)[0].upper() if sql else "FETCH"
+
     def execute(self, *args, **kwargs):
-        return self.cursor.execute(*args, **kwargs)
+        with self.lock, METRICS.timer("db_query", op=self._op(args, kwargs) if METRICS.enabled else None):
+            return self.cursor.execute(*args, **kwargs)
+
+    def executemany(self, sql, rows):
+        # mysql.connector folds an INSERT ... VALUES batch into one multi-row statement
+        with self.lock, METRICS.timer("db_query", op=self._op((sql,), {}) if METRICS.enabled else None):
+            return self.cursor.executemany(sql, rows)
 
     def fetchall(self, *args, **kwargs):
         # supports both: rows = db.fetchall("SELECT ...", params)
         # and: db.execute("SELECT ...", params); rows = db.fetchall()
-        if args or kwargs:
-            self.cursor.execute(*args, **kwargs)
-        return self.cursor.fetchall()
+        # (only the first form is atomic when several threads share the helper)
+        with self.lock, METRICS.timer("db_query", op=self._op(args, kwargs) if METRICS.enabled else None):
+            if args or kwargs:
+                self.cursor.execute(*args, **kwargs)
+            return self.cursor.fetchall()
 
     def close(self):
         try: self.cursor.close()
@@ -34,6 +69,7 @@ class DatabaseHelper:
             except Exception: pass
 
     def _init_schema(self):
+        import mysql.connector
         try:
             self.cursor.execute(
                 'CREATE TABLE IF NOT EXISTS nilsimsa ('
@@ -43,6 +79,21 @@ class DatabaseHelper:
             )
             self.cursor.execute('CREATE TABLE IF NOT EXISTS considered (uid INTEGER, considered_when INTEGER)')
             self.cursor.execute('CREATE TABLE IF NOT EXISTS version (version TEXT)')
+            # per-folder archive watermarks (see IMAPAutoSorter.archive_emails)
+            self.cursor.execute(
+                "CREATE TABLE IF NOT EXISTS archive_state ("
+                "account VARCHAR(64) NOT NULL DEFAULT '', folder VARCHAR(255) NOT NULL, "
+                "checked INTEGER, due INTEGER, uidnext BIGINT, unseen INTEGER, "
+                "PRIMARY KEY (account, folder))"
+            )
+            # sender/List-Id routing history (see routes.RouteIndex)
+            self.cursor.execute(
+                "CREATE TABLE IF NOT EXISTS routes ("
+                "account VARCHAR(64) NOT NULL DEFAULT '', kind VARCHAR(8) NOT NULL, "
+                "route_key VARCHAR(255) NOT NULL, folder VARCHAR(255) NOT NULL, "
+                "count INTEGER NOT NULL DEFAULT 0, last_seen INTEGER, "
+                "PRIMARY KEY (account, kind, route_key, folder))"
+            )
             self.cursor.execute('SELECT version FROM version LIMIT 1')
             row = self.cursor.fetchone()
             db_version = row[0] if row else None
@@ -56,6 +107,28 @@ class DatabaseHelper:
                 )
                 self.cursor.execute('DELETE FROM version')
                 self.cursor.execute("INSERT INTO version (version) VALUES (%s)", (self.version,))
+            self._ensure_columns("nilsimsa", self.NILSIMSA_COLUMNS)
+            self._ensure_index("nilsimsa", "md5", "", "md5sum(32)")  # md5 lookups of sync and the decision cache
+            self._ensure_columns("considered", self.CONSIDERED_COLUMNS)
+            self._ensure_index("considered", "checkpoint", "UNIQUE", "account, uidvalidity, uid")
         except mysql.connector.Error as e:
             self.logger.error("Database bootstrap error: %s", e)
             sys.exit("Database connection failed.")
+
+    def _ensure_columns(self, table, columns):
+        self.cursor.execute(
+            "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", (table,)
+        )
+        have = {str(row[0]).lower() for row in self.cursor.fetchall()}
+        for name, ddl in columns:
+            if name not in have:
+                self.cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}")
+
+    def _ensure_index(self, table, name, kind, columns):
+        self.cursor.execute(
+            "SELECT 1 FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s LIMIT 1", (table, name)
+        )
+        if not self.cursor.fetchall():
+            self.cursor.execute(f"ALTER TABLE {table} ADD {kind} INDEX {name} ({columns})")
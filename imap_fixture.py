@@ -0,0 +1,670 @@
+#!/usr/bin/env python
+"""
+In-process IMAP stand-in for load tests and benchmarks.
+
+Speaks the plain-text subset of IMAP4rev1 the sorter uses: LOGIN, CAPABILITY,
+SELECT/EXAMINE, STATUS, LIST, CREATE, SEARCH and UID SEARCH (with ESEARCH
+RETURN options), UID FETCH (BODY.PEEK[HEADER], FLAGS, INTERNALDATE, MODSEQ),
+UID STORE, UID COPY and UID MOVE with COPYUID, EXPUNGE, CLOSE, NOOP and IDLE,
+plus CONDSTORE (HIGHESTMODSEQ, MODSEQ, CHANGEDSINCE) when enabled. Only
+message headers are kept, so a mailbox of 100k+ messages fits comfortably in
+memory. *latency* seconds are slept before every command's reply, outside
+the server lock, to make round-trip-bound code paths visible, and
+``commands`` counts the commands received ("UID FETCH" for UID commands).
+
+Point the sorter at it with ``[imap] server=127.0.0.1, port=<port>, ssl=0``.
+"""
+
+import argparse
+import bisect
+import collections
+import random
+import re
+import select
+import socketserver
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+WORDS = ("account", "alert", "build", "invoice", "meeting", "order", "report", "release", "security",
+         "shipping", "statement", "update", "weekly", "digest", "reminder", "payment", "review", "ticket",
+         "job", "offer", "newsletter", "event", "password", "login", "delivery", "photo", "thread",
+         "discussion", "backup", "failed", "success", "server", "cron", "notice", "survey", "welcome",
+         "receipt", "subscription", "renewal", "project", "status", "summary", "agenda", "patch", "issue")
+
+MAILERS = ("Postfix", "Exim 4.96", "Microsoft Outlook 16.0", "Mailchimp", "Amazon SES", "sendmail")
+
+
+def synthetic_headers(count: int, folders: List[str], seed: int = 0,
+                      start: float = 1700000000.0) -> Iterable[Tuple[str, float, str]]:
+    """Yield *count* (folder, when, raw_header) with a fixed per-folder sender profile.
+
+    Each folder gets its own domain, senders, mailer, optional List-Id and
+    subject vocabulary, so folders are separable by header similarity the
+    way real mail is. The same seed always yields the same corpus.
+    """
+    rng = random.Random(seed)
+    profiles = {}
+    for n, folder in enumerate(folders):
+        slug = re.sub(r"[^a-z0-9]+", "-", folder.lower()).strip("-") or "f%d" % n
+        profiles[folder] = {
+            "domain": "%s.example" % slug,
+            "senders": ["%s%d" % (rng.choice(("news", "info", "noreply", "alerts", "team")), i) for i in range(3)],
+            "mailer": rng.choice(MAILERS),
+            "list_id": "<%s.lists.%s.example>" % (slug, slug) if rng.random() < 0.5 else None,
+            "words": rng.sample(WORDS, 8),
+            "ip": "192.0.2.%d" % (n % 250 + 1),
+        }
+    when = start
+    for i in range(count):
+        folder = rng.choice(folders)
+        p = profiles[folder]
+        when += rng.randint(1, 600)
+        date = time.strftime("%a, %d %b %Y %H:%M:%S +0000", time.gmtime(when))
+        sender = rng.choice(p["senders"])
+        lines = [
+            "Return-Path: <%s@%s>" % (sender, p["domain"]),
+            "Received: from mail.%s (mail.%s [%s])\r\n\tby mx.local.example (Postfix) with ESMTPS id %08X;\r\n\t%s"
+            % (p["domain"], p["domain"], p["ip"], rng.getrandbits(32), date),
+            "DKIM-Signature: v=1; a=rsa-sha256; c=relaxed/relaxed; d=%s; s=sel1; h=from:to:subject:date; bh=%016x="
+            % (p["domain"], rng.getrandbits(64)),
+            "From: %s <%s@%s>" % (sender.title(), sender, p["domain"]),
+            "To: user@local.example",
+            "Subject: %s" % " ".join(rng.choice(p["words"]) for _ in range(rng.randint(2, 6))),
+            "Date: %s" % date,
+            "Message-ID: <%016x.%d@%s>" % (rng.getrandbits(64), i, p["domain"]),
+            "MIME-Version: 1.0",
+            "Content-Type: text/plain; charset=utf-8",
+            "X-Mailer: %s" % p["mailer"],
+        ]
+        if p["list_id"]:
+            lines.append("List-Id: %s" % p["list_id"])
+        yield folder, when, "\r\n".join(lines) + "\r\n\r\n"
+
+
+class _Message:
+    __slots__ = ("uid", "header", "flags", "when", "modseq")
+
+    def __init__(self, uid, header, flags, when, modseq):
+        self.uid = uid
+        self.header = header
+        self.flags = flags
+        self.when = when
+        self.modseq = modseq
+
+
+class _Folder:
+    def __init__(self, name: str, uidvalidity: int):
+        self.name = name
+        self.uidvalidity = uidvalidity
+        self.uidnext = 1
+        self.uids: List[int] = []           # ascending, index + 1 == sequence number
+        self.messages: Dict[int, _Message] = {}
+
+    def message_at(self, seq: int) -> _Message:
+        return self.messages[self.uids[seq - 1]]
+
+    def seq_of(self, uid: int) -> int:
+        return bisect.bisect_left(self.uids, uid) + 1
+
+
+class FixtureServer(socketserver.ThreadingTCPServer):
+    """Threaded IMAP stand-in holding its mailboxes in memory.
+
+    Use as a context manager (or start()/stop()); ``address`` is the bound
+    (host, port). deliver() adds a message from the test side and wakes
+    connections that are IDLE on its folder.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    DELIMITER = "."
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 condstore: bool = False, username: str = "fixture", password: str = "fixture"):
+        super().__init__((host, port), _Session)
+        self.latency = latency
+        self.condstore = condstore
+        self.username = username
+        self.password = password
+        self.lock = threading.RLock()
+        self.folders: Dict[str, _Folder] = {}
+        self.modseq = 1
+        self.commands = collections.Counter()   # command name -> times received
+        self._uidvalidity = int(time.time())
+        self._thread: Optional[threading.Thread] = None
+        self.create("INBOX")
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.server_address[:2]
+
+    def capabilities(self) -> str:
+        caps = "IMAP4rev1 IDLE MOVE UIDPLUS UNSELECT ENABLE ESEARCH"
+        return caps + " CONDSTORE" if self.condstore else caps
+
+    # ------------------------------ mailbox state ------------------------------
+    def folder(self, name: str) -> Optional[_Folder]:
+        if name.upper() == "INBOX":
+            name = "INBOX"
+        return self.folders.get(name)
+
+    def create(self, name: str) -> _Folder:
+        with self.lock:
+            folder = self.folder(name)
+            if folder is None:
+                self._uidvalidity += 1
+                folder = self.folders[name] = _Folder(name, self._uidvalidity)
+            return folder
+
+    def next_modseq(self) -> int:
+        self.modseq += 1
+        return self.modseq
+
+    def deliver(self, folder: str, raw_header, flags: Iterable[str] = (), when: Optional[float] = None) -> int:
+        """Append a message (header only) to *folder*, creating it if needed; return its UID."""
+        if isinstance(raw_header, str):
+            raw_header = raw_header.encode("utf-8", "surrogateescape")
+        with self.lock:
+            f = self.create(folder)
+            uid = f.uidnext
+            f.uidnext += 1
+            f.uids.append(uid)
+            f.messages[uid] = _Message(uid, raw_header, set(flags), when or time.time(), self.next_modseq())
+            return uid
+
+    def seed(self, mails: Iterable[Tuple[str, float, str]], flags: Iterable[str] = ("\\Seen",)) -> int:
+        """Deliver (folder, when, raw_header) tuples, e.g. from synthetic_headers() or replay.load_maildir()."""
+        n = 0
+        for folder, when, raw_header in mails:
+            self.deliver(folder, raw_header, flags, when)
+            n += 1
+        return n
+
+    # ------------------------------ lifecycle ------------------------------
+    def start(self) -> Tuple[str, int]:
+        self._thread = threading.Thread(target=self.serve_forever, name="imap-fixture", daemon=True)
+        self._thread.start()
+        return self.address
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+class _Bad(Exception):
+    """Command syntax or state error: tagged BAD/NO reply."""
+
+    def __init__(self, text: str, status: str = "BAD"):
+        super().__init__(text)
+        self.status = status
+
+
+_TOKEN = re.compile(rb'"((?:[^"\\]|\\.)*)"|(\()|(\))|([^\s()"\[]+(?:\[[^\]]*\][^\s()"]*)?)')
+
+
+def _parse(line: bytes):
+    """Split a command line into atoms, quoted strings and nested lists (no literals)."""
+    stack = [[]]
+    for m in _TOKEN.finditer(line):
+        quoted, opening, closing, atom = m.groups()
+        if opening:
+            stack.append([])
+        elif closing:
+            if len(stack) == 1:
+                raise _Bad("unbalanced parenthesis")
+            inner = stack.pop()
+            stack[-1].append(inner)
+        elif quoted is not None:
+            stack[-1].append(re.sub(rb'\\(.)', rb'\1', quoted).decode("utf-8", "replace"))
+        else:
+            stack[-1].append(atom.decode("utf-8", "replace"))
+    if len(stack) != 1:
+        raise _Bad("unbalanced parenthesis")
+    return stack[0]
+
+
+def _flatten(args) -> List[str]:
+    out = []
+    for a in args:
+        out.extend(_flatten(a) if isinstance(a, list) else [a])
+    return out
+
+
+def _quote(s: str) -> str:
+    return '"%s"' % s.replace("\\", "\\\\").replace('"', '\\"')
+
+
+class _Session(socketserver.BaseRequestHandler):
+    """One client connection: read a command, compute the reply under the server lock, send it."""
+
+    def setup(self):
+        self.buf = b""
+        self.user = None
+        self.selected: Optional[_Folder] = None
+        self.readonly = False
+        self.known_exists = 0
+        self.out: List[bytes] = []
+
+    # ------------------------------ I/O ------------------------------
+    def _readline(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        while b"\r\n" not in self.buf:
+            if timeout is not None and not select.select([self.request], [], [], timeout)[0]:
+                return None
+            chunk = self.request.recv(65536)
+            if not chunk:
+                raise EOFError
+            self.buf += chunk
+        line, self.buf = self.buf.split(b"\r\n", 1)
+        return line
+
+    def _untagged(self, text: str, literal: Optional[bytes] = None, tail: str = "") -> None:
+        self.out.append(b"* " + text.encode("utf-8"))
+        if literal is not None:
+            self.out.append(b" {%d}\r\n" % len(literal) + literal)
+        self.out.append(tail.encode("utf-8") + b"\r\n")
+
+    def _flush(self) -> None:
+        if self.out:
+            self.request.sendall(b"".join(self.out))
+            self.out = []
+
+    def handle(self):
+        self.request.sendall(b"* OK [CAPABILITY %s] imap_fixture ready\r\n" % self.server.capabilities().encode())
+        try:
+            while True:
+                line = self._readline()
+                if not line.strip():
+                    continue
+                tag, _, rest = line.partition(b" ")
+                tag = tag.decode("ascii", "replace")
+                command, _, rest = rest.partition(b" ")
+                command = command.decode("ascii", "replace").upper()
+                if command == "IDLE":
+                    self._idle(tag)
+                    continue
+                try:
+                    args = _parse(rest)
+                    with self.server.lock:
+                        self.server.commands[command + (" " + str(args[0]).upper() if command == "UID" and args
+                                                        and not isinstance(args[0], list) else "")] += 1
+                        status, text = self._dispatch(command, args)
+                        self._announce()
+                except _Bad as e:
+                    status, text = e.status, str(e)
+                except (ValueError, IndexError):
+                    status, text = "BAD", "invalid arguments"
+                if self.server.latency:
+                    time.sleep(self.server.latency)
+                self.out.append(("%s %s %s\r\n" % (tag, status, text)).encode("utf-8"))
+                self._flush()
+                if command == "LOGOUT":
+                    return
+        except (EOFError, ConnectionError, OSError):
+            return
+
+    def _announce(self) -> None:
+        # tell the client about mail delivered by others since its last command
+        if self.selected is not None and len(self.selected.uids) > self.known_exists:
+            self.known_exists = len(self.selected.uids)
+            self._untagged("%d EXISTS" % self.known_exists)
+
+    def _idle(self, tag: str) -> None:
+        if self.selected is None:
+            self.request.sendall(("%s BAD no mailbox selected\r\n" % tag).encode())
+            return
+        self.request.sendall(b"+ idling\r\n")
+        while True:
+            line = self._readline(timeout=0.05)
+            if line is not None:
+                if line.strip().upper() != b"DONE":
+                    self.request.sendall(("%s BAD expected DONE\r\n" % tag).encode())
+                    return
+                break
+            with self.server.lock:
+                self._announce()
+            self._flush()
+        self.request.sendall(("%s OK IDLE terminated\r\n" % tag).encode())
+
+    # ------------------------------ commands ------------------------------
+    def _dispatch(self, command: str, args) -> Tuple[str, str]:
+        if command == "CAPABILITY":
+            self._untagged("CAPABILITY " + self.server.capabilities())
+            return "OK", "CAPABILITY completed"
+        if command == "NOOP":
+            return "OK", "NOOP completed"
+        if command == "LOGOUT":
+            self._untagged("BYE logging out")
+            return "OK", "LOGOUT completed"
+        if command == "LOGIN":
+            if len(args) != 2 or args[0] != self.server.username or args[1] != self.server.password:
+                raise _Bad("[AUTHENTICATIONFAILED] invalid credentials", "NO")
+            self.user = args[0]
+            return "OK", "[CAPABILITY %s] Logged in" % self.server.capabilities()
+        if self.user is None:
+            raise _Bad("login first")
+        if command == "ENABLE":
+            return "OK", "ENABLE completed"
+        if command in ("SELECT", "EXAMINE"):
+            return self._select(args, readonly=command == "EXAMINE")
+        if command == "STATUS":
+            return self._status(args)
+        if command == "LIST":
+            return self._list(args)
+        if command == "CREATE":
+            self.server.create(args[0])
+            return "OK", "CREATE completed"
+        if self.selected is None:
+            raise _Bad("no mailbox selected")
+        if command in ("CLOSE", "UNSELECT"):
+            if command == "CLOSE" and not self.readonly:
+                self._expunge(silent=True)
+            self.selected = None
+            return "OK", "%s completed" % command
+        if command == "EXPUNGE":
+            self._expunge()
+            return "OK", "EXPUNGE completed"
+        if command == "SEARCH":
+            return self._search(args, by_uid=False)
+        if command == "FETCH":
+            return self._fetch(args, by_uid=False)
+        if command == "STORE":
+            return self._store(args, by_uid=False)
+        if command == "UID" and args:
+            sub, rest = str(args[0]).upper(), args[1:]
+            if sub == "SEARCH":
+                return self._search(rest, by_uid=True)
+            if sub == "FETCH":
+                return self._fetch(rest, by_uid=True)
+            if sub == "STORE":
+                return self._store(rest, by_uid=True)
+            if sub in ("COPY", "MOVE"):
+                return self._copy(rest, move=sub == "MOVE")
+        raise _Bad("unknown command %s" % command)
+
+    def _select(self, args, readonly: bool) -> Tuple[str, str]:
+        self.selected = None
+        folder = self.server.folder(args[0]) if args else None
+        if folder is None:
+            raise _Bad("[NONEXISTENT] no such mailbox", "NO")
+        self.selected, self.readonly = folder, readonly
+        self.known_exists = len(folder.uids)
+        self._untagged("FLAGS (\\Answered \\Flagged \\Deleted \\Seen \\Draft)")
+        self._untagged("%d EXISTS" % self.known_exists)
+        self._untagged("0 RECENT")
+        first_unseen = next((i + 1 for i, u in enumerate(folder.uids)
+                             if "\\Seen" not in folder.messages[u].flags), None)
+        if first_unseen:
+            self._untagged("OK [UNSEEN %d] first unseen" % first_unseen)
+        self._untagged("OK [UIDVALIDITY %d] UIDs valid" % folder.uidvalidity)
+        self._untagged("OK [UIDNEXT %d] predicted next UID" % folder.uidnext)
+        if self.server.condstore:
+            self._untagged("OK [HIGHESTMODSEQ %d] highest" % self.server.modseq)
+        return "OK", "[%s] %s completed" % ("READ-ONLY" if readonly else "READ-WRITE",
+                                             "EXAMINE" if readonly else "SELECT")
+
+    def _status(self, args) -> Tuple[str, str]:
+        folder = self.server.folder(args[0]) if args else None
+        if folder is None:
+            raise _Bad("[NONEXISTENT] no such mailbox", "NO")
+        items = []
+        for item in _flatten(args[1:]):
+            item = item.upper()
+            if item == "MESSAGES":
+                value = len(folder.uids)
+            elif item == "UIDNEXT":
+                value = folder.uidnext
+            elif item == "UIDVALIDITY":
+                value = folder.uidvalidity
+            elif item == "UNSEEN":
+                value = sum(1 for m in folder.messages.values() if "\\Seen" not in m.flags)
+            elif item == "RECENT":
+                value = 0
+            elif item == "HIGHESTMODSEQ" and self.server.condstore:
+                value = max((m.modseq for m in folder.messages.values()), default=0)
+            else:
+                raise _Bad("unknown STATUS item %s" % item)
+            items.append("%s %d" % (item, value))
+        self._untagged("STATUS %s (%s)" % (_quote(folder.name), " ".join(items)))
+        return "OK", "STATUS completed"
+
+    def _list(self, args) -> Tuple[str, str]:
+        pattern = "".join(str(a) for a in args[1:2]) or "*"
+        regex = re.compile("^" + re.escape(pattern).replace(r"\*", ".*").replace("%", "[^.]*") + "$", re.I)
+        for name in sorted(self.server.folders):
+            if regex.match(name):
+                self._untagged('LIST () "%s" %s' % (self.server.DELIMITER, _quote(name)))
+        return "OK", "LIST completed"
+
+    # ------------------------------ message sets ------------------------------
+    def _resolve(self, spec: str, by_uid: bool) -> List[_Message]:
+        """Messages of the selected folder matching a sequence or UID set, ascending."""
+        folder = self.selected
+        if not folder.uids:
+            return []
+        top = folder.uids[-1] if by_uid else len(folder.uids)
+        picked = set()
+        for part in str(spec).split(","):
+            lo, _, hi = part.partition(":")
+            try:
+                a = top if lo == "*" else int(lo)
+                b = a if not hi else (top if hi == "*" else int(hi))
+            except ValueError:
+                raise _Bad("invalid message set %s" % spec)
+            a, b = min(a, b), max(a, b)
+            if by_uid:
+                i, j = bisect.bisect_left(folder.uids, a), bisect.bisect_right(folder.uids, b)
+            else:
+                i, j = max(a, 1) - 1, min(b, top)
+            picked.update(range(i, j))
+        return [folder.messages[folder.uids[i]] for i in sorted(picked)]
+
+    def _search(self, args, by_uid: bool) -> Tuple[str, str]:
+        folder = self.selected
+        returns = None
+        if len(args) >= 2 and str(args[0]).upper() == "RETURN" and isinstance(args[1], list):
+            returns = [str(r).upper() for r in args[1]] or ["ALL"]
+            args = args[2:]
+        tokens = _flatten(args)
+        if len(tokens) >= 2 and tokens[0].upper() == "CHARSET":
+            tokens = tokens[2:]
+        candidates = [folder.messages[u] for u in folder.uids]
+        now = time.time()
+        i = 0
+        while i < len(tokens):
+            key = tokens[i].upper()
+            i += 1
+            if key == "ALL":
+                continue
+            if key in ("SEEN", "UNSEEN", "DELETED", "UNDELETED", "FLAGGED", "UNFLAGGED", "ANSWERED", "UNANSWERED"):
+                flag = "\\" + key[2:].title() if key.startswith("UN") else "\\" + key.title()
+                want = not key.startswith("UN")
+                candidates = [m for m in candidates if (flag in m.flags) == want]
+            elif key in ("OLDER", "YOUNGER"):
+                seconds = int(tokens[i]); i += 1
+                if key == "OLDER":
+                    candidates = [m for m in candidates if m.when <= now - seconds]
+                else:
+                    candidates = [m for m in candidates if m.when >= now - seconds]
+            elif key == "UID":
+                keep = {id(m) for m in self._resolve(tokens[i], by_uid=True)}; i += 1
+                candidates = [m for m in candidates if id(m) in keep]
+            elif key == "MODSEQ" and self.server.condstore:
+                since = int(tokens[i]); i += 1
+                candidates = [m for m in candidates if m.modseq >= since]
+            elif re.match(r"^[\d*:,]+$", key):
+                keep = {id(m) for m in self._resolve(key, by_uid=False)}
+                candidates = [m for m in candidates if id(m) in keep]
+            else:
+                raise _Bad("unsupported SEARCH key %s" % key)
+        found = [m.uid if by_uid else folder.seq_of(m.uid) for m in candidates]
+        if returns is None:
+            self._untagged(" ".join(["SEARCH"] + [str(n) for n in found]))
+            return "OK", "SEARCH completed"
+        parts = ["ESEARCH"] + (["UID"] if by_uid else [])
+        if found and "MIN" in returns:
+            parts += ["MIN", str(found[0])]
+        if found and "MAX" in returns:
+            parts += ["MAX", str(found[-1])]
+        if found and "ALL" in returns:
+            parts += ["ALL", ",".join(map(str, found))]
+        if "COUNT" in returns:
+            parts += ["COUNT", str(len(found))]
+        self._untagged(" ".join(parts))
+        return "OK", "SEARCH completed"
+
+    def _fetch(self, args, by_uid: bool) -> Tuple[str, str]:
+        if len(args) < 2:
+            raise _Bad("FETCH needs a set and items")
+        items = [i.upper() for i in _flatten([args[1]])]
+        changedsince = None
+        if len(args) > 2:
+            mods = _flatten(args[2:])
+            if len(mods) == 2 and mods[0].upper() == "CHANGEDSINCE" and self.server.condstore:
+                changedsince = int(mods[1])
+                items.append("MODSEQ")
+        if "ALL" in items or "FAST" in items:
+            items += ["FLAGS", "INTERNALDATE", "RFC822.SIZE"]
+        sets_seen = any(i in ("BODY[HEADER]", "BODY[]", "RFC822") for i in items)
+        folder = self.selected
+        for m in self._resolve(args[0], by_uid):
+            if changedsince is not None and m.modseq <= changedsince:
+                continue
+            if sets_seen and not self.readonly and "\\Seen" not in m.flags:
+                m.flags.add("\\Seen")
+                m.modseq = self.server.next_modseq()
+            parts, literal = [], None
+            if by_uid or "UID" in items:
+                parts.append("UID %d" % m.uid)
+            for item in items:
+                if item == "FLAGS":
+                    parts.append("FLAGS (%s)" % " ".join(sorted(m.flags)))
+                elif item == "INTERNALDATE":
+                    parts.append('INTERNALDATE "%s"' % time.strftime("%d-%b-%Y %H:%M:%S +0000", time.gmtime(m.when)))
+                elif item == "RFC822.SIZE":
+                    parts.append("RFC822.SIZE %d" % len(m.header))
+                elif item == "MODSEQ":
+                    parts.append("MODSEQ (%d)" % m.modseq)
+                elif item in ("BODY.PEEK[HEADER]", "BODY[HEADER]", "RFC822.HEADER", "BODY.PEEK[]", "BODY[]", "RFC822"):
+                    literal = (item.replace(".PEEK", ""), m.header)
+            text = "%d FETCH (%s" % (folder.seq_of(m.uid), " ".join(parts))
+            if literal:
+                self._untagged(text + (" " if parts else "") + literal[0], literal[1], tail=")")
+            else:
+                self._untagged(text + ")")
+        return "OK", "FETCH completed"
+
+    def _store(self, args, by_uid: bool) -> Tuple[str, str]:
+        if self.readonly:
+            raise _Bad("mailbox is read-only", "NO")
+        if len(args) < 3:
+            raise _Bad("STORE needs a set, an action and flags")
+        action = str(args[1]).upper()
+        silent = action.endswith(".SILENT")
+        action = action.replace(".SILENT", "")
+        flags = set(_flatten(args[2:]))
+        for m in self._resolve(args[0], by_uid):
+            if action == "+FLAGS":
+                m.flags |= flags
+            elif action == "-FLAGS":
+                m.flags -= flags
+            elif action == "FLAGS":
+                m.flags = set(flags)
+            else:
+                raise _Bad("unknown STORE action %s" % action)
+            m.modseq = self.server.next_modseq()
+            if not silent:
+                uid = " UID %d" % m.uid if by_uid else ""
+                self._untagged("%d FETCH (FLAGS (%s)%s)" % (self.selected.seq_of(m.uid), " ".join(sorted(m.flags)), uid))
+        return "OK", "STORE completed"
+
+    def _copy(self, args, move: bool) -> Tuple[str, str]:
+        if len(args) != 2:
+            raise _Bad("COPY/MOVE needs a set and a mailbox")
+        dest = self.server.folder(args[1])
+        if dest is None:
+            raise _Bad("[TRYCREATE] no such mailbox", "NO")
+        moved = self._resolve(args[0], by_uid=True)
+        if not moved:
+            return "OK", "No messages"
+        src_uids, dst_uids = [], []
+        for m in moved:
+            src_uids.append(str(m.uid))
+            flags = m.flags - {"\\Deleted"} if move else set(m.flags)
+            dst_uids.append(str(self.server.deliver(dest.name, m.header, flags, m.when)))
+        code = "COPYUID %d %s %s" % (dest.uidvalidity, ",".join(src_uids), ",".join(dst_uids))
+        if not move:
+            return "OK", "[%s] COPY completed" % code
+        self._untagged("OK [%s] Moved UIDs." % code)
+        self._remove(moved)
+        return "OK", "MOVE completed"
+
+    def _remove(self, messages: List[_Message], silent: bool = False) -> None:
+        folder = self.selected
+        for m in sorted(messages, key=lambda m: m.uid, reverse=True):
+            seq = folder.seq_of(m.uid)
+            del folder.uids[seq - 1]
+            del folder.messages[m.uid]
+            if not silent:
+                self._untagged("%d EXPUNGE" % seq)
+        self.known_exists = len(folder.uids)
+
+    def _expunge(self, silent: bool = False) -> None:
+        if self.readonly:
+            raise _Bad("mailbox is read-only", "NO")
+        folder = self.selected
+        self._remove([m for m in folder.messages.values() if "\\Deleted" in m.flags], silent)
+
+# ------------------------------ CLI ------------------------------
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve a seeded in-memory IMAP stand-in for load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1143)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds slept before every reply")
+    parser.add_argument("--condstore", action="store_true", help="Advertise and implement CONDSTORE")
+    parser.add_argument("--username", default="fixture")
+    parser.add_argument("--password", default="fixture")
+    parser.add_argument("--folders", default="Jobs,lists-general,news,shopping",
+                        help="Comma-separated folders for --synthetic")
+    parser.add_argument("--synthetic", type=int, default=0, metavar="N", help="Seed N synthetic messages")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for --synthetic")
+    parser.add_argument("--maildir", metavar="PATH", help="Seed from a Maildir tree (headers only)")
+    parser.add_argument("--todo", default="inbox.autosort", help="Folder receiving --unseen new messages")
+    parser.add_argument("--unseen", type=int, default=0, metavar="N",
+                        help="Also deliver N unseen synthetic messages to --todo")
+    args = parser.parse_args()
+
+    server = FixtureServer(args.host, args.port, args.latency, args.condstore, args.username, args.password)
+    folders = [f.strip() for f in args.folders.split(",") if f.strip()]
+    for name in folders + [args.todo]:
+        server.create(name)
+    start = time.perf_counter()
+    seeded = 0
+    if args.synthetic:
+        seeded += server.seed(synthetic_headers(args.synthetic, folders, args.seed))
+    if args.maildir:
+        from replay import load_maildir
+        seeded += server.seed(load_maildir(args.maildir))
+    if args.unseen:
+        mails = synthetic_headers(args.unseen, folders, args.seed + 1)
+        seeded += server.seed(((args.todo, when, raw) for _, when, raw in mails), flags=())
+    print("Seeded %d messages in %.1fs; serving on %s:%d" % ((seeded, time.perf_counter() - start) + server.address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,9 @@ folder quoting, and function signatures).
 """
 
 import argparse
+import atexit
 import configparser
+import copy
 import email
 import errno
 import fcntl
@@ -25,62 +27,392 @@ import random
 import re
 import sys
 import time
-import statistics
 import fnmatch
-from typing import Dict, List, Tuple
-from openai import OpenAI
+import queue
+import threading
+import collections
+import functools
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 from db import DatabaseHelper
-import pprint
-
-import mysql.connector
+from pipeline import Pipeline
+from metrics import METRICS
+from profiling import RunProfiler
+from corpus import FolderCorpus, digest_int
+from routes import RouteIndex, route_keys
 from nilsimsa import Nilsimsa, compare_hexdigests
 import select
 
+# Config sections describing additional mailboxes: [account:NAME]
+ACCOUNT_PREFIX = "account:"
+
+# Schema version assumed when [general] version is not set
+DEFAULT_VERSION = "1.2.0b"
+
+# Categories stored for corpus rows that were never sent to the LLM
+NEVER_CLASSIFIED = '[{"cta":"Notice LLM classisication never done"},{"label":["Unclassified:1.00"]}]'
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves %-formatting to the listener thread.
+
+    The stock prepare() renders the message on the calling thread; our log
+    arguments are plain strings and numbers, so the record can be queued as is.
+    """
+
+    def prepare(self, record):
+        return copy.copy(record)
+
 def setup_logger(name, *, enable_syslog=False, syslog_address="/dev/log",
-                 facility=1, app_name="imap_nilsimsa"):
+                 facility=1, app_name="imap_nilsimsa", level=logging.INFO):
+    """Logger whose file/syslog handlers run on a background QueueListener thread."""
     logger = logging.getLogger(name)
     log_filename = time.strftime("%Y%m%d", time.localtime()) + ".log"
     if not logger.handlers:
         fmt = RFC5424Formatter(app_name=app_name, facility=facility)
         fh = logging.FileHandler(log_filename)
         fh.setFormatter(fmt)
-        logger.addHandler(fh)
+        handlers = [fh]
         if enable_syslog:
             sh = logging.handlers.SysLogHandler(address=syslog_address)
             sh.setFormatter(fmt)
-            logger.addHandler(sh)
-    logger.setLevel(logging.INFO)
+            handlers.append(sh)
+        handler = _DeferredQueueHandler(queue.SimpleQueue())
+        logger.addHandler(handler)
+
+        def start_listener():
+            listener = logging.handlers.QueueListener(handler.queue, *handlers, respect_handler_level=True)
+            listener.start()
+            atexit.register(listener.stop)  # flush what is still queued
+
+        def restart_in_child():
+            # a fork keeps no threads: the child drains a queue of its own
+            handler.queue = queue.SimpleQueue()
+            start_listener()
+
+        start_listener()
+        os.register_at_fork(after_in_child=restart_in_child)
+    logger.setLevel(level)
     return logger
 
+class _CommandTimer:
+    """IMAP4 mixin that records per-command latency when metrics are enabled."""
+
+    def _simple_command(self, name, *args):
+        if not METRICS.enabled:
+            return super()._simple_command(name, *args)
+        command = name
+        if name == 'UID' and args:
+            command = 'UID ' + str(args[0]).upper()
+        with METRICS.timer("imap_command", command=command):
+            return super()._simple_command(name, *args)
+
+class _SelectTracker:
+    """IMAP4 mixin that remembers which mailbox is selected, so ensure_selected() can skip a re-SELECT.
+
+    It also keeps the selected mailbox's UIDVALIDITY and message count from
+    the SELECT response and from the EXISTS/EXPUNGE responses read since.
+    """
+
+    selected: Optional[Tuple[str, bool]] = None   # (mailbox, readonly) of the current SELECT/EXAMINE
+    uidvalidity: Optional[int] = None
+    exists = 0
+
+    def _append_untagged(self, typ, dat):
+        if typ == 'EXISTS' and dat:
+            self.exists = int(dat)
+        elif typ == 'EXPUNGE':
+            self.exists = max(0, self.exists - 1)
+        elif typ == 'UIDVALIDITY' and dat:
+            self.uidvalidity = int(dat)
+        super()._append_untagged(typ, dat)
+
+    def select(self, mailbox='INBOX', readonly=False):
+        self.selected = None
+        self.uidvalidity, self.exists = None, 0
+        typ, data = super().select(mailbox, readonly)
+        if typ == 'OK':
+            self.selected = (mailbox.strip('"'), bool(readonly))
+        return typ, data
+
+    def close(self):
+        self.selected = None
+        return super().close()
+
+    def unselect(self):
+        self.selected = None
+        return super().unselect()
+
+    def logout(self):
+        self.selected = None
+        return super().logout()
+
+class InstrumentedIMAP4_SSL(_CommandTimer, _SelectTracker, imaplib.IMAP4_SSL):
+    pass
+
+class InstrumentedIMAP4(_CommandTimer, _SelectTracker, imaplib.IMAP4):
+    """Plain-text connection, for local test servers such as imap_fixture.py."""
+
+def ensure_selected(imap, mailbox: str, readonly: bool = False) -> bool:
+    """SELECT *mailbox* unless it already is the selected one on *imap*; return True if a SELECT was sent.
+
+    The server reports expunges and new mail with the next command anyway,
+    so staying in a mailbox loses nothing; only switching costs a round trip
+    and a full mailbox reopen. Connections without select tracking always
+    re-SELECT.
+    """
+    if getattr(imap, 'selected', None) == (mailbox.strip('"'), readonly) and imap.state == 'SELECTED':
+        return False
+    imap.select(mailbox, readonly=readonly)
+    return True
+
 class IMAPHelper:
     def __init__(self, config):
         self.server = config.get('imap', 'server')
         self.username = config.get('imap', 'username')
         self.password = config.get('imap', 'password')
+        self.port = config.getint('imap', 'port', fallback=0)
+        self.ssl = config.getboolean('imap', 'ssl', fallback=True)
         self.imap = None
+        self.capabilities = frozenset()
+        self.pool_size = config.getint('imap', 'connections', fallback=1)
+        self._pool = None
+
+    def open_connection(self) -> imaplib.IMAP4_SSL:
+        cls = InstrumentedIMAP4_SSL if self.ssl else InstrumentedIMAP4
+        imap = cls(self.server, self.port or (imaplib.IMAP4_SSL_PORT if self.ssl else imaplib.IMAP4_PORT))
+        imap.login(self.username, self.password)
+        return imap
 
     def connect(self):
-        self.imap = imaplib.IMAP4_SSL(self.server)
-        self.imap.login(self.username, self.password)
+        self.imap = self.open_connection()
+        self.capabilities = self._load_capabilities(self.imap)
         return self.imap
 
+    def pool(self) -> Optional["IMAPConnectionPool"]:
+        """Shared worker connections, or None when `connections` <= 1 (serial use of self.imap)."""
+        if self.pool_size <= 1:
+            return None
+        if self._pool is None:
+            self._pool = IMAPConnectionPool(self, self.pool_size)
+        return self._pool
+
+    @staticmethod
+    def _load_capabilities(imap) -> frozenset:
+        """One CAPABILITY round trip after login (servers may advertise more than pre-auth)."""
+        try:
+            typ, data = imap.capability()
+            if typ == 'OK' and data:
+                return frozenset(b' '.join(data).decode('ascii', 'ignore').upper().split())
+        except Exception:
+            pass
+        return frozenset(str(c).upper() for c in getattr(imap, 'capabilities', ()))
+
+    def has_capability(self, name: str) -> bool:
+        return name.upper() in self.capabilities
+
     def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
         if self.imap:
             try: self.imap.close()
             except Exception: pass
             try: self.imap.logout()
             except Exception: pass
 
+class IMAPConnectionPool:
+    """Bounded pool of authenticated IMAP connections for worker threads.
+
+    At most *size* connections exist at once; callers block in connection()
+    until one is free. A connection that sat unused for longer than
+    *check_after* seconds is health-checked with NOOP before it is handed out,
+    and one that failed (or fails the check) is dropped and replaced by a
+    fresh login. Each connection is used by a single thread at a time.
+    """
+
+    def __init__(self, helper: IMAPHelper, size: int, check_after: float = 60.0):
+        self.helper = helper
+        self.size = size
+        self.check_after = check_after
+        self._slots = threading.BoundedSemaphore(size)
+        self._free = queue.LifoQueue()   # (imap, last_used); reuse the warmest first
+
+    def _healthy(self, imap, last_used: float) -> bool:
+        if time.monotonic() - last_used < self.check_after:
+            return True
+        try:
+            return imap.noop()[0] == 'OK'
+        except Exception:
+            return False
+
+    @staticmethod
+    def _discard(imap) -> None:
+        try: imap.logout()
+        except Exception: pass
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        try:
+            imap = None
+            while imap is None:
+                try:
+                    imap, last_used = self._free.get_nowait()
+                except queue.Empty:
+                    imap = self.helper.open_connection()
+                    break
+                if not self._healthy(imap, last_used):
+                    self._discard(imap)
+                    imap = None
+            broken = False
+            try:
+                yield imap
+            except (imaplib.IMAP4.abort, OSError):
+                broken = True
+                raise
+            finally:
+                if broken:
+                    self._discard(imap)   # reconnect on next checkout
+                else:
+                    self._free.put((imap, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        while True:
+            try:
+                imap, _ = self._free.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(imap)
+
+class IdleSession:
+    """IMAP IDLE (RFC 2177) on one mailbox, announcing the UIDs of new mail.
+
+    Untagged EXISTS/EXPUNGE/FETCH pushes are parsed as they arrive; the first
+    EXISTS that grows the mailbox ends IDLE at once, so new mail is sorted
+    without waiting for the cycle to time out. IDLE is re-issued before the
+    server's 29 minute inactivity cutoff. A UID watermark makes sure every new
+    message is announced exactly once, including mail that arrived while we
+    were busy sorting.
+    """
+
+    RENEW_AFTER = 28 * 60   # stay clear of the 29 minute limit
+    DONE_TIMEOUT = 30       # seconds to wait for the tagged reply after DONE
+    _UNTAGGED = re.compile(rb'^\* (\d+) (EXISTS|EXPUNGE|FETCH)\b', re.I)
+
+    def __init__(self, imap, folder: str, logger=None):
+        self.imap = imap
+        self.folder = folder
+        self.logger = logger
+        self.exists = 0
+        self.last_uid: Optional[int] = None   # highest UID already announced
+
+    def wait(self, timeout: int = RENEW_AFTER) -> List[str]:
+        """Block until new mail arrives in *folder*; return its UIDs (ascending)."""
+        cycle = max(1, min(int(timeout or self.RENEW_AFTER), self.RENEW_AFTER))
+        self._select()
+        while True:
+            uids = self._new_uids()
+            if uids:
+                return uids
+            self._idle(cycle)
+
+    def _select(self) -> None:
+        ensure_selected(self.imap, self.folder)
+        self.exists = getattr(self.imap, 'exists', 0)
+
+    def _new_uids(self) -> List[str]:
+        if self.last_uid is None:
+            query = '(UNSEEN)'
+        else:
+            query = '(UID %d:* UNSEEN)' % (self.last_uid + 1)
+        typ, data = self.imap.uid('search', None, query)
+        found = sorted(int(x) for x in (data[0].split() if data and data[0] else []))
+        # "n:*" always matches the highest UID, even when it is below n
+        if self.last_uid is not None:
+            found = [u for u in found if u > self.last_uid]
+        if found:
+            self.last_uid = found[-1]
+        elif self.last_uid is None:
+            uidnext = self.imap.response('UIDNEXT')[1]
+            self.last_uid = int(uidnext[0]) - 1 if uidnext and uidnext[0] else 0
+        return [str(u) for u in found]
+
+    def _recv(self, timeout: float) -> Optional[bytes]:
+        sock = self.imap.sock
+        pending = getattr(sock, 'pending', None)   # bytes already decrypted by SSL
+        if not (pending and pending()):
+            r, _, _ = select.select([sock], [], [], max(0.0, timeout))
+            if not r:
+                return None
+        return sock.recv(4096)
+
+    def _idle(self, timeout: float) -> bool:
+        """Run one IDLE command; return True if the mailbox grew."""
+        imap = self.imap
+        tag = imap._new_tag()
+        imap.send(tag + b' IDLE\r\n')
+        deadline = time.monotonic() + timeout
+        buf = b''
+        grew = done_sent = False
+        try:
+            while True:
+                while b'\r\n' in buf:
+                    line, buf = buf.split(b'\r\n', 1)
+                    if line.startswith(tag + b' '):
+                        if not line[len(tag) + 1:].upper().startswith(b'OK'):
+                            raise imaplib.IMAP4.error("IDLE rejected: %r" % line)
+                        return grew
+                    m = self._UNTAGGED.match(line)
+                    if not m:
+                        continue
+                    n, kind = int(m.group(1)), m.group(2).upper()
+                    if kind == b'EXISTS':
+                        grew = grew or n > self.exists
+                        self.exists = n
+                    elif kind == b'EXPUNGE':
+                        self.exists = max(0, self.exists - 1)
+                    elif self.logger:
+                        self.logger.debug("IDLE push: %s", line.decode('ascii', 'replace'))
+                if grew and not done_sent:
+                    imap.send(b'DONE\r\n')
+                    done_sent = True
+                    deadline = time.monotonic() + self.DONE_TIMEOUT
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    if done_sent:
+                        raise imaplib.IMAP4.abort("no reply to IDLE DONE")
+                    imap.send(b'DONE\r\n')
+                    done_sent = True
+                    deadline = time.monotonic() + self.DONE_TIMEOUT
+                    continue
+                chunk = self._recv(remaining)
+                if chunk is None:
+                    continue
+                if not chunk:
+                    raise imaplib.IMAP4.abort("connection closed during IDLE")
+                buf += chunk
+        finally:
+            imap.tagged_commands.pop(tag, None)
+            if hasattr(imap, 'exists'):
+                imap.exists = self.exists  # read past imaplib: keep the select tracker in step
+
+
 class HeaderNormalizer:
     @staticmethod
     def normalize(mail_txt, exclude_headers, headers_skip_re, chomp_header, headerIsX, xinclude, dkim_just_d, 
-                    exclude_received_from_localhost, weight_headers_re, weight_headers_by):
+                    exclude_received_from_localhost):
         """Normalize headers to a stable, content-centric text.
 
         We remove non-signal noise that varies across MTAs: weekdays/dates/ids,
         amavis/mailscanner artifacts, local Received lines, and collapse folded
         whitespace. DKIM is reduced to its domain (d=...), and we suppress most
-        X- headers except if explicitly listed in xinclude.
+        X- headers except if explicitly listed in xinclude. Every header is
+        one line and appears once: header weights are applied when hashing
+        (header_segments), not by repeating text.
         """
         mail_txt = re.sub(r'(?:Sun|Mon|Tue|Wed|Thu|Fri|Sat).*?([;\n])', r'\1', mail_txt)
         result = ''
@@ -114,32 +446,117 @@ class HeaderNormalizer:
                     add = header + ': ' + dkim_just_d.sub(r'\1', this_header_content)
                 else:
                     add = header + ': ' + this_header_content
-                # Header weighting: exact same effect as original (string repetition)
-                if weight_headers_re.search(header):
-                    add += add * weight_headers_by
                 result += add
         return result
 
+def header_segments(trimmed_header: str, weight_headers_re, weight_headers_by: int) -> Iterator[Tuple[str, int]]:
+    """(text, repetitions) runs of a trimmed header, in order.
+
+    Lines of headers matching weight_headers_re count 1 + weight_headers_by
+    times, as if the normalizer had repeated them; runs of other lines come
+    through whole with 1.
+    """
+    times = 1 + max(0, weight_headers_by)
+    plain = []
+    lines = trimmed_header.split("\n")
+    for i, line in enumerate(lines):
+        if i < len(lines) - 1:
+            line += "\n"
+        elif not line:
+            break
+        if times > 1 and weight_headers_re.search(line.partition(":")[0]):
+            if plain:
+                yield "".join(plain), 1
+                plain = []
+            yield line, times
+        else:
+            plain.append(line)
+    if plain:
+        yield "".join(plain), 1
+
+def header_md5(trimmed_header: str, weight_headers_re, weight_headers_by: int) -> str:
+    """md5sum of the header with weighted lines repeated, matching rows stored by repeating them."""
+    md5 = hashlib.md5()
+    for text, times in header_segments(trimmed_header, weight_headers_re, weight_headers_by):
+        data = text.encode('utf-8')
+        for _ in range(times):
+            md5.update(data)
+    return md5.hexdigest()
+
+@functools.lru_cache(maxsize=256)
+def header_state(trimmed_header: str, weight_headers_re, weight_headers_by: int) -> Nilsimsa:
+    """Nilsimsa accumulator state of a trimmed header (shared: merge() it, never update() it).
+
+    Digests are taken over a categories line followed by the header, so a
+    header seen again with other categories only costs hashing the short
+    categories line and an O(256) merge. Weighted lines go through a
+    weighted update, whose cost does not grow with the weight.
+    """
+    state = Nilsimsa()
+    for text, times in header_segments(trimmed_header, weight_headers_re, weight_headers_by):
+        state.update(text, weight=times)
+    return state
+
+def row_digest(cats: str, trimmed_header: str, weight_headers_re, weight_headers_by: int) -> str:
+    """Nilsimsa hexdigest of a corpus/source row (categories line + weighted trimmed header)."""
+    prefix = Nilsimsa()
+    prefix.update(f"X-LLM-Categories: {cats}\n")
+    return prefix.merge(header_state(trimmed_header, weight_headers_re, weight_headers_by)).hexdigest()
+
+def hash_headers(raw_headers: List[str], normalize_args: tuple, weight_headers_re,
+                 weight_headers_by: int) -> List[Tuple[str, str, Optional[str]]]:
+    """Cold-build worker: (trimmed_header, md5sum, hexdigest) for each raw header, in order.
+
+    Runs in a ProcessPoolExecutor; the digest is the one sync_and_distance
+    stores for a new row (NEVER_CLASSIFIED categories), None if hashing failed.
+    """
+    out = []
+    for raw_header in raw_headers:
+        trimmed_header = HeaderNormalizer.normalize(raw_header, *normalize_args)
+        md5sum = header_md5(trimmed_header, weight_headers_re, weight_headers_by)
+        try:
+            hexdigest = row_digest(NEVER_CLASSIFIED, trimmed_header, weight_headers_re, weight_headers_by)
+        except Exception:
+            hexdigest = None
+        out.append((trimmed_header, md5sum, hexdigest))
+    return out
+
 class IMAPAutoSorter:
     """Sort emails into folders by Nilsimsa similarity of headers.
 
     Concurrency: we acquire an exclusive flock *in the constructor* so only one
     instance runs at a time. If the lock is already held, this process exits.
+
+    With *account* the sorter serves one ``[account:NAME]`` section: its keys
+    override ``[imap]``, the flock is per account and DB rows are tagged with
+    the account name. *db* and *hash_pool* let several sorters in one process
+    share a DatabaseHelper and the cold-build process pool. With *offline*
+    only the scoring state is built (no flock, DB, IMAP or LLM client), for
+    tools such as replay.py that score local mail.
     """
 
     # ------------------------------ init ------------------------------
-    def __init__(self, config_path: str):
+    def __init__(self, config_path: str, account: Optional[str] = None,
+                 db: Optional[DatabaseHelper] = None, hash_pool: Optional["concurrent.futures.ProcessPoolExecutor"] = None,
+                 offline: bool = False):
         # Acquire the flock immediately (before any other side effects)
+        self.account = account or ""
+        self.offline = offline
         self.lockfile_path = "/tmp/imap_autosync_lock_in_class"
+        if self.account:
+            self.lockfile_path += "." + re.sub(r"[^\w.-]", "_", self.account)
         self.lock_fd = None
-        self._ensure_single_instance()
+        if not offline:
+            self._ensure_single_instance()
 
         # Load config
         self.config = configparser.ConfigParser()
         self.config.read(config_path)
+        if self.account:
+            self._apply_account_section()
 
         # General
-        self.version = self.config.get("general", "version", fallback="1.2.0b")
+        self.version = self.config.get("general", "version", fallback=DEFAULT_VERSION)
         self.maintenance = self.config.getboolean("general", "maintenance", fallback=False)
         self.reconsider_after = self.config.getint("general", "reconsider_after", fallback=3600)
 
@@ -148,18 +565,11 @@ class IMAPAutoSorter:
         self.new_folder = self.config.get("imap", "new")
         self.imap_folders = self._get_list("imap", "folders")
         
-        # openai api key
+        # openai api key; the SDK is imported and the client built on the first LLM call
         api_key = self.config.get("openai", "api_key", fallback=None)
+        self._api_key = api_key.strip() if api_key and not offline else None
         self.client = None
-        if api_key:
-            api_key = api_key.strip()
-            if api_key:
-                try:
-                    self.client = OpenAI(api_key=api_key)
-                except Exception as e:
-                    self.client = None
-                    if hasattr(self, "logger") and self.logger:
-                        self.logger.error("OpenAI client init failed: %s", e)
+        self._client_lock = threading.Lock()
 
         # Nilsimsa thresholds & knobs
         self.threshold = self.config.getint("nilsimsa", "threshold", fallback=50)
@@ -170,16 +580,47 @@ class IMAPAutoSorter:
         self.headers_skip = self._get_list("nilsimsa", "headers_skip")
         self.weight_headers_by = self.config.getint("nilsimsa", "weight_headers_by", fallback=1)
         self.xinclude = self._get_list("nilsimsa", "xinclude")
+        # Cold build: hash folders with many unknown messages on a process pool (0 = one per CPU)
+        self.cold_build_workers = self.config.getint("nilsimsa", "cold_build_workers", fallback=0) or (os.cpu_count() or 1)
+        self.cold_build_min = self.config.getint("nilsimsa", "cold_build_min", fallback=500)
+        # per-folder prototype digests bounding the best possible distance (0 = scan every folder)
+        self.prefilter_prototypes = self.config.getint("nilsimsa", "prefilter_prototypes", fallback=32)
+        self.prefilter_radius = self.config.getint("nilsimsa", "prefilter_radius", fallback=40)
+        # stored digests within this many bits share one weighted representative (0 = exact copies only)
+        self.collapse_bits = self.config.getint("nilsimsa", "collapse_bits", fallback=0)
+        # score larger folders from a recency-weighted sample of this many messages (0 = all)
+        self.sample_size = self.config.getint("nilsimsa", "sample_size", fallback=0)
+        self.sample_half_life = self.config.getint("nilsimsa", "sample_half_life", fallback=5000)
+        self.cold_build_chunk = self.config.getint("nilsimsa", "cold_build_chunk", fallback=200)
+        # route exact header repeats to the folder their earlier copies agree on (0 = always score)
+        self.decision_cache = self.config.getboolean("nilsimsa", "decision_cache", fallback=True)
+        self.decision_cache_min = self.config.getint("nilsimsa", "decision_cache_min", fallback=2)
+        self._decision_stats = collections.Counter()
+        self._decision_lock = threading.Lock()
+        # route by sender/List-Id history once it confidently points at one folder (0 = always scan)
+        self.route_index = self.config.getboolean("nilsimsa", "route_index", fallback=True)
+        self.route_confidence = self.config.getfloat("nilsimsa", "route_confidence", fallback=0.95)
+        self.route_min = self.config.getint("nilsimsa", "route_min", fallback=5)
         self.sender_skip_llm = self._get_list("openai", "sender_skip_llm")
 
+        # Autosort pipeline: worker threads per stage and queue depth between stages
+        self.pipeline_workers = {name: self.config.getint("pipeline", name, fallback=1)
+                                 for name in self.PIPELINE_STAGES}
+        self.pipeline_queue_size = self.config.getint("pipeline", "queue_size", fallback=4)
+
+        # Metrics (process-wide; a no-op unless [metrics] enabled=1)
+        if not offline:
+            METRICS.configure(self.config)
+
         # MySQL
-        self.mysql_pass = self.config.get("mysql", "password")
+        self.mysql_pass = None if offline else self.config.get("mysql", "password")
 
         # Archive
         self.archive_folder = self.config.get("archive", "folder", fallback=None)
         self.archive_after = self.config.getint("archive", "after", fallback=0)
         self.just_delete = self._get_list("archive", "justdelete") if self.config.has_option("archive", "justdelete") else None
         self.trash_folder = self.config.get("archive", "trash", fallback=None)
+        self.archive_interval = self.config.getint("archive", "interval", fallback=3600)
 
         # Regexes (kept same semantics; precompiled for clarity/speed)
         self.exclude_headers = re.compile(r"^(Date|Message-ID|X-.*Mailscanner.*|X-Amavis-.*|X-Spam-.*|X-Virus-.*|ARC-.*)$", re.I)
@@ -194,13 +635,24 @@ class IMAPAutoSorter:
         self.headerIsX = re.compile(r"^x-", re.I)
 
         # Base logger + per-class child (messages propagate to base handlers)
-        base_logger = setup_logger("imap_nilsimsa")
-        self.logger = base_logger.getChild(self.__class__.__name__)
+        base_logger = setup_logger("imap_nilsimsa", level=self.config.get("general", "loglevel", fallback="INFO").upper())
+        account_logger = base_logger.getChild(self.account) if self.account else base_logger
+        self.logger = account_logger.getChild(self.__class__.__name__)
 
         # DB logs under its own class name (not IMAPAutoSorter)
-        self.db = DatabaseHelper(self.mysql_pass, self.version, base_logger.getChild("DatabaseHelper"))
-        self.imap_helper = IMAPHelper(self.config)
-
+        if offline:
+            self.db = self.imap_helper = None
+        else:
+            self.db = db or DatabaseHelper(self.mysql_pass, self.version, base_logger.getChild("DatabaseHelper"))
+            self.imap_helper = IMAPHelper(self.config)
+        self.hash_pool = hash_pool
+        self._own_hash_pool: Optional["concurrent.futures.ProcessPoolExecutor"] = None
+        self._hash_pool_lock = threading.Lock()
+        self._corpus: Dict[str, FolderCorpus] = {}
+        self._corpus_lock = threading.Lock()
+        self._routes: Optional[RouteIndex] = None
+        self._idle_session: Optional[IdleSession] = None
+        self.profiler = None  # profiling.RunProfiler when main() runs with --profile
 
     # ------------------------------ small helpers ------------------------------
     
@@ -236,6 +688,22 @@ class IMAPAutoSorter:
         dst = self._parse_uid_set(m.group(4))
         return uidvalidity, src, dst
 
+    def _apply_account_section(self) -> None:
+        apply_account_section(self.config, self.account)
+
+    def _llm_client(self):
+        """OpenAI client, created on first use; None without a usable api_key."""
+        with self._client_lock:
+            if self.client is None and self._api_key:
+                try:
+                    from openai import OpenAI
+                    self.client = OpenAI(api_key=self._api_key)
+                except Exception as e:
+                    self._api_key = None  # do not retry for every message
+                    if hasattr(self, "logger") and self.logger:
+                        self.logger.error("OpenAI client init failed: %s", e)
+            return self.client
+
     def _get_list(self, section: str, key: str) -> List[str]:
         """Parse comma-separated config option into a trimmed list ("a, b" -> ["a","b"])."""
         if not self.config.has_option(section, key):
@@ -270,6 +738,7 @@ class IMAPAutoSorter:
         # Fast-path: skip OpenAI call if sender matches configured globs
         if any(fnmatch.fnmatch((from_addr or "").lower(), pat.lower()) for pat in self.sender_skip_llm):
             if self.logger: self.logger.info("LLM skipped for sender %s (sender_skip_llm matched)", from_addr)
+            METRICS.inc("llm_requests", result="skipped")
             return '[{"cta":"Sender skipped"},{"label":["SenderSkipped:1.00"]}]'
 
         prompt = f"""
@@ -291,22 +760,25 @@ Guidance:
 - Some emails are internal notifications from my own systems (e.g. Macrodroid, fail2ban).
 """
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-5-mini",
-                messages=[
-                    {"role": "system", "content": (
-                            "You are an email intent detector."
-                        )
-                    },
-                    {"role": "user", "content": prompt}
-                ],
-                timeout=60
-            )
+            with METRICS.timer("llm_request"):
+                response = self._llm_client().chat.completions.create(
+                    model="gpt-5-mini",
+                    messages=[
+                        {"role": "system", "content": (
+                                "You are an email intent detector."
+                            )
+                        },
+                        {"role": "user", "content": prompt}
+                    ],
+                    timeout=60
+                )
             result = (response.choices[0].message.content or "").strip()
+            METRICS.inc("llm_requests", result="ok")
             if self.logger:
                 self.logger.info("ChatGPT API response: %s", result)
             return result
         except Exception as e:
+            METRICS.inc("llm_requests", result="error")
             if self.logger:
                 self.logger.error("GPT classification error: %s", e)
             return '[{"cta":"Notice LLM classisication error"},{"label":["Unclassified:1.00"]}]'
@@ -323,15 +795,165 @@ Guidance:
         sys.stdout.flush()
 
     # ------------------------------ header normalization ------------------------------
+    def _normalize_args(self) -> tuple:
+        return (self.exclude_headers, self.headers_skip_re, self.chomp_header, self.headerIsX,
+                self.xinclude, self.dkim_just_d, self.exclude_received_from_localhost)
+
     def return_header(self, mail_txt: str) -> str:
-        return HeaderNormalizer.normalize(mail_txt, self.exclude_headers, self.headers_skip_re, self.chomp_header, self.headerIsX,
-                                            self.xinclude, self.dkim_just_d, self.exclude_received_from_localhost, self.weight_headers_re, 
-                                            self.weight_headers_by)
+        with METRICS.timer("normalize"):
+            return HeaderNormalizer.normalize(mail_txt, *self._normalize_args())
+
+    def _digest(self, cats: str, trimmed_header: str) -> str:
+        """Nilsimsa hexdigest of a corpus/source row (categories line + trimmed header)."""
+        with METRICS.timer("hash"):
+            return row_digest(cats, trimmed_header, self.weight_headers_re, self.weight_headers_by)
+
+    def _md5(self, trimmed_header: str) -> str:
+        return header_md5(trimmed_header, self.weight_headers_re, self.weight_headers_by)
+
+    # ------------------------------ cold build ------------------------------
+    def _fetch_headers(self, imap: imaplib.IMAP4_SSL, uids: List[str]) -> List[str]:
+        """Raw headers for *uids* with one UID FETCH, in the order given ('' if missing)."""
+        res_fetch, data_fetch = imap.uid('fetch', ','.join(uids), '(BODY.PEEK[HEADER])')
+        by_uid = {}
+        for item in data_fetch or []:
+            if isinstance(item, tuple) and len(item) > 1:
+                m = re.search(rb'UID (\d+)', item[0])
+                if m:
+                    by_uid[m.group(1).decode()] = item[1].decode('utf-8', 'backslashreplace')
+        return [by_uid.get(uid, '') for uid in uids]
+
+    def _cold_hash_stream(self, imap: imaplib.IMAP4_SSL, uids: List[str]):
+        """Yield (uid, raw_header, trimmed_header, md5sum, hexdigest) for *uids*, in order.
+
+        Headers are fetched in chunks on *imap* while earlier chunks are being
+        normalized and hashed by a process pool; at most two chunks per worker
+        are in flight, so memory stays bounded on very large folders.
+        """
+        args = self._normalize_args()
+        size = self.cold_build_chunk
+        pending = collections.deque()
+
+        def drain():
+            chunk, headers, future = pending.popleft()
+            for uid, raw_header, hashed in zip(chunk, headers, future.result()):
+                yield (uid, raw_header) + hashed
+
+        workers = self._cold_pool()
+        for i in range(0, len(uids), size):
+            chunk = uids[i:i + size]
+            headers = self._fetch_headers(imap, chunk)
+            pending.append((chunk, headers, workers.submit(hash_headers, headers, args, self.weight_headers_re,
+                                                           self.weight_headers_by)))
+            while len(pending) > 2 * self.cold_build_workers:
+                yield from drain()
+        while pending:
+            yield from drain()
+
+    def _cold_pool(self) -> "concurrent.futures.ProcessPoolExecutor":
+        """The shared hash_pool, else a pool of this sorter's, started by the first cold build of a run."""
+        if self.hash_pool is not None:
+            return self.hash_pool
+        with self._hash_pool_lock:
+            if self._own_hash_pool is None:
+                self._own_hash_pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.cold_build_workers)
+            return self._own_hash_pool
+
+    def close_hash_pool(self) -> None:
+        """Stop the pool _cold_pool() started (a shared hash_pool belongs to its owner)."""
+        with self._hash_pool_lock:
+            pool, self._own_hash_pool = self._own_hash_pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    # ------------------------------ resident corpus ------------------------------
+    def folder_corpus(self, folder: str) -> FolderCorpus:
+        """Digests of *folder*, read from the DB once and then kept in step with every row we write."""
+        with self._corpus_lock:
+            corpus = self._corpus.get(folder)
+            if corpus is None:
+                rows = self.db.fetchall("SELECT uid, hexdigest FROM nilsimsa WHERE folder = %s AND account = %s",
+                                        (folder, self.account))
+                corpus = self._corpus[folder] = FolderCorpus(folder, rows, self.prefilter_prototypes,
+                                                             self.prefilter_radius, self.collapse_bits,
+                                                             self.sample_size, self.sample_half_life)
+            return corpus
+
+    def _corpus_add(self, folder: str, uid, hexdigest: str) -> None:
+        # folders not loaded yet pick the row up from the DB when they are
+        corpus = self._corpus.get(folder)
+        if corpus is not None:
+            corpus.add(uid, hexdigest)
+
+    def _corpus_discard(self, folder: str, uid) -> None:
+        corpus = self._corpus.get(folder)
+        if corpus is not None and uid is not None:
+            corpus.discard(uid)
+
+    # ------------------------------ routing index ------------------------------
+    def routes(self) -> RouteIndex:
+        """Sender/List-Id routing history, read from the DB once and then kept in step with every move."""
+        with self._corpus_lock:
+            if self._routes is None:
+                rows = self.db.fetchall("SELECT kind, route_key, folder, count, last_seen FROM routes "
+                                        "WHERE account = %s", (self.account,))
+                self._routes = RouteIndex(rows, self.route_confidence, self.route_min)
+            return self._routes
+
+    def _route_learn(self, header, folder: str, prev_folder: Optional[str] = None) -> None:
+        """Record a message of *header*'s sender and list as routed to *folder* (from *prev_folder* by hand)."""
+        if not self.route_index or folder not in self.imap_folders:
+            return
+        keys = route_keys(header)
+        if not keys:
+            return
+        now = int(time.time())
+        index = self.routes()
+        index.learn(keys, folder, now)
+        if prev_folder in self.imap_folders and prev_folder != folder:
+            index.unlearn(keys, prev_folder)
+        try:
+            for kind, key in keys:
+                self.db.execute(
+                    "INSERT INTO routes (account, kind, route_key, folder, count, last_seen) "
+                    "VALUES (%s, %s, %s, %s, 1, %s) ON DUPLICATE KEY UPDATE count = count + 1, "
+                    "last_seen = GREATEST(COALESCE(last_seen, 0), VALUES(last_seen))",
+                    (self.account, kind, key, folder, now),
+                )
+                if prev_folder in self.imap_folders and prev_folder != folder:
+                    self.db.execute(
+                        "UPDATE routes SET count = GREATEST(count - 1, 0) "
+                        "WHERE account = %s AND kind = %s AND route_key = %s AND folder = %s",
+                        (self.account, kind, key, prev_folder),
+                    )
+        except Exception as e:
+            self.logger.error("Routing index update for %s failed: %s", folder, e)
+
+    def _route_decision(self, job) -> Optional[str]:
+        """Folder the routing index sends *job* to without a corpus scan, or None to score it.
+
+        Messages flagged as spam/phishing always take the ladder: a forged
+        From must not inherit its sender's folder.
+        """
+        if not self.route_index or job.get("spam"):
+            return None
+        decided = self.routes().decide(route_keys(job["msg"]))
+        METRICS.inc("route_index", result="miss" if decided is None else "hit")
+        if decided is None or decided[0] not in self.imap_folders:
+            return None
+        folder, (kind, key), count, total = decided
+        self.logger.info("ROUTE uid=%s winner=%s via %s %s (%d of %d)", job["uid"], folder, kind, key, count, total)
+        return folder
 
     # ------------------------------ core: sync & distance ------------------------------
     def sync_and_distance(self, imap: imaplib.IMAP4_SSL, folder: str, source_hexdigest: str,
-                          dry_run: bool = False, debug: bool = False, quiet: bool = False) -> List[int]:
-        """Sync DB with IMAP for *folder* and compute distances to source_hexdigest.
+                          dry_run: bool = False, debug: bool = False, quiet: bool = False) -> collections.Counter:
+        """Sync DB with IMAP for *folder* and count its distances to source_hexdigest.
+
+        Returns a Counter distance -> messages: stored digests are compared
+        once per (near-)duplicate representative, new ones one by one. With
+        [nilsimsa] sample_size a large folder contributes its sample, scaled
+        up to the folder's size (the counts are then fractional).
 
         Preserves behavior:
           • Only (SEEN) messages are considered
@@ -340,43 +962,69 @@ Guidance:
         """
         if not quiet:
             print("Analyzing folder %s" % folder)
-        distances: List[int] = []
 
-        # Load cached rows for this folder
-        mail_db: Dict[str, str] = {}
-        self.db.execute("SELECT uid, hexdigest FROM nilsimsa WHERE folder = %s", (folder,))
-        for uid, hx in self.db.fetchall():
-            mail_db[str(uid)] = str(hx)
+        # Resident digests of this folder (loaded from the DB on first use)
+        corpus = self.folder_corpus(folder)
+        source = digest_int(source_hexdigest)
 
-        # Live IMAP UIDs (read-write select so expunged are gone)
-        imap.select('"%s"' % folder, readonly=False)
+        # Live IMAP UIDs (read-write, so expunged are gone)
+        ensure_selected(imap, '"%s"' % folder)
         result, data = imap.uid('search', None, "(SEEN)")
         email_uids = data[0].decode().split() if data and data[0] else []
-        message_count = len(email_uids)
-
-        for i, email_uid in enumerate(email_uids):
+        live = set(map(int, email_uids))
+
+        # Stored rows still on the server, weighted per representative digest. Prefilter:
+        # when no stored row can get over the threshold, score_folder would ignore all of
+        # them at any ladder step, so the Counter stays empty. Rows a concurrent commit
+        # adds after this snapshot are not ours to prune.
+        known_uids, bound, distances = corpus.snapshot(source, live, self.threshold)
+        known = set(known_uids)
+        missing = [u for u in email_uids if int(u) not in known]
+        message_count = len(missing)
+        if bound <= self.threshold and known:
+            METRICS.inc("prefilter_skipped_rows", len(email_uids) - message_count, folder=folder)
+            self.logger.debug("Prefilter: %s bound %d <= threshold %d, skipped %d stored messages",
+                              folder, bound, self.threshold, len(email_uids) - message_count)
+        if debug:
+            print("Folder %s: %d messages in DB (%d representatives), %d new" % (
+                folder, len(email_uids) - message_count, corpus.representatives, message_count))
+
+        # Cold build (first sync, schema reset): hash all new messages on a process pool
+        cold = None
+        if self.cold_build_workers > 1 and message_count >= self.cold_build_min:
+            self.logger.info("Cold build of %d messages in %s on %d processes",
+                             message_count, folder, self.cold_build_workers)
+            cold = self._cold_hash_stream(imap, missing)
+
+        for i, email_uid in enumerate(missing):
             if not quiet:
                 self.status(i, message_count, 'Comparing ')
             if debug:
                 print("Folder: %s, email_uid: %s" % (folder, email_uid))
 
-            if email_uid not in mail_db:
+            distance = corpus.distance(email_uid, source)
+            if distance is not None and cold is not None:
+                next(cold)  # stored by a concurrent commit since the snapshot; keep the stream in step
+            if distance is None:
                 # Not in DB → normalize header and derive md5 over trimmed header
-                res_fetch, data_fetch = imap.uid('fetch', email_uid, '(BODY.PEEK[HEADER])')
-                raw_header = data_fetch[0][1].decode('utf-8', 'backslashreplace') if data_fetch and data_fetch[0] else ''
-                trimmed_header = self.return_header(raw_header)
-                md5sum = hashlib.md5(trimmed_header.encode('utf-8')).hexdigest()
+                cold_hexdigest = None
+                if cold is not None:
+                    _uid, raw_header, trimmed_header, md5sum, cold_hexdigest = next(cold)
+                else:
+                    res_fetch, data_fetch = imap.uid('fetch', email_uid, '(BODY.PEEK[HEADER])')
+                    raw_header = data_fetch[0][1].decode('utf-8', 'backslashreplace') if data_fetch and data_fetch[0] else ''
+                    trimmed_header = self.return_header(raw_header)
+                    md5sum = self._md5(trimmed_header)
                 # Look up any rows with this md5 (same normalized header)
-                self.db.execute("SELECT id, uid, folder, categories, hexdigest FROM nilsimsa WHERE md5sum = %s", (md5sum,))
-                md5_rows = self.db.fetchall()
+                md5_rows = self.db.fetchall("SELECT id, uid, folder, categories, hexdigest FROM nilsimsa WHERE md5sum = %s AND account = %s", (md5sum, self.account))
                 if not md5_rows:
                     # No md5sum entry → treat as new. Classify, compute hexdigest over categories+trimmed_header, insert full row.
                     msg = email.message_from_string(raw_header)
                     # Maybe later we can reclassify all older mail, but for now hard set
                     # cats = self._classify_email(msg.get('From',''), msg.get('Subject',''))
-                    cats = '[{"cta":"Notice LLM classisication never done"},{"label":["Unclassified:1.00"]}]'
+                    cats = NEVER_CLASSIFIED
                     try:
-                        target_hexdigest = Nilsimsa(f"X-LLM-Categories: {cats}\n{trimmed_header}").hexdigest()
+                        target_hexdigest = cold_hexdigest or self._digest(cats, trimmed_header)
                     except Exception as e:
                         self.logger.error("Failed to compute Nilsimsa hash: %s", e)
                         self.logger.error(trimmed_header)
@@ -384,20 +1032,28 @@ Guidance:
                         continue
                     if not dry_run:
                         self.db.execute(
-                            "INSERT INTO nilsimsa (uid, folder, hexdigest, md5sum, trimmed_header, categories) VALUES (%s, %s, %s, %s, %s, %s)",
-                            (email_uid, folder, target_hexdigest, md5sum, trimmed_header, cats),
+                            "INSERT INTO nilsimsa (uid, folder, hexdigest, md5sum, trimmed_header, categories, account) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                            (email_uid, folder, target_hexdigest, md5sum, trimmed_header, cats, self.account),
                         )
                 else:
                     # md5sum exists. If exactly one row → moved; else (>=2) → unknown; in both cases ensure consistent categories.
                     if len(md5_rows) == 1:
                         prev_id, prev_uid, prev_folder, prev_cats, prev_hex = md5_rows[0]
+                        # Row bulk-loaded without a UID (corpus_import.py) for this very folder
+                        adopted = prev_uid is None and prev_folder == folder
                         # Update DB to reflect IMAP state (uid, folder, moved_from)
                         if not dry_run:
                             try:
-                                self.db.execute(
-                                    "UPDATE nilsimsa SET uid=%s, folder=%s, moved_from=%s WHERE id=%s",
-                                    (email_uid, folder, prev_folder or '', prev_id),
-                                )
+                                if adopted:
+                                    self.db.execute("UPDATE nilsimsa SET uid=%s WHERE id=%s", (email_uid, prev_id))
+                                else:
+                                    self.db.execute(
+                                        "UPDATE nilsimsa SET uid=%s, folder=%s, moved_from=%s WHERE id=%s",
+                                        (email_uid, folder, prev_folder or '', prev_id),
+                                    )
+                                    self._corpus_discard(prev_folder, prev_uid)
+                                    if prev_folder != folder:  # not a copy filed next to its twin
+                                        self._route_learn(raw_header, folder, prev_folder)
                             except Exception as e:
                                 if self.logger: self.logger.error("Move-update failed: %s", e)
                         # Choose categories: reuse if present, else classify once
@@ -406,9 +1062,9 @@ Guidance:
                             msg = email.message_from_string(raw_header)
                             # Maybe later we can reclassify all older mail, but for now hard set
                             # cats = self._classify_email(msg.get('From',''), msg.get('Subject',''))
-                            cats = '[{"cta":"Notice LLM classisication never done"},{"label":["Unclassified:1.00"]}]'
+                            cats = NEVER_CLASSIFIED
                             try:
-                                target_hexdigest = Nilsimsa(f"X-LLM-Categories: {cats}\n{trimmed_header}").hexdigest()
+                                target_hexdigest = self._digest(cats, trimmed_header)
                             except Exception as e:
                                 self.logger.error("Failed to compute Nilsimsa hash: %s", e)
                                 self.logger.error(trimmed_header)
@@ -421,10 +1077,12 @@ Guidance:
                                     )
                                 except Exception as e:
                                     if self.logger: self.logger.error("Post-move categories update failed: %s", e)
+                        elif adopted and prev_hex:
+                            target_hexdigest = prev_hex  # hashed over these categories at import
                         else:
                             # Categories already present; compute hexdigest for in-memory distance only
                             try:
-                                target_hexdigest = Nilsimsa(f"X-LLM-Categories: {cats}\n{trimmed_header}").hexdigest()
+                                target_hexdigest = self._digest(cats, trimmed_header)
                             except Exception as e:
                                 self.logger.error("Failed to compute Nilsimsa hash: %s", e)
                                 self.logger.error(trimmed_header)
@@ -441,79 +1099,130 @@ Guidance:
                             chosen = self._classify_email(msg.get('From',''), msg.get('Subject',''))
                         cats = chosen
                         try:
-                            target_hexdigest = Nilsimsa(f"X-LLM-Categories: {cats}\n{trimmed_header}").hexdigest()
+                            target_hexdigest = self._digest(cats, trimmed_header)
                         except Exception as e:
                             self.logger.error("Failed to compute Nilsimsa hash: %s", e)
                             self.logger.error(trimmed_header)
                             continue
                         if not dry_run:
                             self.db.execute(
-                                "INSERT INTO nilsimsa (uid, folder, hexdigest, md5sum, trimmed_header, categories) VALUES (%s, %s, %s, %s, %s, %s)",
-                                (email_uid, folder, target_hexdigest, md5sum, trimmed_header, cats),
+                                "INSERT INTO nilsimsa (uid, folder, hexdigest, md5sum, trimmed_header, categories, account) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                                (email_uid, folder, target_hexdigest, md5sum, trimmed_header, cats, self.account),
                             )
-            else:
-                # Already in DB: reuse existing hex and mark as seen for pruning step
-                if debug:
-                    print("Email UID %s found in DB" % email_uid)
-                target_hexdigest = mail_db[email_uid]
-                del mail_db[email_uid]
-
-            # Distance against the *source* hexdigest (unchanged)
-            try:
-                distance = compare_hexdigests(source_hexdigest, target_hexdigest)
-            except Exception as e:
-                self.logger.error("Failed to compute distance: %s", e)
-                continue
+                if not dry_run:
+                    corpus.add(email_uid, target_hexdigest)
 
-            if debug:
-                print("Distance between source and %s: %s" % (target_hexdigest, distance))
-            distances.append(distance)
+                # Distance against the *source* hexdigest (unchanged)
+                try:
+                    distance = compare_hexdigests(source_hexdigest, target_hexdigest)
+                except Exception as e:
+                    self.logger.error("Failed to compute distance: %s", e)
+                    continue
+                if debug:
+                    print("Distance between source and %s: %s" % (target_hexdigest, distance))
+            elif debug:
+                # Stored since the snapshot: distance straight from the resident digest
+                print("Email UID %s found in DB" % email_uid)
+                print("Distance between source and %s: %s" % (corpus.hexdigest(email_uid), distance))
+            distances[distance] += 1
 
         # Prune DB rows for UIDs no longer in the IMAP folder
-        if mail_db:
-            self.logger.info(f"{len(mail_db)} records for cleanup in DB folder[{folder}]")
-        for email_uid in list(mail_db.keys()):
+        stale = [uid for uid in known_uids if uid not in live]
+        if stale:
+            self.logger.info(f"{len(stale)} records for cleanup in DB folder[{folder}]")
+        for email_uid in stale:
             if not quiet:
-                self.status(0, len(mail_db), 'Deleting moved messages ')
+                self.status(0, len(stale), 'Deleting moved messages ')
             if not dry_run:
-                self.db.execute("DELETE FROM nilsimsa WHERE uid = %s AND folder = %s", (email_uid, folder))
+                self.db.execute("DELETE FROM nilsimsa WHERE uid = %s AND folder = %s AND account = %s", (email_uid, folder, self.account))
+                corpus.discard(email_uid)
             else:
                 print("Dry run: would have deleted DB entry for UID: %s, folder: %s" % (email_uid, folder))
 
         return distances
 
+    def folder_distances(self, imap: imaplib.IMAP4_SSL, source_hexdigest: str, dry_run: bool = False,
+                         debug: bool = False, quiet: bool = False) -> Dict[str, collections.Counter]:
+        """sync_and_distance for every folder; in parallel over the IMAP pool when configured.
+
+        Results are keyed by folder in imap_folders order, so scoring sees the
+        same state whichever way the folders were synced.
+        """
+        def timed_sync(conn, folder, quiet):
+            with METRICS.timer("folder_sync", folder=folder):
+                return self.sync_and_distance(conn, folder, source_hexdigest, dry_run, debug, quiet)
+
+        pool = self.imap_helper.pool()
+        if pool is None:
+            return {f: timed_sync(imap, f, quiet) for f in self.imap_folders}
+
+        def sync(folder):
+            with pool.connection() as conn:
+                # progress bars from several threads would garble each other
+                return timed_sync(conn, folder, True)
+
+        with ThreadPoolExecutor(max_workers=pool.size) as workers:
+            return dict(zip(self.imap_folders, workers.map(sync, self.imap_folders)))
+
     # ------------------------------ scoring ------------------------------
-    def score_folder(self, folder: str, distances: List[int], threshold: int,
+    def score_folder(self, folder: str, distances: Union[List[int], collections.Counter], threshold: int,
                      debug: bool = False, quiet: bool = False) -> Tuple[float, float]:
-        """Score a folder from distances over *threshold*; semantics unchanged."""
-        over_threshold = [x for x in distances if x > threshold]
-        if not over_threshold:
+        """Score a folder from distances over *threshold*; semantics unchanged.
+
+        *distances* is one distance per message or a Counter distance ->
+        messages (sync_and_distance); both give the same score. The total is
+        taken over the integer excess, so it does not depend on the order.
+        Counts scaled up from a folder sample may be fractional.
+        """
+        if isinstance(distances, collections.Counter):
+            over = [(x, n) for x, n in distances.items() if x > threshold and n > 0]
+        else:
+            over = [(x, 1) for x in distances if x > threshold]
+        if not over:
             return 0.0, 0.0
 
-        scores = [100 * (x - threshold) / (128 - threshold) for x in over_threshold]
-        total_score = sum(scores)
-        scored_count = len(scores)
+        scored_count = sum(n for _, n in over)
+        total_score = 100 * sum((x - threshold) * n for x, n in over) / (128 - threshold)
         average = 0.0
 
         if scored_count >= self.min_over:
             average = total_score / scored_count
             total_score *= math.log10(scored_count) if scored_count > 1 else 1
 
-            # Summarize ONLY the over-threshold values (no under-threshold data).
-            n_over = len(over_threshold)
-            ot_sorted = sorted(over_threshold)
-            ot_min = ot_sorted[0]
-            ot_max = ot_sorted[-1]
-            # use population stdev for stability on small n; switch to sample if you prefer
-            ot_mean = sum(over_threshold) / n_over
-            ot_var = sum((v - ot_mean) ** 2 for v in over_threshold) / max(1, n_over - 1)
-            ot_std = ot_var ** 0.5
-            def pct(p):
-                i = int(p * (n_over - 1))
-                return ot_sorted[i]
-            ot_p90, ot_p95, ot_p99 = pct(0.90), pct(0.95), pct(0.99)
-
-            # Longest run of consecutive over-threshold values in the original order.
+            # The two stat lines cost more than the scoring itself; skip when INFO is off
+            if self.logger.isEnabledFor(logging.INFO):
+                over_threshold = [x for x, n in over for _ in range(round(n))]
+                scores = [100 * (x - threshold) / (128 - threshold) for x in over_threshold]
+                self._log_score_stats(folder, distances, threshold, over_threshold, scores, total_score, average)
+            
+            if not quiet:
+                print(average)
+        else:
+            if not quiet:
+                print("n/a: %s nothing over threshold %s" % (folder, threshold))
+            average = -1.0
+
+        return total_score, average
+
+    def _log_score_stats(self, folder: str, distances: Union[List[int], collections.Counter], threshold: int,
+                         over_threshold: List[int], scores: List[float], total_score: float, average: float) -> None:
+        # Summarize ONLY the over-threshold values (no under-threshold data).
+        n_over = len(over_threshold)
+        ot_sorted = sorted(over_threshold)
+        ot_min = ot_sorted[0]
+        ot_max = ot_sorted[-1]
+        # use population stdev for stability on small n; switch to sample if you prefer
+        ot_mean = sum(over_threshold) / n_over
+        ot_var = sum((v - ot_mean) ** 2 for v in over_threshold) / max(1, n_over - 1)
+        ot_std = ot_var ** 0.5
+        def pct(p):
+            i = int(p * (n_over - 1))
+            return ot_sorted[i]
+        ot_p90, ot_p95, ot_p99 = pct(0.90), pct(0.95), pct(0.99)
+
+        # Longest run of consecutive over-threshold values in the original order (a Counter has none).
+        best_run = "n/a"
+        if not isinstance(distances, collections.Counter):
             run = best_run = 0
             for v in distances:
                 if v >= threshold:
@@ -523,212 +1232,543 @@ Guidance:
                 else:
                     run = 0
 
-            # (Optional) very-high bucket entirely above threshold as a quick “tail heat” signal
-            very_hi_cut = max(threshold + 15, 90)
-            very_hi = sum(1 for v in over_threshold if v >= very_hi_cut)
+        # (Optional) very-high bucket entirely above threshold as a quick “tail heat” signal
+        very_hi_cut = max(threshold + 15, 90)
+        very_hi = sum(1 for v in over_threshold if v >= very_hi_cut)
 
-            # One-liner: compact stats + readable narrative, strictly about over-threshold.
-            self.logger.info(
-                ("Dist[%s] ≥%d: %d vals, mean %.1f±%.1f, span %d–%d, p90/95/99=%d/%d/%d, "
-                 "%d very-high (≥%d); longest ≥%d run=%d; total_score=%.1f avg=%.1f"),
-                folder, threshold, n_over, ot_mean, ot_std, ot_min, ot_max,
-                ot_p90, ot_p95, ot_p99, very_hi, very_hi_cut, threshold, best_run, total_score, average
-            )
-            
-            # One-liner (SCORES): mirror the distance summary for the score distribution (over-threshold only).
-            sc_sorted = sorted(scores)
-            sc_min = sc_sorted[0]
-            sc_max = sc_sorted[-1]
-            sc_mean = sum(scores) / n_over
-            sc_var = sum((s - sc_mean) ** 2 for s in scores) / max(1, n_over - 1)
-            sc_std = sc_var ** 0.5
-            def spct(p: float) -> float:
-                i = int(p * (n_over - 1))
-                return sc_sorted[i]
-            sc_p90, sc_p95, sc_p99 = spct(0.90), spct(0.95), spct(0.99)
-            sc_very_cut = 95  # fixed “very-high” score bucket
-            sc_very = sum(1 for s in scores if s >= sc_very_cut)
-            self.logger.info(
-                ("Score[%s] ≥%d: %d vals, mean %.1f±%.1f, span %.0f–%.0f, "
-                 "p90/95/99=%.0f/%.0f/%.0f, %d very-high (≥%d); total_score=%.1f avg=%.1f"),
-                folder, threshold, n_over, sc_mean, sc_std, sc_min, sc_max,
-                sc_p90, sc_p95, sc_p99, sc_very, sc_very_cut, total_score, average
-            )
+        # One-liner: compact stats + readable narrative, strictly about over-threshold.
+        self.logger.info(
+            ("Dist[%s] ≥%d: %d vals, mean %.1f±%.1f, span %d–%d, p90/95/99=%d/%d/%d, "
+             "%d very-high (≥%d); longest ≥%d run=%s; total_score=%.1f avg=%.1f"),
+            folder, threshold, n_over, ot_mean, ot_std, ot_min, ot_max,
+            ot_p90, ot_p95, ot_p99, very_hi, very_hi_cut, threshold, best_run, total_score, average
+        )
             
-            if not quiet:
-                print(average)
-        else:
-            if not quiet:
-                print("n/a: %s nothing over threshold %s" % (folder, threshold))
-            average = -1.0
-
-        return total_score, average
+        # One-liner (SCORES): mirror the distance summary for the score distribution (over-threshold only).
+        sc_sorted = sorted(scores)
+        sc_min = sc_sorted[0]
+        sc_max = sc_sorted[-1]
+        sc_mean = sum(scores) / n_over
+        sc_var = sum((s - sc_mean) ** 2 for s in scores) / max(1, n_over - 1)
+        sc_std = sc_var ** 0.5
+        def spct(p: float) -> float:
+            i = int(p * (n_over - 1))
+            return sc_sorted[i]
+        sc_p90, sc_p95, sc_p99 = spct(0.90), spct(0.95), spct(0.99)
+        sc_very_cut = 95  # fixed “very-high” score bucket
+        sc_very = sum(1 for s in scores if s >= sc_very_cut)
+        self.logger.info(
+            ("Score[%s] ≥%d: %d vals, mean %.1f±%.1f, span %.0f–%.0f, "
+             "p90/95/99=%.0f/%.0f/%.0f, %d very-high (≥%d); total_score=%.1f avg=%.1f"),
+            folder, threshold, n_over, sc_mean, sc_std, sc_min, sc_max,
+            sc_p90, sc_p95, sc_p99, sc_very, sc_very_cut, total_score, average
+        )
 
     # ------------------------------ todo / autosort ------------------------------
     def todo_count(self, imap: imaplib.IMAP4_SSL) -> int:
-        """Return count of UNSEEN in TODO folder (unchanged query)."""
-        imap.select(self.todo_folder, readonly=False)
+        """Return count of UNSEEN in TODO folder, without (re-)selecting it.
+
+        STATUS when another mailbox is selected; on the selected todo folder
+        (where STATUS is discouraged) a SEARCH, returning only the count with
+        ESEARCH.
+        """
+        if getattr(imap, 'selected', None) != (self.todo_folder.strip('"'), False):
+            typ, data = imap.status('"%s"' % self.todo_folder.strip('"'), "(UNSEEN)")
+            m = re.search(rb"\(.*UNSEEN (\d+)", data[0] or b"") if typ == "OK" and data else None
+            if m:
+                return int(m.group(1))
+            ensure_selected(imap, self.todo_folder)
+        if self.imap_helper.has_capability("ESEARCH"):
+            typ, data = imap._simple_command('SEARCH', 'RETURN', '(COUNT)', 'UNSEEN')
+            typ, data = imap._untagged_response(typ, data, 'ESEARCH')
+            m = re.search(rb"COUNT (\d+)", data[0] or b"") if typ == "OK" and data else None
+            if m:
+                return int(m.group(1))
         resp, data = imap.search(None, 'UNSEEN')
         return len(data[0].split()) if data and data[0] else 0
 
     def autosort_inbox(self, imap: imaplib.IMAP4_SSL, dry_run: bool = False,
-                       debug: bool = False, quiet: bool = False) -> None:
-        """Process UNSEEN in TODO: compute source hexdigest, score per folder, move/copy."""
-        while self.todo_count(imap):
-            imap.select(self.todo_folder, readonly=False)
+                       debug: bool = False, quiet: bool = False,
+                       uids: Optional[List[str]] = None) -> None:
+        """Process UNSEEN in TODO: compute source hexdigest, score per folder, move/copy.
+
+        With *uids* (e.g. the new mail announced by IDLE) only those messages
+        are sorted instead of re-scanning the whole TODO folder.
+        """
+        if uids is not None:
+            self._run_sort_pipeline(imap, uids, dry_run, debug, quiet)
+            return
+
+        while True:
+            ensure_selected(imap, self.todo_folder)
             result, data = imap.uid('search', None, "(UNSEEN)")
             if not (data and data[0]):
                 break
             email_uids = [str(x) for x in data[0].decode().split()]
+            self._run_sort_pipeline(imap, email_uids, dry_run, debug, quiet)
+
+    # ------------------------------ autosort pipeline ------------------------------
+    # fetch -> normalize -> classify -> hash -> score -> commit, connected by
+    # bounded queues so IMAP, LLM and CPU work of different messages overlap.
+    # Each stage takes and returns a job dict; the shared IMAP connection is
+    # only touched under run["lock"].
+
+    PIPELINE_STAGES = ("fetch", "normalize", "classify", "hash", "score", "commit")
+
+    # Progress of each todo message is checkpointed in the considered table,
+    # keyed by (account, UIDVALIDITY, UID), so a run that crashed or was
+    # interrupted resumes without repeating LLM calls or corpus scans. The
+    # ladder runs straight after the scan, so scoring and deciding share
+    # the "decided" checkpoint.
+    CHECKPOINT_STAGES = ("classified", "decided", "moved")
+
+    def _run_sort_pipeline(self, imap: imaplib.IMAP4_SSL, email_uids: List[str],
+                           dry_run: bool = False, debug: bool = False, quiet: bool = False) -> None:
+        run = {"imap": imap, "lock": threading.RLock(), "dry_run": dry_run, "debug": debug, "quiet": quiet}
+        uidvalidity = self._folder_uidvalidity(imap, self.todo_folder)
+        run["checkpoints"] = self._load_checkpoints(uidvalidity)
+        stages = [(name, functools.partial(self._run_stage, name, run), self.pipeline_workers[name])
+                  for name in self.PIPELINE_STAGES]
+        Pipeline(stages, maxsize=self.pipeline_queue_size, logger=self.logger).run(
+            {"uid": email_uid, "uidvalidity": uidvalidity} for email_uid in email_uids)
 
-            for email_uid in email_uids:
-                print("----- Considering message: %s" % email_uid)
-                imap.select(self.todo_folder, readonly=False)
-                res_fetch, data_fetch = imap.uid('fetch', email_uid, '(BODY.PEEK[HEADER])')
-                try:
-                    raw_header = data_fetch[0][1].decode('utf-8', 'backslashreplace')
-                except Exception:
-                    sys.exit("Error: email_uid: %s has no data" % email_uid)
-                
-                msg = email.message_from_string(raw_header)           
-                print("---------- Source: subject: %s" % msg['Subject'])
-                message_id = (msg.get('Message-ID','') or '').strip()
-                trimmed_header = self.return_header(raw_header)
-                self.logger.info("* New message from: %s, Message-ID: %s", msg['From'], message_id)
-                self.logger.info(trimmed_header)
-                cats = self._classify_email(msg['From'], msg['Subject'])
-                try:
-                    m = re.findall(r'"(?:Spam|Phishing Suspected):(\d+\.\d{2})"', cats)
-                    if m and max(map(float, m)) >= 0.10:
-                        imap.uid('STORE', email_uid, '+FLAGS', '($label1)')
-                except Exception:
-                    pass
+    @staticmethod
+    def _folder_uidvalidity(imap: imaplib.IMAP4_SSL, folder: str) -> Optional[int]:
+        """UIDVALIDITY of *folder*: from its SELECT when it is the selected mailbox, else one STATUS."""
+        if getattr(imap, 'selected', None) and imap.selected[0] == folder.strip('"') and imap.uidvalidity:
+            return imap.uidvalidity
+        try:
+            typ, data = imap.status('"%s"' % folder, "(UIDVALIDITY)")
+        except Exception:
+            return None
+        m = re.search(rb"UIDVALIDITY (\d+)", data[0] or b"") if typ == "OK" and data else None
+        return int(m.group(1)) if m else None
+
+    def _load_checkpoints(self, uidvalidity: Optional[int]) -> Dict[str, dict]:
+        """Checkpoints of the todo folder by UID (empty without a UIDVALIDITY)."""
+        if uidvalidity is None:
+            return {}
+        rows = self.db.fetchall("SELECT uid, stage, categories, winner FROM considered "
+                                "WHERE account = %s AND uidvalidity = %s AND stage IS NOT NULL",
+                                (self.account, uidvalidity))
+        return {str(uid): {"stage": stage, "cats": cats, "winner": winner} for uid, stage, cats, winner in rows}
+
+    def _checkpoint(self, job, stage: str, dry_run: bool) -> None:
+        if dry_run or job.get("uidvalidity") is None:
+            return
+        try:
+            self.db.execute(
+                "INSERT INTO considered (account, uidvalidity, uid, stage, categories, winner, considered_when) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE stage = VALUES(stage), "
+                "categories = VALUES(categories), winner = VALUES(winner), considered_when = VALUES(considered_when)",
+                (self.account, job["uidvalidity"], job["uid"], stage, job.get("cats"), job.get("winner"),
+                 int(time.time())),
+            )
+        except Exception as e:
+            self.logger.error("Checkpoint %s for %s failed: %s", stage, job["uid"], e)
+
+    @classmethod
+    def _reached(cls, checkpoint: Optional[dict], stage: str) -> bool:
+        return bool(checkpoint) and checkpoint["stage"] in cls.CHECKPOINT_STAGES and \
+            cls.CHECKPOINT_STAGES.index(checkpoint["stage"]) >= cls.CHECKPOINT_STAGES.index(stage)
+
+    def _run_stage(self, name, run, job):
+        start = time.perf_counter()
+        job.setdefault("started", start)
+        with METRICS.timer("stage", stage=name):
+            out = getattr(self, "_stage_" + name)(run, job)
+        job.setdefault("trace", []).append((name, time.perf_counter() - start))
+        if name == self.PIPELINE_STAGES[-1]:
+            self._finish_trace(job)
+        return out
 
-                try:
-                    source_hexdigest = Nilsimsa(f"X-LLM-Categories: {cats}\n{trimmed_header}").hexdigest()
-                except Exception as e:
-                    self.logger.error("Cannot compute Nilsimsa hash: %s", e)
-                    imap.uid('COPY', email_uid, 'INBOX.autosort.problem')
-                    imap.uid('STORE', email_uid, '+FLAGS', '(\\Deleted)')
-                    imap.expunge()
-                    continue
+    def _finish_trace(self, job) -> None:
+        """One line per sorted message with the time spent in each stage (queue waits excluded)."""
+        spans = job.get("trace", [])
+        wall = time.perf_counter() - job["started"]
+        self.logger.info("TRACE uid=%s winner=%s wall=%.1fms %s", job["uid"], job.get("winner"), wall * 1000,
+                         " ".join("%s=%.1fms" % (name, secs * 1000) for name, secs in spans))
+        if self.profiler is not None:
+            self.profiler.trace({"uid": job["uid"], "account": self.account, "winner": job.get("winner"),
+                                 "wall": wall, "spans": dict(spans)})
+
+    def _stage_fetch(self, run, job):
+        email_uid = job["uid"]
+        print("----- Considering message: %s" % email_uid)
+        imap = run["imap"]
+        with run["lock"]:
+            ensure_selected(imap, self.todo_folder)
+            res_fetch, data_fetch = imap.uid('fetch', email_uid, '(BODY.PEEK[HEADER])')
+        try:
+            job["raw_header"] = data_fetch[0][1].decode('utf-8', 'backslashreplace')
+        except Exception:
+            sys.exit("Error: email_uid: %s has no data" % email_uid)
+        return job
+
+    def _stage_normalize(self, run, job):
+        msg = email.message_from_string(job["raw_header"])
+        print("---------- Source: subject: %s" % msg['Subject'])
+        job["msg"] = msg
+        job["message_id"] = (msg.get('Message-ID','') or '').strip()
+        job["trimmed_header"] = self.return_header(job["raw_header"])
+        self.logger.info("* New message from: %s, Message-ID: %s", msg['From'], job["message_id"])
+        self.logger.info(job["trimmed_header"])
+        return job
+
+    def _stage_classify(self, run, job):
+        msg = job["msg"]
+        checkpoint = run["checkpoints"].get(job["uid"])
+        if self._reached(checkpoint, "classified") and checkpoint["cats"]:
+            self.logger.info("Resuming %s from checkpoint '%s'", job["uid"], checkpoint["stage"])
+            job["cats"] = cats = checkpoint["cats"]
+        elif self._cached_decision(job):
+            cats = job["cats"]
+            self._checkpoint(job, "decided", run["dry_run"])
+        else:
+            job["cats"] = cats = self._classify_email(msg['From'], msg['Subject'])
+            if "classisication error" not in cats:  # let a later run retry the LLM
+                self._checkpoint(job, "classified", run["dry_run"])
+        try:
+            m = re.findall(r'"(?:Spam|Phishing Suspected):(\d+\.\d{2})"', cats)
+            job["spam"] = bool(m and max(map(float, m)) >= 0.10)
+        except Exception:
+            job["spam"] = False
+        return job
+
+    def _cached_decision(self, job) -> bool:
+        """Route an exact repeat of earlier mail without the LLM, folder syncs or ladder.
+
+        Looks up the rows with this header's md5sum. When there are at least
+        decision_cache_min of them, all in the same sort folder, and none was
+        moved there by hand (moved_from other than the todo folder, i.e. a
+        correction of an earlier decision), the message takes that folder and
+        the categories and digest of those rows. Sets job["cached"] and
+        returns True on a hit.
+        """
+        if not self.decision_cache:
+            return False
+        rows = self.db.fetchall("SELECT folder, moved_from, categories, hexdigest FROM nilsimsa "
+                                "WHERE md5sum = %s AND account = %s",
+                                (self._md5(job["trimmed_header"]), self.account))
+        todo = self.todo_folder.strip('"')
+        hit = (len(rows) >= self.decision_cache_min and len({r[0] for r in rows}) == 1
+               and rows[0][0] in self.imap_folders and all((r[1] or '').strip('"') in ('', todo) for r in rows))
+        stored = next(((cats, hexdigest) for _, _, cats, hexdigest in rows if cats and hexdigest), None) if hit else None
+        with self._decision_lock:
+            self._decision_stats["hit" if stored else "miss"] += 1
+            hits, total = self._decision_stats["hit"], sum(self._decision_stats.values())
+        METRICS.inc("decision_cache", result="hit" if stored else "miss")
+        if not stored:
+            return False
+        job["cats"], job["source_hexdigest"] = stored
+        job["winner"], job["cached"] = rows[0][0], True
+        self.logger.info("CACHE uid=%s winner=%s (%d identical headers) | hit rate %d/%d = %.0f%%",
+                         job["uid"], job["winner"], len(rows), hits, total, 100.0 * hits / total)
+        return True
+
+    def _stage_hash(self, run, job):
+        if job.get("cached"):
+            return job  # digest of the earlier copy
+        try:
+            job["source_hexdigest"] = self._digest(job["cats"], job["trimmed_header"])
+        except Exception as e:
+            self.logger.error("Cannot compute Nilsimsa hash: %s", e)
+            job["source_hexdigest"] = None
+        return job
+
+    def _stage_score(self, run, job):
+        if job["source_hexdigest"] is None or job.get("cached"):
+            return job
+        imap, dry_run, debug, quiet = run["imap"], run["dry_run"], run["debug"], run["quiet"]
+        checkpoint = run["checkpoints"].get(job["uid"])
+        if self._reached(checkpoint, "decided") and checkpoint["winner"]:
+            job["winner"] = checkpoint["winner"]  # decided before the interruption: no corpus scan
+            return job
+        routed = self._route_decision(job)
+        if routed is not None:
+            job["winner"] = routed
+            self._checkpoint(job, "decided", dry_run)
+            return job
+        # Cache distances once per folder (threshold-independent); the serial
+        # path syncs over the shared connection, the pooled one does not need it
+        with (run["lock"] if self.imap_helper.pool() is None else nullcontext()):
+            dist_cache = self.folder_distances(imap, job["source_hexdigest"], dry_run, debug, quiet)
+        with METRICS.timer("ladder"):
+            job["winner"] = self.resolve_winner(dist_cache, debug, quiet)
+        self._checkpoint(job, "decided", dry_run)
+        return job
+
+    def resolve_winner(self, dist_cache: Dict[str, Union[List[int], collections.Counter]], debug: bool = False,
+                       quiet: bool = False, trace: Optional[list] = None) -> str:
+        """Pick the destination folder from per-folder distances (threshold ladder).
+
+        If *trace* is a list, one dict per ladder step is appended to it: the
+        threshold, the folders ranked as (folder, score, avg), the top-2 ratio
+        gap and the step's outcome ("ladder", "winner" or "new_folder").
+        """
+        winning_folder = self.new_folder
+        winning_score = 0.0
+        
+        # --- Ratio-as-tie-trigger ladder (winner still decided by avg->score) ---
+        base_T = self.threshold
+        tie_ratio_gap = getattr(self, "tie_ratio_gap", 0.10)  # if (r1 - r2) < this => tie → raise T
+
+        T = base_T
+        winning_folder, winning_score = self.new_folder, 0.0
+        while True:
+            # Score all folders at a shared threshold T
+            stats = {}  # f -> (score, avg)
+            sum_av = 0.0
+            for f, d in dist_cache.items():
+                sc, av = self.score_folder(f, d, T, debug, quiet)
+                stats[f] = (sc, av)
+                sum_av += max(0.0, av)                    
+
+            # Rank by (avg, then score)
+            ranked = sorted(stats.items(), key=lambda it: (it[1][1], it[1][0]), reverse=True)
+            step = {"T": T, "ranked": [(f, sc, av) for f, (sc, av) in ranked], "gap": None, "result": "new_folder"}
+            if trace is not None:
+                trace.append(step)
+
+            # Early stop: no over-threshold signal in any folder → don't ladder
+            if sum_av <= 0.0:
+                self.logger.info("T=%d | no over-threshold signal; skipping ladder", T)
+                self.logger.info("RESOLVE @T=%d | no folder clears minimums; using new_folder", T)
+                break
 
-                winning_folder = self.new_folder
-                winning_score = 0.0
-                
-                # --- Ratio-as-tie-trigger ladder (winner still decided by avg->score) ---
-                base_T = self.threshold
-                tie_ratio_gap = getattr(self, "tie_ratio_gap", 0.10)  # if (r1 - r2) < this => tie → raise T
-
-                # Cache distances once per folder (threshold-independent)
-                dist_cache = {}
-                for f in self.imap_folders:
-                    dist_cache[f] = self.sync_and_distance(imap, f, source_hexdigest, dry_run, debug, quiet)
-
-                T = base_T
-                winning_folder, winning_score = self.new_folder, 0.0
-                while True:
-                    # Score all folders at a shared threshold T
-                    stats = {}  # f -> (score, avg)
-                    sum_av = 0.0
-                    for f, d in dist_cache.items():
-                        sc, av = self.score_folder(f, d, T, debug, quiet)
-                        stats[f] = (sc, av)
-                        sum_av += max(0.0, av)                    
-
-                    # Early stop: no over-threshold signal in any folder → don't ladder
-                    if sum_av <= 0.0:
-                        self.logger.info("T=%d | no over-threshold signal; skipping ladder", T)
-                        self.logger.info("RESOLVE @T=%d | no folder clears minimums; using new_folder", T)
-                        break
-
-                    # Rank by (avg, then score)
-                    ranked = sorted(stats.items(), key=lambda it: (it[1][1], it[1][0]), reverse=True)
-                    lead_f, (lead_sc, lead_av) = ranked[0]
-                    runner = ranked[1] if len(ranked) > 1 else None
-
-                    # Compute top-2 ratio gap of averages
-                    r1 = (lead_av / sum_av) if sum_av > 0 else 0.0
-                    r2 = ((runner[1][1] / sum_av) if (sum_av > 0 and runner) else 0.0)
-                    ratio_gap = r1 - r2
-                    self.logger.info("T=%d | leader=%s av=%.2f sc=%.2f | r1=%.3f r2=%.3f gap=%.3f",
-                                     T, lead_f, lead_av, lead_sc, r1, r2, ratio_gap)
-
-                    # If clearly separated by ratio, decide now; else ladder up
-                    if (not runner) or (ratio_gap >= tie_ratio_gap) or (T >= 125):
-                        if lead_sc > self.min_score and lead_av > self.min_average:
-                            winning_folder, winning_score = lead_f, lead_sc
-                            self.logger.info("RESOLVE @T=%d | winner=%s av=%.2f sc=%.2f (gap>=%.3f or no runner)",
-                                             T, winning_folder, lead_av, lead_sc, tie_ratio_gap)
-                        else:
-                            self.logger.info("RESOLVE @T=%d | no folder clears minimums; using new_folder", T)
-                        break
-                    else:
-                        T += 5  # tie by ratio → raise threshold and re-evaluate
-                        self.logger.info("LADDER (ratio gap %.3f < %.3f) → raise T to %d", ratio_gap, tie_ratio_gap, T)
+            lead_f, (lead_sc, lead_av) = ranked[0]
+            runner = ranked[1] if len(ranked) > 1 else None
+
+            # Compute top-2 ratio gap of averages
+            r1 = (lead_av / sum_av) if sum_av > 0 else 0.0
+            r2 = ((runner[1][1] / sum_av) if (sum_av > 0 and runner) else 0.0)
+            ratio_gap = step["gap"] = r1 - r2
+            self.logger.info("T=%d | leader=%s av=%.2f sc=%.2f | r1=%.3f r2=%.3f gap=%.3f",
+                             T, lead_f, lead_av, lead_sc, r1, r2, ratio_gap)
+
+            # If clearly separated by ratio, decide now; else ladder up
+            if (not runner) or (ratio_gap >= tie_ratio_gap) or (T >= 125):
+                if lead_sc > self.min_score and lead_av > self.min_average:
+                    winning_folder, winning_score = lead_f, lead_sc
+                    step["result"] = "winner"
+                    self.logger.info("RESOLVE @T=%d | winner=%s av=%.2f sc=%.2f (gap>=%.3f or no runner)",
+                                     T, winning_folder, lead_av, lead_sc, tie_ratio_gap)
+                else:
+                    self.logger.info("RESOLVE @T=%d | no folder clears minimums; using new_folder", T)
+                break
+            else:
+                step["result"] = "ladder"
+                T += 5  # tie by ratio → raise threshold and re-evaluate
+                self.logger.info("LADDER (ratio gap %.3f < %.3f) → raise T to %d", ratio_gap, tie_ratio_gap, T)
 
-                if not dry_run:
-                    print("* Moving message to %s" % winning_folder)
-                    imap.select(self.todo_folder, readonly=False)
-                    typ, data = imap.uid('MOVE', email_uid, '"%s"' % winning_folder)
-                    if typ == 'OK':
+        return winning_folder
+
+    def _stage_commit(self, run, job):
+        imap, dry_run = run["imap"], run["dry_run"]
+        email_uid = job["uid"]
+        with run["lock"]:
+            if job["spam"]:
+                try:
+                    ensure_selected(imap, self.todo_folder)
+                    imap.uid('STORE', email_uid, '+FLAGS', '($label1)')
+                except Exception:
+                    pass
+            if job["source_hexdigest"] is None:
+                ensure_selected(imap, self.todo_folder)
+                imap.uid('COPY', email_uid, 'INBOX.autosort.problem')
+                imap.uid('STORE', email_uid, '+FLAGS', '(\\Deleted)')
+                imap.expunge()
+                return None
+            self._commit_move(imap, job, dry_run)
+        return None
+
+    def _commit_move(self, imap: imaplib.IMAP4_SSL, job, dry_run: bool = False) -> None:
+        email_uid, winning_folder = job["uid"], job["winner"]
+        trimmed_header, cats = job["trimmed_header"], job["cats"]
+        if not dry_run:
+            print("* Moving message to %s" % winning_folder)
+            ensure_selected(imap, self.todo_folder)
+            typ, data = imap.uid('MOVE', email_uid, '"%s"' % winning_folder)
+            if typ == 'OK':
+                self._checkpoint(job, "moved", dry_run)
+                dst_uid = None
+                info = self._extract_copyuid((typ, data)) or self._extract_copyuid(('OK', getattr(imap, 'untagged_responses', {}).get('OK', [])))
+                if info:
+                    _uidv, src_uids, dst_uids = info
+                    try: dst_uid = dst_uids[src_uids.index(int(email_uid))]  # map src->dst
+                    except Exception: 
                         dst_uid = None
-                        info = self._extract_copyuid((typ, data)) or self._extract_copyuid(('OK', getattr(imap, 'untagged_responses', {}).get('OK', [])))
-                        if info:
-                            _uidv, src_uids, dst_uids = info
-                            try: dst_uid = dst_uids[src_uids.index(int(email_uid))]  # map src->dst
-                            except Exception: 
-                                dst_uid = None
-
-                        # --- DB upsert to reflect move (md5 on trimmed_header; hexdigest on categories+trimmed_header) ---
-                        md5sum = hashlib.md5(trimmed_header.encode('utf-8')).hexdigest()         
-                        self.db.execute(
-                            "INSERT INTO nilsimsa (uid, folder, hexdigest, md5sum, trimmed_header, categories, moved_from, message_id) VALUES (%s,%s,%s,%s,%s,%s,%s,%s)",
-                            (dst_uid, winning_folder, source_hexdigest, md5sum, trimmed_header, cats, self.todo_folder, message_id)
-                        )
-                        self.logger.info("Moved email %s to %s (dst UID: %s)", email_uid, winning_folder, dst_uid)
-                    else:
-                        self.logger.error("MOVE failed for %s -> %s", email_uid, winning_folder)
-                else:
-                    print("Dry run: would have moved %s to folder %s" % (email_uid, winning_folder))
+
+                # --- DB upsert to reflect move (md5 on trimmed_header; hexdigest on categories+trimmed_header) ---
+                md5sum = self._md5(trimmed_header)
+                self.db.execute(
+                    "INSERT INTO nilsimsa (uid, folder, hexdigest, md5sum, trimmed_header, categories, moved_from, message_id, account) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)",
+                    (dst_uid, winning_folder, job["source_hexdigest"], md5sum, trimmed_header, cats, self.todo_folder.strip('"'), job["message_id"], self.account)
+                )
+                if dst_uid is not None:
+                    self._corpus_add(winning_folder, dst_uid, job["source_hexdigest"])
+                self._route_learn(job.get("msg") or job["raw_header"], winning_folder)
+                self.logger.info("Moved email %s to %s (dst UID: %s)", email_uid, winning_folder, dst_uid)
+                METRICS.inc("messages_sorted", folder=winning_folder)
+            else:
+                self.logger.error("MOVE failed for %s -> %s", email_uid, winning_folder)
+        else:
+            print("Dry run: would have moved %s to folder %s" % (email_uid, winning_folder))
 
     # ------------------------------ archive ------------------------------
-    def archive_emails(self, imap: imaplib.IMAP4_SSL, dry_run: bool = False) -> None:
-        """Archive or delete old emails according to config (unchanged logic)."""
+    # Archiving runs every [archive] interval seconds at most, and only scans
+    # the folders whose watermark in archive_state says they may hold newly
+    # eligible mail: the time their oldest remaining seen message crosses the
+    # age limit has come, or STATUS UIDNEXT/UNSEEN moved (mail arrived or was
+    # read, and may already be old). Watermarks look at most a day ahead, so
+    # every folder is still scanned at least daily.
+    ARCHIVE_LOOKAHEAD = 24 * 60 * 60
+
+    def archive_emails(self, imap: imaplib.IMAP4_SSL, dry_run: bool = False, force: bool = False,
+                       parallel: bool = True) -> None:
+        """Archive or delete old emails according to config, in the folders that are due.
+
+        Without *force* nothing happens until [archive] interval has passed
+        since the last check. Due folders are scanned in parallel over the
+        IMAP pool when configured and *parallel* is set.
+        """
         if not self.archive_folder or self.archive_after <= 0:
             return
 
+        now = int(time.time())
+        marks = self._archive_marks()
+        if not force and set(self.imap_folders) <= marks.keys() and \
+                now - min(marks[f]["checked"] for f in self.imap_folders) < self.archive_interval:
+            return
+        print("Archiving messages")
+        status = {f: self._archive_status(imap, f) for f in self.imap_folders}
+        due = [f for f in self.imap_folders
+               if f not in marks or now >= marks[f]["due"] or status[f] is None
+               or status[f] != (marks[f]["uidnext"], marks[f]["unseen"])]
+        self.logger.info("Archive: %d of %d folders due", len(due), len(self.imap_folders))
+
         seconds_threshold = self.archive_after * 24 * 60 * 60
+        pool = self.imap_helper.pool() if parallel else None
+        if pool is None:
+            found = [self._archive_folder(imap, folder, seconds_threshold, dry_run) for folder in due]
+        else:
+            def scan(folder):
+                with pool.connection() as conn:
+                    return self._archive_folder(conn, folder, seconds_threshold, dry_run)
+
+            with ThreadPoolExecutor(max_workers=pool.size) as workers:
+                found = list(workers.map(scan, due))
+
+        if dry_run:
+            return
+        next_due = dict(zip(due, found))
         for folder in self.imap_folders:
-            print("Checking %s for messages to archive older than %d seconds" % (folder, seconds_threshold))
-            try:
-                imap.select('"%s"' % folder, readonly=False)
-                result, data = imap.uid('search', None, "(SEEN OLDER %d)" % seconds_threshold)
-            except Exception as e:
-                self.logger.error("Error selecting folder %s: %s", folder, e)
+            if status[folder] is None:
                 continue
+            when = next_due.get(folder) if folder in next_due else marks[folder]["due"]
+            self.db.execute(
+                "INSERT INTO archive_state (account, folder, checked, due, uidnext, unseen) "
+                "VALUES (%s, %s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE checked = VALUES(checked), "
+                "due = VALUES(due), uidnext = VALUES(uidnext), unseen = VALUES(unseen)",
+                (self.account, folder, now, now if when is None else when) + status[folder],
+            )
+
+    def _archive_marks(self) -> Dict[str, dict]:
+        rows = self.db.fetchall("SELECT folder, checked, due, uidnext, unseen FROM archive_state WHERE account = %s",
+                                (self.account,))
+        return {folder: {"checked": checked or 0, "due": due or 0, "uidnext": uidnext, "unseen": unseen}
+                for folder, checked, due, uidnext, unseen in rows}
+
+    @staticmethod
+    def _archive_status(imap: imaplib.IMAP4_SSL, folder: str) -> Optional[Tuple[int, int]]:
+        """(UIDNEXT, UNSEEN) of *folder* from one STATUS, without selecting it; None if unreadable."""
+        try:
+            typ, data = imap.status('"%s"' % folder, "(UIDNEXT UNSEEN)")
+        except Exception:
+            return None
+        found = dict(re.findall(rb"(UIDNEXT|UNSEEN) (\d+)", data[0] or b"")) if typ == "OK" and data else {}
+        if len(found) < 2:
+            return None
+        return int(found[b"UIDNEXT"]), int(found[b"UNSEEN"])
+
+    def _archive_start(self, dry_run: bool = False) -> Optional[threading.Event]:
+        """Archive on a connection of its own every [archive] interval, off the sorting path.
+
+        Returns the event that stops the thread, or None when archiving is off.
+        """
+        if not self.archive_folder or self.archive_after <= 0:
+            return None
+        stop = threading.Event()
+
+        def run():
+            while not stop.is_set():
+                try:
+                    imap = self.imap_helper.open_connection()
+                    try:
+                        self.archive_emails(imap, dry_run, force=True, parallel=False)
+                    finally:
+                        try: imap.logout()
+                        except Exception: pass
+                except Exception as e:
+                    self.logger.error("Archiving error: %s", e)
+                stop.wait(self.archive_interval)
 
-            if (payload := (data[0] if data and data[0] else None)):
-                email_uids = payload.decode().split()
-                n = len(email_uids)
-                print(f"Found {n} emails to consider for archiving in folder {folder}")
-                self.logger.info("Found %d emails in %s for archive", n, folder)
+        threading.Thread(target=run, name="archive-%s" % (self.account or "default"), daemon=True).start()
+        return stop
+
+    def _archive_folder(self, imap: imaplib.IMAP4_SSL, folder: str, seconds_threshold: int,
+                        dry_run: bool = False) -> Optional[int]:
+        """Archive the eligible mail of *folder*; return when the next message becomes eligible (None on error)."""
+        print("Checking %s for messages to archive older than %d seconds" % (folder, seconds_threshold))
+        try:
+            ensure_selected(imap, '"%s"' % folder)
+            result, data = imap.uid('search', None, "(SEEN OLDER %d)" % seconds_threshold)
+        except Exception as e:
+            self.logger.error("Error selecting folder %s: %s", folder, e)
+            return None
+
+        if (payload := (data[0] if data and data[0] else None)):
+            email_uids = payload.decode().split()
+            n = len(email_uids)
+            print(f"Found {n} emails to consider for archiving in folder {folder}")
+            self.logger.info("Found %d emails in %s for archive", n, folder)
+        else:
+            email_uids = []
+
+        for email_uid in email_uids:
+            target_folder = self.trash_folder if (self.just_delete and folder in self.just_delete) else self.archive_folder
+            if not dry_run:
+                result_copy = imap.uid('COPY', email_uid, '"%s"' % target_folder)
+                if result_copy[0] == 'OK':
+                    imap.uid('STORE', email_uid, '+FLAGS', '(\\Deleted)')
+                    imap.expunge()
             else:
-                email_uids = []
+                print("Dry run: message %s from folder %s would be archived to %s" % (email_uid, folder, target_folder))
+        try:
+            return self._archive_next_due(imap, seconds_threshold)
+        except Exception as e:
+            self.logger.error("Archive watermark of %s failed: %s", folder, e)
+            return None
 
-            for email_uid in email_uids:
-                target_folder = self.trash_folder if (self.just_delete and folder in self.just_delete) else self.archive_folder
-                if not dry_run:
-                    result_copy = imap.uid('COPY', email_uid, '"%s"' % target_folder)
-                    if result_copy[0] == 'OK':
-                        imap.uid('STORE', email_uid, '+FLAGS', '(\\Deleted)')
-                        imap.expunge()
-                else:
-                    print("Dry run: message %s from folder %s would be archived to %s" % (email_uid, folder, target_folder))
+    def _archive_next_due(self, imap: imaplib.IMAP4_SSL, seconds_threshold: int) -> int:
+        """When the oldest seen message left in the selected folder gets old enough (at most a day ahead)."""
+        now = int(time.time())
+        result, data = imap.uid('search', None, "(SEEN OLDER %d)" % max(0, seconds_threshold - self.ARCHIVE_LOOKAHEAD))
+        uids = data[0].decode().split() if data and data[0] else []
+        if not uids:
+            return now + self.ARCHIVE_LOOKAHEAD
+        result, data = imap.uid('fetch', ','.join(uids), '(INTERNALDATE)')
+        dates = [time.mktime(imaplib.Internaldate2tuple(item)) for item in data or []
+                 if isinstance(item, bytes) and b'INTERNALDATE' in item]
+        return int(min(dates)) + seconds_threshold if dates else now
 
     # ------------------------------ housekeeping ------------------------------
     def prune_considered(self) -> None:
-        """Delete old rows from 'considered' to avoid reprocessing."""
+        """Delete old rows from 'considered' to avoid reprocessing.
+
+        Checkpoints expire with them: a message still in todo after
+        reconsider_after is sorted from scratch.
+        """
         now = int(time.time())
         delete_older_than = now - self.reconsider_after - random.randint(0, self.reconsider_after)
         self.db.execute("DELETE FROM considered WHERE considered_when < %s", (delete_older_than,))
@@ -736,17 +1776,21 @@ Guidance:
     def _imap_connect(self):
         return self.imap_helper.connect()
 
-    def _process_core(self, imap, dry_run=False, debug=False, quiet=False):
-        """Core logic for archiving and sorting mail, shared by process/process_with_idle."""
-        self.prune_considered()
-        print("Archiving messages")
-        try:
-            self.archive_emails(imap, dry_run)
-        except Exception as e:
-            self.logger.error("Archiving error: %s", e)
+    def _process_core(self, imap, dry_run=False, debug=False, quiet=False, uids=None, archive=True):
+        """Core logic for sorting and archiving mail, shared by process/process_with_idle.
 
+        New mail is sorted first; archiving (when *archive*, i.e. not handed
+        to the archive thread) only runs afterwards and only if due.
+        """
+        self.prune_considered()
         print("Sorting mail")
-        self.autosort_inbox(imap, dry_run, debug, quiet)
+        self.autosort_inbox(imap, dry_run, debug, quiet, uids=uids)
+        if archive:
+            try:
+                self.archive_emails(imap, dry_run)
+            except Exception as e:
+                self.logger.error("Archiving error: %s", e)
+        METRICS.write_textfile()
 
     def process(self, dry_run: bool = False, debug: bool = False, quiet: bool = False) -> None:
         print("\n-----\nProcessing at %s" % time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()))
@@ -754,76 +1798,207 @@ Guidance:
         try:
             self._process_core(imap, dry_run, debug, quiet)
         finally:
+            self.close_hash_pool()
             self.imap_helper.close()
 
-    def process_with_idle(self, dry_run=False, debug=False, quiet=False, loop=False, idle_timeout=900, poll_interval=60):
+    def process_with_idle(self, dry_run=False, debug=False, quiet=False, loop=False, idle_timeout=900, poll_interval=60,
+                          max_iterations=None):
+        """Sort, then wait for new mail and sort again; stop after *max_iterations* sorting passes if given."""
         print("\n-----\nProcessing at %s" % time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()))
         imap = self._imap_connect()
+        uids = None  # first pass sorts everything UNSEEN
+        iterations = 0
+        archiver = self._archive_start(dry_run) if loop else None
         try:
             while True:
-                self._process_core(imap, dry_run, debug, quiet)
-                self.idle_or_poll(imap, self.todo_folder, poll_interval=poll_interval, idle_timeout=idle_timeout)
+                self._process_core(imap, dry_run, debug, quiet, uids=uids, archive=not loop)
+                iterations += 1
+                if max_iterations and iterations >= max_iterations:
+                    break
+                uids = self.idle_or_poll(imap, self.todo_folder, poll_interval=poll_interval, idle_timeout=idle_timeout)
                 if not loop:
                     break
         finally:
+            if archiver is not None:
+                archiver.set()
+            self._idle_session = None
+            self.close_hash_pool()
             self.imap_helper.close()
 
     def supports_idle(self, imap: imaplib.IMAP4_SSL) -> bool:
-        """Check if the IMAP server supports the IDLE extension."""
+        """Check if the IMAP server supports the IDLE extension (cached at login)."""
+        if self.imap_helper.imap is not imap:
+            self.imap_helper.capabilities = IMAPHelper._load_capabilities(imap)
+            self.imap_helper.imap = imap
+        return self.imap_helper.has_capability("IDLE")
+
+    def idle_or_poll(self, imap: imaplib.IMAP4_SSL, folder: str, poll_interval: int = 60,
+                     idle_timeout: int = 900) -> Optional[List[str]]:
+        """
+        Wait for new mail using IDLE if supported, else poll every poll_interval seconds.
+        Only returns when new mail is detected: the UIDs announced via IDLE, or
+        None when polling (meaning: sort everything UNSEEN).
+        """
+        if self.supports_idle(imap):
+            session = self._idle_session
+            if session is None or session.imap is not imap or session.folder != folder:
+                session = self._idle_session = IdleSession(imap, folder, self.logger)
+            self.logger.info("Waiting for new mail using IMAP IDLE...")
+            try:
+                uids = session.wait(idle_timeout)
+                self.logger.info("IMAP IDLE: new mail detected (UIDs %s).", ",".join(uids))
+                return uids
+            except (imaplib.IMAP4.error, OSError) as e:
+                # fall back to polling for this round; a broken connection fails there too
+                self.logger.warning("IMAP IDLE failed: %s", e)
+                self._idle_session = None
+        while True:
+            if self.todo_count(imap) > 0:
+                return None
+            self.logger.info("Waiting for new mail (polling every %ds)...", poll_interval)
+            time.sleep(poll_interval)
+
+# ------------------------------ multi-account ------------------------------
+
+def account_names(config_path: str) -> List[str]:
+    """Names of the [account:NAME] sections in *config_path* (empty for a classic single-[imap] config)."""
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    return [s[len(ACCOUNT_PREFIX):] for s in config.sections() if s.startswith(ACCOUNT_PREFIX)]
+
+def apply_account_section(config: configparser.ConfigParser, account: str) -> None:
+    """Overlay [account:NAME] onto [imap] so the rest of the sorter is account-agnostic."""
+    section = ACCOUNT_PREFIX + account
+    if not config.has_section(section):
+        sys.exit("No [%s] section in config" % section)
+    if not config.has_section("imap"):
+        config.add_section("imap")
+    for key in config.options(section):
+        config.set("imap", key, config.get(section, key, raw=True))
+
+def todo_unseen(config_path: str, account: Optional[str] = None) -> Optional[int]:
+    """UNSEEN count of the todo folder from a single STATUS; None if it could not be read.
+
+    Needs only the config and one IMAP login: no flock, no database, no
+    sorter state.
+    """
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    if account:
+        apply_account_section(config, account)
+    try:
+        imap = IMAPHelper(config).open_connection()
+    except Exception:
+        return None
+    try:
+        typ, data = imap.status('"%s"' % config.get("imap", "todo"), "(UNSEEN)")
+        m = re.search(rb"\(.*UNSEEN (\d+)", data[0] or b"") if typ == "OK" and data else None
+        return int(m.group(1)) if m else None
+    except Exception:
+        return None
+    finally:
         try:
-            typ, data = imap.capability()
-            if typ == "OK" and data:
-                caps = b" ".join(data).upper()
-                return b"IDLE" in caps
-        except Exception as e:
-            if hasattr(self, "logger") and self.logger:
-                self.logger.warning("Error checking IMAP capabilities: %s", e)
+            imap.logout()
+        except Exception:
+            pass
+
+def archive_due(config_path: str, account: Optional[str] = None) -> bool:
+    """True when archive_emails() would check the folders now; unreadable state counts as due.
+
+    The same gate archive_emails() applies, from one query on archive_state:
+    a folder without a watermark, or an oldest check older than [archive]
+    interval. No flock and no sorter state.
+    """
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    if account:
+        apply_account_section(config, account)
+    if not config.get("archive", "folder", fallback=None) or config.getint("archive", "after", fallback=0) <= 0:
+        return False
+    folders = [f.strip() for f in config.get("imap", "folders", fallback="").split(",") if f.strip()]
+    try:
+        db = DatabaseHelper(config.get("mysql", "password"),
+                            config.get("general", "version", fallback=DEFAULT_VERSION),
+                            logging.getLogger("imap_nilsimsa").getChild("DatabaseHelper"))
+    except (Exception, SystemExit):  # DatabaseHelper exits when MySQL is unreachable
+        return True
+    try:
+        checked = {f: c or 0 for f, c in db.fetchall("SELECT folder, checked FROM archive_state WHERE account = %s",
+                                                       (account or "",))}
+    except Exception:
+        return True
+    finally:
+        db.close()
+    return not set(folders) <= checked.keys() or \
+        time.time() - min(checked[f] for f in folders) >= config.getint("archive", "interval", fallback=3600)
+
+def nothing_to_sort(config_path: str, accounts: List[str]) -> bool:
+    """True when [general] quick_check is on and no account has unseen todo mail or archiving due."""
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    if config.getboolean("general", "maintenance", fallback=False) or \
+            not config.getboolean("general", "quick_check", fallback=True):
         return False
+    accounts = accounts or [None]
+    return all(todo_unseen(config_path, account) == 0 for account in accounts) and \
+        not any(archive_due(config_path, account) for account in accounts)
+
+class MultiAccountDaemon:
+    """Serve several [account:NAME] mailboxes from one process.
+
+    Mirrors the IMAPAutoSorter entry points (process / process_with_idle) so
+    main() can drive either. Every account gets its own sorter and flock; all
+    of them share one DatabaseHelper and one cold-build process pool. In loop
+    mode each account waits on IDLE (or polls) in its own thread, and a failing
+    account is restarted after *retry_after* seconds without disturbing the rest.
+    """
 
-    def idle_wait(self, imap: imaplib.IMAP4_SSL, folder: str, timeout: int = 900) -> bool:
-        """
-        Enter IMAP IDLE mode and wait for a new message or timeout.
-        Returns True if new mail is detected, False if timeout.
-        """
+    def __init__(self, config_path: str, accounts: List[str], retry_after: int = 60):
+        self.retry_after = retry_after
+        first = IMAPAutoSorter(config_path, accounts[0])  # per-account flock acquired here
+        self.sorters = [first] + [IMAPAutoSorter(config_path, name, db=first.db) for name in accounts[1:]]
+        self.maintenance = first.maintenance
+        self.logger = logging.getLogger("imap_nilsimsa").getChild(self.__class__.__name__)
+
+    def _share_hash_pool(self) -> "concurrent.futures.ProcessPoolExecutor":
+        # created lazily: daemonizing closes inherited descriptors, so not before
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.sorters[0].cold_build_workers)
+        for sorter in self.sorters:
+            sorter.hash_pool = pool
+        return pool
+
+    def process(self, dry_run: bool = False, debug: bool = False, quiet: bool = False) -> None:
+        pool = self._share_hash_pool()
         try:
-            imap.select(folder, readonly=False)
-            if not hasattr(imap, 'sock'):
-                return False
-            imap.send(b'IDLE\r\n')
-            r, _, _ = select.select([imap.sock], [], [], timeout)
-            if r:
-                resp = imap.sock.recv(4096)
-                imap.send(b'DONE\r\n')
-                imap._get_response()
-                return True
-            else:
-                imap.send(b'DONE\r\n')
-                imap._get_response()
-                return False
-        except Exception as e:
-            if hasattr(self, "logger") and self.logger:
-                self.logger.warning("IMAP IDLE failed: %s", e)
-            return False
+            for sorter in self.sorters:
+                try:
+                    sorter.process(dry_run=dry_run, debug=debug, quiet=quiet)
+                except Exception as e:
+                    self.logger.error("Account %s failed: %s", sorter.account, e)
+        finally:
+            pool.shutdown()
 
-    def idle_or_poll(self, imap: imaplib.IMAP4_SSL, folder: str, poll_interval: int = 60, idle_timeout: int = 900) -> None:
-        """
-        Wait for new mail using IDLE if supported, else poll every poll_interval seconds.
-        Only returns when new mail is detected.
-        """
-        if self.supports_idle(imap):
-            while True:
-                if self.todo_count(imap) > 0:
-                    break
-                self.logger.info("Waiting for new mail using IMAP IDLE...")
-                if self.idle_wait(imap, folder, timeout=idle_timeout):
-                    self.logger.info("IMAP IDLE: new mail detected.")
-                    break
-        else:
-            while True:
-                if self.todo_count(imap) > 0:
-                    break
-                self.logger.info("Waiting for new mail (polling every %ds)...", poll_interval)
-                time.sleep(poll_interval)
+    def process_with_idle(self, **kwargs) -> None:
+        pool = self._share_hash_pool()
+        threads = [threading.Thread(target=self._serve, args=(sorter, kwargs),
+                                    name="account-%s" % sorter.account, daemon=True)
+                   for sorter in self.sorters]
+        try:
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            pool.shutdown()
+
+    def _serve(self, sorter: IMAPAutoSorter, kwargs) -> None:
+        while True:
+            try:
+                sorter.process_with_idle(**kwargs)
+                return  # only returns when not looping or after max_iterations
+            except Exception as e:
+                self.logger.error("Account %s failed: %s; restarting in %ds", sorter.account, e, self.retry_after)
+                time.sleep(self.retry_after)
 
 # ------------------------------ CLI ------------------------------
 
@@ -835,35 +2010,75 @@ def main() -> None:
     parser.add_argument("--dry-run", action="store_true", help="Perform a dry run without moving emails")
     parser.add_argument("--config", type=str, default="etc/imap_autosort.conf", help="Path to configuration file")
     parser.add_argument("--daemon", action="store_true", help="Run as a background daemon (requires python-daemon)")
+    parser.add_argument("--account", action="append", metavar="NAME",
+                        help="Only serve this [account:NAME] section (repeatable; default: all of them)")
+    parser.add_argument("--profile", metavar="DIR",
+                        help="Profile the run; write .pstats, .collapsed stacks and per-message traces into DIR")
+    parser.add_argument("--profile-mode", choices=RunProfiler.MODES, default="deterministic",
+                        help="deterministic (cProfile in all threads) or sampling (stack sampler only)")
+    parser.add_argument("--profile-iterations", type=int, default=0, metavar="N",
+                        help="With --loop/--daemon, stop after N sorting passes (0 = never)")
     args = parser.parse_args()
+    profile_dir = os.path.abspath(args.profile) if args.profile else None
 
     # Optionally change directory to the script location
     if os.path.dirname(sys.argv[0]):
         os.chdir(os.path.dirname(sys.argv[0]))
 
-    sorter = IMAPAutoSorter(args.config)  # flock acquired here
-
-    if sorter.maintenance:
-        sys.exit('Under Maintenance')
+    accounts = args.account or account_names(args.config)
+    if not (args.daemon or args.loop > 0 or profile_dir) and nothing_to_sort(args.config, accounts):
+        if not args.quiet:
+            print("No unseen mail in the todo folder and no archiving due; nothing to do")
+        return
+
+    loop_kwargs = dict(dry_run=args.dry_run, debug=args.debug, quiet=args.quiet, loop=True, poll_interval=60,
+                       max_iterations=args.profile_iterations or None)
+
+    def run():
+        # Built in the process that sorts: the daemonizing fork keeps no threads (the
+        # log QueueListener) and DaemonContext closes inherited descriptors (log file,
+        # flock, DB connection)
+        if accounts:
+            sorter = MultiAccountDaemon(args.config, accounts)  # per-account flocks acquired here
+        else:
+            sorter = IMAPAutoSorter(args.config)  # flock acquired here
+
+        if sorter.maintenance:
+            sys.exit('Under Maintenance')
+
+        profiler = RunProfiler(profile_dir, args.profile_mode) if profile_dir else nullcontext()
+        for s in getattr(sorter, "sorters", [sorter]):
+            s.profiler = profiler if profile_dir else None
+        service = None
+        if args.daemon or args.loop > 0:
+            # resident: answer delivery hooks from the corpora the loop keeps in step
+            from scoring_service import from_config
+            service = from_config(getattr(sorter, "sorters", [sorter]))
+        try:
+            with profiler:
+                # Use IDLE/polling only if daemon or loop mode
+                if args.daemon:
+                    sorter.process_with_idle(idle_timeout=int(args.loop) if args.loop > 0 else 900, **loop_kwargs)
+                elif args.loop and args.loop > 0:
+                    sorter.process_with_idle(idle_timeout=int(args.loop), **loop_kwargs)
+                else:
+                    sorter.process(dry_run=args.dry_run, debug=args.debug, quiet=args.quiet)
+        finally:
+            if service is not None:
+                service.stop()
 
-    # Use IDLE/polling only if daemon or loop mode
     if args.daemon:
         try:
             import daemon
         except ImportError:
             sys.exit("python-daemon is required for --daemon mode. Install with: pip install python-daemon")
-        with daemon.DaemonContext():
-            sorter.process_with_idle(
-                dry_run=args.dry_run, debug=args.debug, quiet=args.quiet,
-                loop=True, idle_timeout=int(args.loop) if args.loop > 0 else 900, poll_interval=60
-            )
-    elif args.loop and args.loop > 0:
-        sorter.process_with_idle(
-            dry_run=args.dry_run, debug=args.debug, quiet=args.quiet,
-            loop=True, idle_timeout=int(args.loop), poll_interval=60
-        )
+        umask = os.umask(0)
+        os.umask(umask)
+        # keep the directory (relative config and log paths) and umask the sorter was started with
+        with daemon.DaemonContext(working_directory=os.getcwd(), umask=umask):
+            run()
     else:
-        sorter.process(dry_run=args.dry_run, debug=args.debug, quiet=args.quiet)
+        run()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,151 @@
+# metrics.py
+import bisect
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implicit
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_NULL_TIMER = nullcontext()
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Metrics:
+    """Counters and latency histograms rendered in Prometheus text format.
+
+    Disabled by default: timer() then hands back one shared no-op context
+    manager and inc()/observe() return at once, so instrumented hot paths
+    cost a single attribute check. Series are keyed by metric name plus a
+    sorted label tuple; all updates go through one lock.
+    """
+
+    def __init__(self, prefix="imap_nilsimsa"):
+        self.prefix = prefix
+        self.enabled = False
+        self.textfile = None
+        self._lock = threading.Lock()
+        self._counters = {}    # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum, count]
+        self._server = None
+
+    # ------------------------------ setup ------------------------------
+    def configure(self, config, section="metrics"):
+        """Enable from a config section: enabled, textfile, http_port, http_host."""
+        if not config.getboolean(section, "enabled", fallback=False):
+            return
+        self.enabled = True
+        self.textfile = config.get(section, "textfile", fallback=None) or None
+        port = config.getint(section, "http_port", fallback=0)
+        if port and self._server is None:
+            self.serve(config.get(section, "http_host", fallback="127.0.0.1"), port)
+
+    def serve(self, host, port):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+
+    # ------------------------------ recording ------------------------------
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = [0] * (len(BUCKETS) + 3)
+            h[bisect.bisect_left(BUCKETS, seconds)] += 1
+            h[-2] += seconds
+            h[-1] += 1
+
+    def timer(self, name, **labels):
+        """Context manager recording the elapsed time of its block into histogram *name*."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    # ------------------------------ export ------------------------------
+    @staticmethod
+    def _labels(labels, extra=()):
+        items = list(labels) + list(extra)
+        if not items:
+            return ""
+        return "{" + ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                              for k, v in items) + "}"
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((k, list(v)) for k, v in self._histograms.items())
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            full = "%s_%s_total" % (self.prefix, name)
+            if full not in typed:
+                typed.add(full)
+                lines.append("# TYPE %s counter" % full)
+            lines.append("%s%s %s" % (full, self._labels(labels), value))
+        for (name, labels), h in histograms:
+            full = "%s_%s_seconds" % (self.prefix, name)
+            if full not in typed:
+                typed.add(full)
+                lines.append("# TYPE %s histogram" % full)
+            cumulative = 0
+            for bound, n in zip(BUCKETS + ("+Inf",), h[:-2]):
+                cumulative += n
+                lines.append("%s_bucket%s %d" % (full, self._labels(labels, [("le", bound)]), cumulative))
+            lines.append("%s_sum%s %.6f" % (full, self._labels(labels), h[-2]))
+            lines.append("%s_count%s %d" % (full, self._labels(labels), h[-1]))
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path=None):
+        """Atomically write the current metrics (node_exporter textfile collector format)."""
+        path = path or self.textfile
+        if not (self.enabled and path):
+            return
+        tmp = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp, "w") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+# Process-wide registry shared by the sorter, IMAP and DB helpers
+METRICS = Metrics()
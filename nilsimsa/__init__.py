@@ -40,6 +40,8 @@ Python port of ruby version that was inspired by a perl version:
 
 # $ Id: $
 
+import struct
+
 # table used in computing trigram statistics
 #   TRAN[x] is the accumulator that should be incremented when x
 #   is the value observed from hashing a triplet of recently
@@ -84,14 +86,25 @@ POPC = [ord(x) for x in
     "\x03\x04\x04\x05\x04\x05\x05\x06\x04\x05\x05\x06\x05\x06\x06\x07"\
     "\x04\x05\x05\x06\x05\x06\x06\x07\x05\x06\x06\x07\x06\x07\x07\x08"]
 
+# serialized state: count, last four chars, number of first chars kept,
+# first four chars (-1 padded), then the 256 accumulators
+STATE = struct.Struct("<Q4iB4i256I")
+
 class Nilsimsa(object):
-    """Nilsimsa code calculator."""
+    """Nilsimsa code calculator.
+
+    The running state (accumulators, count, last and first four characters)
+    can be serialized with state()/from_state(), and the states of two
+    adjacent pieces of text combined with merge(), giving exactly the
+    digest of hashing them in one pass.
+    """
 
     def __init__(self, data=None):
         """Nilsimsa calculator, w/optional list of initial data chunks."""
         self.count = 0          # num characters seen
         self.acc = [0]*256      # accumulators for computing digest
         self.lastch = [-1]*4    # last four seen characters (-1 until set)
+        self.firstch = []       # first four seen characters (for merge)
         if data:
             for chunk in data:
                 self.update(chunk)
@@ -100,9 +113,14 @@ class Nilsimsa(object):
         """Get accumulator for a transition n between chars a, b, c."""
         return (((TRAN[(a+n)&255]^TRAN[b]*(n+n+1))+TRAN[(c)^TRAN[n]])&255)
   
-    def update(self, data):
+    def update(self, data, weight=1):
         """Add data to running digest, increasing the accumulators for 0-8
-           triplets formed by this char and the previous 0-3 chars."""
+           triplets formed by this char and the previous 0-3 chars.
+           With weight, same as update(data * weight)."""
+        if weight != 1:
+            return self._update_repeated(data, weight)
+        if len(self.firstch) < 4:
+            self.firstch.extend(ord(c) for c in data[:4 - len(self.firstch)])
         for character in data:
             ch = ord(character)
             self.count += 1
@@ -123,6 +141,68 @@ class Nilsimsa(object):
             # adjust last seen chars
             self.lastch = [ch] + self.lastch[:3]
 
+    def _update_repeated(self, data, weight):
+        """update(data * weight) by merging doubled states: the text is
+           hashed once, then O(256 log weight) whatever the weight."""
+        if weight <= 0 or not data:
+            return
+        power = Nilsimsa()
+        power.update(data)
+        repeated = Nilsimsa()
+        while weight:
+            if weight & 1:
+                repeated = repeated.merge(power)
+            weight >>= 1
+            if weight:
+                power = power.merge(power)
+        merged = self.merge(repeated)
+        self.count, self.acc, self.lastch, self.firstch = merged.count, merged.acc, merged.lastch, merged.firstch
+
+    def copy(self):
+        """Independent copy of the running state."""
+        other = Nilsimsa()
+        other.count = self.count
+        other.acc = list(self.acc)
+        other.lastch = list(self.lastch)
+        other.firstch = list(self.firstch)
+        return other
+
+    def merge(self, other):
+        """New state for this data followed by other's data, as if
+           hashed in one pass. other's first four characters are replayed
+           twice: after our last characters (the trigrams spanning the
+           boundary) and from scratch (the ones other counted without that
+           context, which are taken back out). O(256) whatever the lengths."""
+        head = "".join(map(chr, other.firstch))
+        merged = self.copy()
+        merged.update(head)
+        alone = Nilsimsa()
+        alone.update(head)
+        acc = merged.acc
+        for i in range(256):
+            acc[i] += other.acc[i] - alone.acc[i]
+        merged.count = self.count + other.count
+        if other.count > 4:
+            merged.lastch = list(other.lastch)
+        merged.firstch = (self.firstch + other.firstch)[:4]
+        return merged
+
+    def state(self):
+        """Running state as compact bytes (see from_state)."""
+        first = self.firstch + [-1]*(4 - len(self.firstch))
+        return STATE.pack(self.count, *(self.lastch + [len(self.firstch)] + first + self.acc))
+
+    @classmethod
+    def from_state(cls, blob):
+        """Calculator continuing from bytes returned by state()."""
+        fields = STATE.unpack(blob)
+        n = cls()
+        n.count = fields[0]
+        n.lastch = list(fields[1:5])
+        n.firstch = list(fields[6:6 + fields[5]])
+        n.acc = list(fields[10:])
+        return n
+
     def digest(self):
         """Get digest of data seen thus far as a list of bytes."""
         total = 0                           # number of triplets seen
@@ -198,3 +278,9 @@ def selftest( name=None, opt=None, value=None, parser=None ):
         '14c811840010000c0328200108040630041890200217582d4098103280000078'))
     print("compare:\t%s" % str(n1.compare(n2.digest())==109))
     print("compare:\t%s" % str(n1.compare(n2.hexdigest(), ishex=True)==109))
+    n3 = Nilsimsa(["abcdef"]).merge(Nilsimsa(["ghijk"]))
+    print("merge:\t\t%s" % str(n3.hexdigest()==n1.hexdigest()))
+    n4 = Nilsimsa(["ab"])
+    n4.update("cdefgh", weight=5)
+    print("weight:\t\t%s" % str(n4.hexdigest()==Nilsimsa(["ab" + "cdefgh"*5]).hexdigest()))
+    print("state:\t\t%s" % str(Nilsimsa.from_state(n3.state()).hexdigest()==n1.hexdigest()))
@@ -0,0 +1,103 @@
+# pipeline.py
+import queue
+import threading
+
+_DONE = object()
+
+
+class Pipeline:
+    """Run items through stages connected by bounded queues.
+
+    *stages* is a list of (name, fn, workers). Each stage runs *workers*
+    threads calling fn(item); the return value goes to the next stage, None
+    drops the item. Queues hold at most *maxsize* items, so a slow stage
+    blocks the ones feeding it (back-pressure) instead of buffering without
+    bound. The first exception (including SystemExit) stops every stage and
+    is re-raised by run() in the calling thread.
+    """
+
+    POLL = 0.1  # seconds between stop-flag checks while blocked on a queue
+
+    def __init__(self, stages, maxsize=4, logger=None):
+        self.stages = [(name, fn, max(1, int(workers))) for name, fn, workers in stages]
+        self.maxsize = max(1, int(maxsize))
+        self.logger = logger
+        self._stop = threading.Event()
+        self._error = None
+        self._error_lock = threading.Lock()
+
+    def _fail(self, exc):
+        with self._error_lock:
+            if self._error is None:
+                self._error = exc
+        self._stop.set()
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=self.POLL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=self.POLL)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _feed(self, source, q):
+        try:
+            for item in source:
+                if not self._put(q, item):
+                    return
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._put(q, _DONE)
+
+    def _work(self, name, fn, inq, outq, remaining, lock):
+        try:
+            while True:
+                item = self._get(inq)
+                if item is _DONE:
+                    self._put(inq, _DONE)  # let sibling workers see the end marker too
+                    break
+                out = fn(item)
+                if out is not None and outq is not None:
+                    if not self._put(outq, out):
+                        break
+        except BaseException as e:
+            if self.logger:
+                self.logger.error("Pipeline stage %s failed: %s", name, e)
+            self._fail(e)
+        finally:
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last and outq is not None:
+                self._put(outq, _DONE)
+
+    def run(self, source):
+        """Push every item of *source* through all stages; return when drained."""
+        self._stop.clear()
+        self._error = None
+        queues = [queue.Queue(self.maxsize) for _ in self.stages]
+        threads = [threading.Thread(target=self._feed, args=(source, queues[0]),
+                                    name="pipeline-source", daemon=True)]
+        for i, (name, fn, workers) in enumerate(self.stages):
+            outq = queues[i + 1] if i + 1 < len(queues) else None
+            remaining, lock = [workers], threading.Lock()
+            for n in range(workers):
+                threads.append(threading.Thread(
+                    target=self._work, args=(name, fn, queues[i], outq, remaining, lock),
+                    name="pipeline-%s-%d" % (name, n), daemon=True))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if self._error is not None:
+            raise self._error
@@ -0,0 +1,112 @@
+# profiling.py
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+
+class RunProfiler:
+    """Profile one sorter run and write the results into *out_dir*.
+
+    mode "deterministic" runs cProfile in the main thread and in every thread
+    started while profiling (pipeline stages, folder sync workers) and writes
+    the merged result as ``<run>.pstats``. Both modes run a stack sampler
+    every *interval* seconds and write ``<run>.collapsed`` (one
+    ``frame;frame;frame count`` line per stack, the input format of
+    flamegraph.pl and speedscope). Per-message trace spans handed to trace()
+    end up in ``<run>.traces.jsonl``.
+    """
+
+    MODES = ("deterministic", "sampling")
+
+    def __init__(self, out_dir, mode="deterministic", interval=0.005):
+        if mode not in self.MODES:
+            raise ValueError("profile mode must be one of %s" % ", ".join(self.MODES))
+        self.out_dir = out_dir
+        self.mode = mode
+        self.interval = interval
+        self.run_name = "run-%s-%d" % (time.strftime("%Y%m%d-%H%M%S"), os.getpid())
+        self._lock = threading.Lock()
+        self._profiles = []
+        self._stacks = collections.Counter()
+        self._traces = []
+        self._stop = threading.Event()
+        self._sampler = None
+        self._main = None
+
+    # ------------------------------ lifecycle ------------------------------
+    def __enter__(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        self._sampler = threading.Thread(target=self._sample, name="profiler-sampler", daemon=True)
+        self._sampler.start()
+        if self.mode == "deterministic":
+            import cProfile  # deferred with pstats: only profiled runs pay for them
+            self._profile_class = cProfile.Profile
+            threading.setprofile(self._bootstrap_thread)
+            self._main = cProfile.Profile()
+            self._main.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if self._main is not None:
+            self._main.disable()
+            threading.setprofile(None)
+        self._stop.set()
+        self._sampler.join()
+        self.write()
+        return False
+
+    def _bootstrap_thread(self, frame, event, arg):
+        # first profile event in a new thread: swap in a per-thread cProfile
+        prof = self._profile_class()
+        with self._lock:
+            self._profiles.append(prof)
+        sys.setprofile(None)
+        prof.enable()
+
+    # ------------------------------ sampling ------------------------------
+    @staticmethod
+    def _frame_name(frame):
+        code = frame.f_code
+        return "%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+    def _sample(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_name(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, "thread-%d" % ident))
+                self._stacks[";".join(reversed(stack))] += 1
+
+    # ------------------------------ traces ------------------------------
+    def trace(self, record):
+        with self._lock:
+            self._traces.append(record)
+
+    # ------------------------------ output ------------------------------
+    def write(self):
+        base = os.path.join(self.out_dir, self.run_name)
+        if self._main is not None:
+            import pstats
+            stats = pstats.Stats(self._main)
+            for prof in self._profiles:
+                try:
+                    stats.add(prof)
+                except (TypeError, ValueError):
+                    pass  # thread never ran any profiled code
+            stats.dump_stats(base + ".pstats")
+        with open(base + ".collapsed", "w") as f:
+            for stack, count in self._stacks.most_common():
+                f.write("%s %d\n" % (stack, count))
+        if self._traces:
+            with open(base + ".traces.jsonl", "w") as f:
+                for record in self._traces:
+                    f.write(json.dumps(record) + "\n")
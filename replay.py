@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+"""
+Offline replay of the sorter against a local Maildir tree or mbox files.
+
+Every message is labelled with the folder it is stored in, run through the
+same HeaderNormalizer -> Nilsimsa -> score_folder ladder as the live sorter
+and scored against the rest of the corpus. The report gives throughput,
+per-stage latency and how often the ladder picked the folder the message
+actually lives in. Nothing touches IMAP, MySQL or the LLM: corpus rows and
+sources are hashed with the same categories line (NEVER_CLASSIFIED unless
+--cats is given), so results are reproducible run to run.
+"""
+
+import argparse
+import collections
+import email.utils
+import json
+import logging
+import mailbox
+import os
+import random
+import sys
+import time
+from typing import Dict, List, Optional
+
+from imap_nilsimsa import IMAPAutoSorter, NEVER_CLASSIFIED
+from nilsimsa import compare_hexdigests
+
+Mail = collections.namedtuple("Mail", "folder when raw_header")
+
+# ------------------------------ loading ------------------------------
+
+def _read_header(f) -> bytes:
+    """Header block of an open message file, up to and including the blank line."""
+    lines = []
+    for line in f:
+        lines.append(line)
+        if line in (b"\n", b"\r\n"):
+            break
+    return b"".join(lines)
+
+
+def _decode(raw: bytes) -> str:
+    # same decoding as the IMAP fetch path
+    return raw.decode("utf-8", "backslashreplace")
+
+
+def _date_header(raw_header: str) -> float:
+    msg = email.message_from_string(raw_header)
+    try:
+        return email.utils.parsedate_to_datetime(msg["Date"]).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return 0.0
+
+
+def maildir_folders(root: str, inbox: str = "INBOX", prefix: str = "") -> Dict[str, str]:
+    """Map folder name -> Maildir path for *root* and every Maildir below it.
+
+    Maildir++ subfolders (".Lists.Python") lose the leading dot; directories
+    in fs layout ("Lists/Python") keep their path. *prefix* is prepended to
+    subfolder names for servers that show them as "INBOX.Lists.Python".
+    """
+    found = {}
+    for dirpath, dirnames, _ in os.walk(root):
+        if "cur" in dirnames:
+            rel = os.path.relpath(dirpath, root)
+            name = inbox if rel == "." else prefix + rel.replace(os.sep, "/").lstrip(".")
+            found[name] = dirpath
+        dirnames[:] = [d for d in dirnames if d not in ("cur", "new", "tmp")]
+    return found
+
+
+def load_maildir(path: str, folders: Optional[List[str]] = None, prefix: str = "") -> List[Mail]:
+    """Headers of every message in a Maildir tree; *when* is the delivery time."""
+    mails = []
+    for name, folder_path in sorted(maildir_folders(path, prefix=prefix).items()):
+        if folders and name not in folders:
+            continue
+        for sub in ("cur", "new"):
+            with os.scandir(os.path.join(folder_path, sub)) as entries:
+                for entry in entries:
+                    if not entry.is_file():
+                        continue
+                    # delivery time leads the unique name ("1700000000.M1P2.host:2,S")
+                    stamp = entry.name.split(".", 1)[0]
+                    when = float(stamp) if stamp.isdigit() else entry.stat().st_mtime
+                    with open(entry.path, "rb") as f:
+                        mails.append(Mail(name, when, _decode(_read_header(f))))
+    return mails
+
+
+def load_mbox(path: str, folders: Optional[List[str]] = None) -> List[Mail]:
+    """Headers of every message in an mbox file, or in each mbox of a directory tree.
+
+    The folder is the file path relative to *path* without extension; *when*
+    comes from the Date header.
+    """
+    if os.path.isfile(path):
+        files = {os.path.splitext(os.path.basename(path))[0]: path}
+    else:
+        files = {}
+        for dirpath, _, filenames in os.walk(path):
+            for fn in filenames:
+                full = os.path.join(dirpath, fn)
+                name = os.path.splitext(os.path.relpath(full, path))[0].replace(os.sep, "/")
+                files[name] = full
+    mails = []
+    for name, file_path in sorted(files.items()):
+        if folders and name not in folders:
+            continue
+        box = mailbox.mbox(file_path, create=False)
+        try:
+            for key in box.iterkeys():
+                raw = box.get_bytes(key)
+                end = raw.find(b"\n\n")
+                raw_header = _decode(raw if end < 0 else raw[:end + 2])
+                mails.append(Mail(name, _date_header(raw_header), raw_header))
+        finally:
+            box.close()
+    return mails
+
+# ------------------------------ replay ------------------------------
+
+class Replay:
+    """Score each message of a labelled corpus against the rest of it.
+
+    prepare() normalizes and hashes every message once; leave_one_out()
+    scores a (sampled) message against all others, time_ordered() walks the
+    corpus by arrival and scores each message only against what arrived
+    before it, the way the live sorter sees mail.
+    """
+
+    STAGES = ("normalize", "hash", "score", "ladder")
+
+    def __init__(self, sorter: IMAPAutoSorter, mails: List[Mail], cats: str = NEVER_CLASSIFIED):
+        self.sorter = sorter
+        self.mails = sorted(mails, key=lambda m: m.when)
+        self.cats = cats
+        self.digests: List[Optional[str]] = []
+        self.timings = {stage: [] for stage in self.STAGES}
+        self.results = []  # (expected, predicted)
+        self.wall = {}
+
+    def _timed(self, stage, fn, *args):
+        start = time.perf_counter()
+        out = fn(*args)
+        self.timings[stage].append(time.perf_counter() - start)
+        return out
+
+    def prepare(self, quiet: bool = False) -> None:
+        start = time.perf_counter()
+        total = len(self.mails)
+        for i, mail in enumerate(self.mails):
+            trimmed = self._timed("normalize", self.sorter.return_header, mail.raw_header)
+            try:
+                digest = self._timed("hash", self.sorter._digest, self.cats, trimmed)
+            except Exception:
+                digest = None
+            self.digests.append(digest)
+            if not quiet:
+                self.sorter.status(i, total, "Hashing")
+        self.wall["prepare"] = time.perf_counter() - start
+
+    def _score(self, index: int, corpus: Dict[str, List[int]]) -> None:
+        source = self.digests[index]
+
+        def distances():
+            return {f: [compare_hexdigests(source, self.digests[j]) for j in rows if j != index]
+                    for f, rows in corpus.items()}
+
+        dist_cache = self._timed("score", distances)
+        winner = self._timed("ladder", self.sorter.resolve_winner, dist_cache, False, True)
+        self.results.append((self.mails[index].folder, winner))
+
+    def _corpus(self) -> Dict[str, List[int]]:
+        # every candidate folder takes part, even when it holds no mail yet
+        return {f: [] for f in self.sorter.imap_folders}
+
+    def leave_one_out(self, sample: int = 0, seed: int = 0, quiet: bool = False) -> None:
+        corpus = self._corpus()
+        for i, digest in enumerate(self.digests):
+            if digest is not None:
+                corpus[self.mails[i].folder].append(i)
+        indices = [i for i, d in enumerate(self.digests) if d is not None]
+        if 0 < sample < len(indices):
+            indices = sorted(random.Random(seed).sample(indices, sample))
+        start = time.perf_counter()
+        for n, i in enumerate(indices):
+            self._score(i, corpus)
+            if not quiet:
+                self.sorter.status(n, len(indices), "Scoring")
+        self.wall["score"] = time.perf_counter() - start
+
+    def time_ordered(self, warmup: float = 0.1, quiet: bool = False) -> None:
+        corpus = self._corpus()
+        first = int(len(self.mails) * warmup)
+        start = time.perf_counter()
+        for i, digest in enumerate(self.digests):
+            if digest is None:
+                continue
+            if i >= first:
+                self._score(i, corpus)
+            corpus[self.mails[i].folder].append(i)
+            if not quiet:
+                self.sorter.status(i, len(self.digests), "Scoring")
+        self.wall["score"] = time.perf_counter() - start
+
+    # ------------------------------ report ------------------------------
+    @staticmethod
+    def _latency(samples: List[float]) -> dict:
+        if not samples:
+            return {}
+        s = sorted(samples)
+
+        def pct(p):
+            return s[int(p * (len(s) - 1))] * 1000
+
+        return {"count": len(s), "mean_ms": sum(s) / len(s) * 1000, "p50_ms": pct(0.50),
+                "p95_ms": pct(0.95), "p99_ms": pct(0.99), "max_ms": s[-1] * 1000}
+
+    def report(self) -> dict:
+        new_folder = self.sorter.new_folder
+        per_folder = collections.defaultdict(lambda: {"messages": 0, "correct": 0, "wrong": 0, "unsorted": 0})
+        for expected, predicted in self.results:
+            row = per_folder[expected]
+            row["messages"] += 1
+            if predicted == expected:
+                row["correct"] += 1
+            elif predicted == new_folder:
+                row["unsorted"] += 1
+            else:
+                row["wrong"] += 1
+        scored = len(self.results)
+        correct = sum(r["correct"] for r in per_folder.values())
+        wrong = sum(r["wrong"] for r in per_folder.values())
+        stages = {stage: self._latency(samples) for stage, samples in self.timings.items()}
+        per_message = sum(stages[s].get("mean_ms", 0.0) for s in self.STAGES)
+        return {
+            "messages": len(self.mails),
+            "scored": scored,
+            "correct": correct,
+            "wrong": wrong,
+            "unsorted": scored - correct - wrong,
+            "accuracy": correct / scored if scored else 0.0,
+            "precision": correct / (correct + wrong) if correct + wrong else 0.0,
+            "prepare_msgs_per_sec": len(self.mails) / self.wall["prepare"] if self.wall.get("prepare") else 0.0,
+            "score_msgs_per_sec": scored / self.wall["score"] if self.wall.get("score") else 0.0,
+            "end_to_end_msgs_per_sec": 1000.0 / per_message if per_message else 0.0,
+            "stages": stages,
+            "folders": dict(sorted(per_folder.items())),
+        }
+
+
+def print_report(report: dict) -> None:
+    print("messages: %d  scored: %d  correct: %d  wrong: %d  unsorted: %d" % (
+        report["messages"], report["scored"], report["correct"], report["wrong"], report["unsorted"]))
+    print("accuracy: %.3f  precision of moves: %.3f" % (report["accuracy"], report["precision"]))
+    print("throughput: prepare %.1f msgs/s, score %.1f msgs/s, end-to-end %.1f msgs/s" % (
+        report["prepare_msgs_per_sec"], report["score_msgs_per_sec"], report["end_to_end_msgs_per_sec"]))
+    print("%-10s %8s %10s %10s %10s %10s" % ("stage", "count", "mean ms", "p50 ms", "p95 ms", "max ms"))
+    for stage, s in report["stages"].items():
+        if s:
+            print("%-10s %8d %10.3f %10.3f %10.3f %10.3f" % (
+                stage, s["count"], s["mean_ms"], s["p50_ms"], s["p95_ms"], s["max_ms"]))
+    print("%-30s %8s %8s %8s %8s" % ("folder", "msgs", "correct", "wrong", "unsorted"))
+    for folder, r in report["folders"].items():
+        print("%-30s %8d %8d %8d %8d" % (folder, r["messages"], r["correct"], r["wrong"], r["unsorted"]))
+
+# ------------------------------ CLI ------------------------------
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay a local Maildir/mbox corpus through the Nilsimsa sorter.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--maildir", metavar="PATH", help="Maildir root; each Maildir below it is a folder")
+    source.add_argument("--mbox", metavar="PATH", help="mbox file, or directory of mbox files (one per folder)")
+    parser.add_argument("--config", type=str, default="etc/imap_autosort.conf", help="Path to configuration file")
+    parser.add_argument("--folders", metavar="LIST",
+                        help="Comma-separated folders to replay (default: [imap] folders, else every folder found)")
+    parser.add_argument("--prefix", default="", help="Prepend to Maildir subfolder names (e.g. 'INBOX.')")
+    parser.add_argument("--mode", choices=("leave-one-out", "time-ordered"), default="leave-one-out")
+    parser.add_argument("--sample", type=int, default=0, metavar="N",
+                        help="leave-one-out: score N randomly chosen messages (0 = all)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for --sample")
+    parser.add_argument("--warmup", type=float, default=0.1,
+                        help="time-ordered: fraction of the oldest mail only added to the corpus")
+    parser.add_argument("--cats", default=NEVER_CLASSIFIED, help="Categories line hashed with every header")
+    parser.add_argument("--json", metavar="FILE", help="Also write the report as JSON")
+    parser.add_argument("--loglevel", default="WARNING",
+                        help="Sorter log level during the replay (INFO logs every ladder step)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="No progress bars")
+    args = parser.parse_args()
+
+    sorter = IMAPAutoSorter(args.config, offline=True)
+    logging.getLogger("imap_nilsimsa").setLevel(args.loglevel.upper())
+    folders = [f.strip() for f in args.folders.split(",") if f.strip()] if args.folders else sorter.imap_folders
+
+    if args.maildir:
+        mails = load_maildir(args.maildir, folders, args.prefix)
+    else:
+        mails = load_mbox(args.mbox, folders)
+    if not mails:
+        sys.exit("No messages found")
+    # the ladder scores exactly these folders
+    sorter.imap_folders = folders or sorted({m.folder for m in mails})
+
+    replay = Replay(sorter, mails, args.cats)
+    replay.prepare(args.quiet)
+    if args.mode == "leave-one-out":
+        replay.leave_one_out(args.sample, args.seed, args.quiet)
+    else:
+        replay.time_ordered(args.warmup, args.quiet)
+
+    report = replay.report()
+    report.update(mode=args.mode, sample=args.sample, seed=args.seed, warmup=args.warmup,
+                  threshold=sorter.threshold, min_score=sorter.min_score, min_average=sorter.min_average)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,16 @@
-import logging, logging.handlers, socket, os, re
-from datetime import datetime
+import logging, logging.handlers, socket, os, re, time, weakref
 
 class RFC5424Formatter(logging.Formatter):
-    """RFC 5424 formatter with newline folding to keep entries single-line."""
+    """RFC 5424 formatter with newline folding to keep entries single-line.
+
+    Everything that does not change per record (PRI prefixes, pid, host/app
+    part, the timestamp down to the second) is computed once and cached.
+    """
     _SEVERITY = {
         logging.CRITICAL: 2, logging.ERROR: 3, logging.WARNING: 4,
         logging.INFO: 6, logging.DEBUG: 7, logging.NOTSET: 7
     }
+    _FOLD_RE = re.compile(r"[\r\n]+")
 
     def __init__(self, app_name="imap_nilsimsa", hostname=None, facility=1, structured_data="-"):
         super().__init__(fmt="%(message)s")
@@ -14,18 +18,37 @@ class RFC5424Formatter(logging.Formatter):
         self.hostname = hostname or socket.gethostname()
         self.facility = int(facility)
         self.structured_data = structured_data
+        self._pri = {}            # levelno -> "<PRI>1"
+        self._ts_second = None    # int(record.created) of the cached prefix
+        self._ts_prefix = ""
+        self._refresh_pid()
+        # a daemonizing fork changes the pid behind our back
+        ref = weakref.WeakMethod(self._refresh_pid)
+        os.register_at_fork(after_in_child=lambda: ref() and ref()())
+
+    def _refresh_pid(self):
+        self._pid = str(os.getpid())
+        self._host_app_proc = f"{self.hostname} {self.app_name} {self._pid}"
 
-    @staticmethod
-    def _fold(msg: str) -> str:
+    @classmethod
+    def _fold(cls, msg: str) -> str:
         # collapse CR/LF runs so receivers won’t split entries
-        return re.sub(r"[\r\n]+", "\\n", msg).strip()
+        if "\n" not in msg and "\r" not in msg:
+            return msg.strip()
+        return cls._FOLD_RE.sub("\\\\n", msg).strip()
+
+    def _timestamp(self, created: float) -> str:
+        second = int(created)
+        if second != self._ts_second:
+            self._ts_prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+            self._ts_second = second
+        return "%s.%03dZ" % (self._ts_prefix, int((created - second) * 1000))
 
     def format(self, record: logging.LogRecord) -> str:
-        version = "1"
-        ts = datetime.utcfromtimestamp(record.created).isoformat(timespec="milliseconds") + "Z"
-        host = self.hostname
-        app  = self.app_name
-        proc = str(os.getpid())
+        pri = self._pri.get(record.levelno)
+        if pri is None:
+            pri = self._pri[record.levelno] = "<%d>1" % (self.facility * 8 + self._SEVERITY.get(record.levelno, 7))
+        ts = self._timestamp(record.created)
 
         # Auto msgid: Class->method from logger hierarchy; fallback to module->function
         _msgid = getattr(record, "msgid", None)
@@ -36,12 +59,10 @@ class RFC5424Formatter(logging.Formatter):
         msgid = _msgid
         sd    = getattr(record, "structured_data", self.structured_data) or "-"
         if sd == "-":
-            sd = f'[meta@32473 file="{getattr(record,"filename","-")}" line="{getattr(record,"lineno","-")}" pid="{os.getpid()}"]'
+            sd = f'[meta@32473 file="{getattr(record,"filename","-")}" line="{getattr(record,"lineno","-")}" pid="{self._pid}"]'
 
-        sev   = self._SEVERITY.get(record.levelno, 7)
-        pri   = self.facility * 8 + sev
         msg   = self._fold(super().format(record))
-        return f"<{pri}>{version} {ts} {host} {app} {proc} {msgid} {sd} {msg}"
+        return f"{pri} {ts} {self._host_app_proc} {msgid} {sd} {msg}"
 
 def get_logger(name="imap_nilsimsa",
                level=logging.INFO,
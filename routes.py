@@ -0,0 +1,84 @@
+# routes.py
+import email
+import email.message
+import email.utils
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+KEY_LENGTH = 255  # routes.route_key column width
+
+_ANGLE = re.compile(r"<([^<>]+)>")
+
+
+def route_keys(header: Union[str, email.message.Message]) -> List[Tuple[str, str]]:
+    """Normalized ("list", List-Id) and ("from", address) keys of a header; either may be missing."""
+    msg = header if isinstance(header, email.message.Message) else email.message_from_string(header)
+    keys = []
+    list_id = str(msg.get("List-Id") or "").strip()
+    if list_id:
+        m = _ANGLE.search(list_id)
+        keys.append(("list", (m.group(1) if m else list_id).strip().lower()[:KEY_LENGTH]))
+    address = email.utils.parseaddr(str(msg.get("From") or ""))[1].strip().lower()
+    if address:
+        keys.append(("from", address[:KEY_LENGTH]))
+    return keys
+
+
+class RouteIndex:
+    """Where mail from each sender and list has gone: per-folder counts and last routing time.
+
+    A key decides a folder once it has at least *min_count* messages of
+    history, the leading folder holds at least *confidence* of them and is
+    also where the key's most recent message went, so a manual correction
+    suspends routing for that key until mail is sorted to the old folder
+    again. When a message has both keys they must agree; a key with enough
+    history but no confident folder decides nothing for the message. All
+    methods take the index lock, so the score and commit stages and the
+    folder syncs may share one index.
+    """
+
+    def __init__(self, rows: Iterable[tuple] = (), confidence: float = 0.95, min_count: int = 5):
+        self.confidence = confidence
+        self.min_count = max(1, min_count)
+        self._lock = threading.Lock()
+        self._keys: Dict[Tuple[str, str], Dict[str, List[int]]] = {}
+        for kind, key, folder, count, last_seen in rows:
+            self._keys.setdefault((kind, key), {})[folder] = [count or 0, last_seen or 0]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def learn(self, keys: Iterable[Tuple[str, str]], folder: str, when: int) -> None:
+        """Count one message of each key as routed to *folder* at *when*."""
+        with self._lock:
+            for key in keys:
+                entry = self._keys.setdefault(key, {}).setdefault(folder, [0, 0])
+                entry[0] += 1
+                entry[1] = max(entry[1], when)
+
+    def unlearn(self, keys: Iterable[Tuple[str, str]], folder: str) -> None:
+        """Take back one message of each key from *folder* (it was moved out by hand)."""
+        with self._lock:
+            for key in keys:
+                entry = self._keys.get(key, {}).get(folder)
+                if entry is not None:
+                    entry[0] = max(0, entry[0] - 1)
+
+    def decide(self, keys: Iterable[Tuple[str, str]]) -> Optional[Tuple[str, Tuple[str, str], int, int]]:
+        """(folder, deciding key, its count there, its total) if the keys confidently agree, else None."""
+        decided = None
+        with self._lock:
+            for key in keys:
+                folders = self._keys.get(key)
+                total = sum(count for count, _ in folders.values()) if folders else 0
+                if total < self.min_count:
+                    continue
+                folder, (count, last_seen) = max(folders.items(), key=lambda it: it[1])
+                if count < self.confidence * total or last_seen < max(last for _, last in folders.values()):
+                    return None
+                if decided is not None and decided[0] != folder:
+                    return None
+                if decided is None or count * decided[3] > decided[2] * total:
+                    decided = (folder, key, count, total)
+        return decided
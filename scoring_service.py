@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+"""
+Resident scoring service: score a message header over a Unix domain socket.
+
+A sorter running with --loop or --daemon already holds every folder corpus,
+the header normalizer and the LLM client in memory and keeps the corpora in
+step with each sync. With ``[service] socket`` set it also answers scoring
+requests on that socket, so delivery hooks (a Sieve ``execute`` filter, a
+procmail pipe) get a decision in milliseconds instead of paying for process
+start, DB connect and a corpus reload. Nothing is moved or written: the
+service only reads the corpora and answers.
+
+The protocol is one JSON object per line in each direction::
+
+    {"op": "score", "header": "<raw header>", "account": "NAME"}
+    {"ok": true, "winner": "INBOX.x", "ranked": [[folder, score, avg], ...],
+     "ladder": [{"T": 50, "ranked": [...], "gap": 0.4, "result": "winner"}],
+     "categories": "...", "hexdigest": "...", "ms": 3.1}
+
+``{"op": "ping"}`` answers with the served accounts. Errors come back as
+``{"ok": false, "error": "..."}``. Run as a script, this module is the
+client: it reads a message on stdin and prints the winning folder.
+"""
+
+import argparse
+import collections
+import configparser
+import email
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+from corpus import digest_int
+
+MAX_REQUEST = 1 << 20  # bytes per request line; headers beyond this are refused
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline(MAX_REQUEST + 1)
+            if not line:
+                return
+            if len(line) > MAX_REQUEST:
+                self._reply({"ok": False, "error": "request too large"})
+                return
+            try:
+                reply = self.server.dispatch(json.loads(line))
+            except Exception as e:
+                self.server.logger.error("Scoring request failed: %s", e)
+                reply = {"ok": False, "error": str(e)}
+            self._reply(reply)
+
+    def _reply(self, reply: dict) -> None:
+        self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+
+class ScoringService(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Answer score requests from the corpora of already running sorters.
+
+    *sorters* are IMAPAutoSorter instances keyed by account (None for a
+    single-account config). Classifications are kept in an LRU of
+    *cache_size* entries keyed by (From, Subject), which is everything the
+    LLM is shown; error results are not cached.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path: str, sorters: Dict[Optional[str], "IMAPAutoSorter"], cache_size: int = 1024,
+                 mode: int = 0o600):
+        self.path = path
+        self.sorters = sorters
+        self.cache_size = cache_size
+        self.logger = logging.getLogger("imap_nilsimsa").getChild(self.__class__.__name__)
+        self._cache = collections.OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._thread = None
+        self._remove_stale(path)
+        umask = os.umask(0o077)  # no window in which the socket is reachable with wider permissions
+        try:
+            super().__init__(path, _Handler)
+        finally:
+            os.umask(umask)
+        os.chmod(path, mode)
+
+    @staticmethod
+    def _remove_stale(path: str) -> None:
+        """Unlink a socket file left behind by a dead service; refuse to steal a live one."""
+        if not os.path.exists(path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.unlink(path)
+        else:
+            raise RuntimeError("scoring service already listening on %s" % path)
+        finally:
+            probe.close()
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self.serve_forever, name="scoring-service", daemon=True)
+        self._thread.start()
+        self.logger.info("Scoring service listening on %s", self.path)
+        return self.path
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    # ------------------------------ requests ------------------------------
+    def dispatch(self, request: dict) -> dict:
+        op = request.get("op", "score")
+        if op == "ping":
+            return {"ok": True, "accounts": sorted(a or "" for a in self.sorters)}
+        if op == "score":
+            return self.score(request.get("header") or "", request.get("account"))
+        return {"ok": False, "error": "unknown op %r" % op}
+
+    def _sorter(self, account: Optional[str]):
+        if account is None and len(self.sorters) == 1:
+            return next(iter(self.sorters.values()))
+        sorter = self.sorters.get(account)
+        if sorter is None:
+            raise KeyError("no such account: %r" % account)
+        return sorter
+
+    def _classify(self, sorter, from_addr: str, subject: str) -> str:
+        key = (sorter.account, from_addr, subject)
+        with self._cache_lock:
+            cats = self._cache.get(key)
+            if cats is not None:
+                self._cache.move_to_end(key)
+                return cats
+        cats = sorter._classify_email(from_addr, subject)
+        if "classisication error" not in cats and self.cache_size > 0:
+            with self._cache_lock:
+                self._cache[key] = cats
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return cats
+
+    def score(self, raw_header: str, account: Optional[str] = None) -> dict:
+        """Winner, ranked folders and ladder trace for one raw header; nothing is written."""
+        start = time.perf_counter()
+        sorter = self._sorter(account)
+        msg = email.message_from_string(raw_header)
+        cats = self._classify(sorter, msg["From"], msg["Subject"])
+        hexdigest = sorter._digest(cats, sorter.return_header(raw_header))
+        source = digest_int(hexdigest)
+        dist_cache = {f: sorter.folder_corpus(f).snapshot(source, floor=sorter.threshold)[2]
+                      for f in sorter.imap_folders}
+        ladder: List[dict] = []
+        winner = sorter.resolve_winner(dist_cache, quiet=True, trace=ladder)
+        return {"ok": True, "winner": winner, "ranked": ladder[-1]["ranked"] if ladder else [],
+                "ladder": ladder, "categories": cats, "hexdigest": hexdigest,
+                "ms": round((time.perf_counter() - start) * 1000.0, 2)}
+
+
+def from_config(sorters: List["IMAPAutoSorter"]) -> Optional[ScoringService]:
+    """Start a ScoringService for *sorters* if their config has ``[service] socket``."""
+    config = sorters[0].config
+    path = config.get("service", "socket", fallback="").strip()
+    if not path:
+        return None
+    service = ScoringService(path, {s.account: s for s in sorters},
+                             cache_size=config.getint("service", "cache_size", fallback=1024),
+                             mode=int(config.get("service", "mode", fallback="600"), 8))
+    service.start()
+    return service
+
+# ------------------------------ client ------------------------------
+
+def score(path: str, raw_header: str, account: Optional[str] = None, timeout: float = 5.0) -> dict:
+    """Send one score request to the service at *path* and return its reply."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        with sock.makefile("rwb") as f:
+            f.write(json.dumps({"op": "score", "header": raw_header, "account": account}).encode("utf-8") + b"\n")
+            f.flush()
+            return json.loads(f.readline())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ask the resident scoring service where a message on stdin belongs.")
+    parser.add_argument("--config", type=str, default="etc/imap_autosort.conf",
+                        help="Configuration file providing [service] socket")
+    parser.add_argument("--socket", metavar="PATH", help="Service socket (overrides the config)")
+    parser.add_argument("--account", metavar="NAME", help="Score against this [account:NAME]")
+    parser.add_argument("--json", action="store_true", help="Print the full reply instead of the winning folder")
+    parser.add_argument("--timeout", type=float, default=5.0, help="Seconds to wait for the service")
+    args = parser.parse_args()
+
+    path = args.socket
+    if not path:
+        config = configparser.ConfigParser()
+        config.read(args.config)
+        path = config.get("service", "socket", fallback="").strip()
+    if not path:
+        sys.exit("No [service] socket configured")
+
+    raw = sys.stdin.buffer.read().decode("utf-8", "backslashreplace")
+    raw = raw.replace("\r\n", "\n").split("\n\n", 1)[0] + "\n"  # the header block is all that is scored
+    try:
+        reply = score(path, raw, args.account, args.timeout)
+    except (OSError, ValueError) as e:
+        sys.exit("Scoring service unavailable: %s" % e)
+    if not reply.get("ok"):
+        sys.exit("Scoring failed: %s" % reply.get("error"))
+    print(json.dumps(reply, indent=2) if args.json else reply["winner"])
+
+
+if __name__ == "__main__":
+    main()
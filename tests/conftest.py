@@ -0,0 +1,109 @@
+import os
+import re
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from imap_fixture import FixtureServer  # noqa: E402
+
+
+class FakeDB:
+    """In-memory stand-in for DatabaseHelper covering the nilsimsa and routes statements of a sync."""
+
+    def __init__(self):
+        self.rows = []
+        self.routes = {}  # (account, kind, route_key, folder) -> [count, last_seen]
+        self.next_id = 1
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def _conditions(sql):
+        m = re.search(r"WHERE (.*?)(?: ORDER| LIMIT|$)", sql)
+        return [c.strip() for c in m.group(1).split(" AND ")] if m else []
+
+    @staticmethod
+    def _matches(row, conditions, params):
+        for cond, value in zip(conditions, params):
+            if str(row.get(cond.split("=")[0].strip())) != str(value):
+                return False
+        return True
+
+    def execute(self, sql, params=()):
+        with self.lock:
+            return self._run(" ".join(sql.split()), tuple(params))
+
+    def fetchall(self, sql, params=()):
+        return self.execute(sql, params) or []
+
+    def executemany(self, sql, rows):
+        for row in rows:
+            self.execute(sql, row)
+
+    def _run(self, sql, params):
+        if sql.startswith("INSERT INTO nilsimsa"):
+            row = dict(zip([c.strip() for c in re.search(r"\((.*?)\)", sql).group(1).split(",")], params))
+            row["id"], self.next_id = self.next_id, self.next_id + 1
+            self.rows.append(row)
+        elif sql.startswith("INSERT INTO routes"):
+            account, kind, key, folder, now = params
+            entry = self.routes.setdefault((account, kind, key, folder), [0, 0])
+            entry[0] += 1
+            entry[1] = max(entry[1], now)
+        elif sql.startswith("UPDATE routes"):
+            entry = self.routes.get(params)
+            if entry is not None:
+                entry[0] = max(0, entry[0] - 1)
+        elif sql.startswith("SELECT kind, route_key, folder, count, last_seen FROM routes"):
+            return [key[1:] + tuple(v) for key, v in self.routes.items() if key[0] == params[0]]
+        elif sql.startswith("SELECT"):
+            columns = [c.strip() for c in re.match(r"SELECT (.*?) FROM", sql).group(1).split(",")]
+            conditions = self._conditions(sql)
+            return [tuple(r.get(c) for c in columns) for r in self.rows if self._matches(r, conditions, params)]
+        elif sql.startswith("UPDATE nilsimsa SET"):
+            columns = [c.split("=")[0].strip() for c in re.search(r"SET (.*?) WHERE", sql).group(1).split(",")]
+            values, where = params[:len(columns)], params[len(columns):]
+            for row in self.rows:
+                if self._matches(row, self._conditions(sql), where):
+                    row.update(zip(columns, values))
+        elif sql.startswith("DELETE FROM nilsimsa"):
+            self.rows = [r for r in self.rows if not self._matches(r, self._conditions(sql), params)]
+        else:
+            raise NotImplementedError(sql)
+
+
+@pytest.fixture
+def server():
+    with FixtureServer() as srv:
+        yield srv
+
+
+@pytest.fixture
+def make_sorter(server, tmp_path, monkeypatch):
+    """IMAPAutoSorter over the fixture server with a FakeDB; keyword arguments become [nilsimsa] options.
+
+    *archive* is an optional dict of [archive] options.
+    """
+    import imap_nilsimsa
+
+    monkeypatch.chdir(tmp_path)  # the log file lands here
+
+    def make(folders=("A", "B"), todo="inbox.autosort", archive=None, **nilsimsa):
+        path = tmp_path / "imap_autosort.conf"
+        path.write_text(
+            "[imap]\nserver=%s\nport=%d\nssl=0\nusername=fixture\npassword=fixture\n"
+            "todo=%s\nnew=inbox.autosort.new\nfolders=%s\n[nilsimsa]\n%s%s"
+            % (server.address + (todo, ",".join(folders), options(dict({"cold_build_workers": 1}, **nilsimsa)),
+                                 "[archive]\n" + options(archive) if archive else "")))
+        sorter = imap_nilsimsa.IMAPAutoSorter(str(path), offline=True)
+        sorter.db = FakeDB()
+        sorter.imap_helper = imap_nilsimsa.IMAPHelper(sorter.config)
+        return sorter
+
+    return make
+
+
+def options(values):
+    return "".join("%s=%s\n" % kv for kv in values.items())
@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+
+from conftest import FakeDB
+
+DAY = 24 * 60 * 60
+
+
+class ArchiveDB(FakeDB):
+    """FakeDB that also keeps the archive_state watermarks."""
+
+    def __init__(self):
+        super().__init__()
+        self.marks = {}  # (account, folder) -> [checked, due, uidnext, unseen]
+
+    def _run(self, sql, params):
+        if sql.startswith("INSERT INTO archive_state"):
+            self.marks[params[:2]] = list(params[2:])
+        elif sql.startswith("SELECT folder, checked, due, uidnext, unseen FROM archive_state"):
+            return [(key[1],) + tuple(v) for key, v in self.marks.items() if key[0] == params[0]]
+        else:
+            return super()._run(sql, params)
+
+
+def mail(subject):
+    return "From: a@example.org\r\nSubject: %s\r\n\r\n" % subject
+
+
+@pytest.fixture
+def sorter(server, make_sorter, monkeypatch):
+    now = time.time()
+    server.deliver("A", mail("old"), ("\\Seen",), when=now - 200 * DAY)
+    server.deliver("A", mail("young"), ("\\Seen",), when=now - 10 * DAY)
+    server.deliver("B", mail("almost old"), ("\\Seen",), when=now - 179.5 * DAY)
+    for name in ("C", "ZZZ", "Trash"):
+        server.create(name)
+    sorter = make_sorter(archive={"folder": "ZZZ", "after": 180, "trash": "Trash", "interval": 3600})
+    sorter.db = ArchiveDB()
+    sorter.scanned = []
+    scan = sorter._archive_folder
+
+    def archive_folder(imap, folder, *args):
+        sorter.scanned.append(folder)
+        return scan(imap, folder, *args)
+
+    monkeypatch.setattr(sorter, "_archive_folder", archive_folder)
+    return sorter
+
+
+def scanned(sorter, imap, **kwargs):
+    del sorter.scanned[:]
+    sorter.archive_emails(imap, parallel=False, **kwargs)
+    return sorted(sorter.scanned)
+
+
+def test_only_due_folders_are_scanned(server, sorter):
+    imap = sorter.imap_helper.connect()
+    now = int(time.time())
+    assert scanned(sorter, imap) == ["A", "B"]
+    assert len(server.folder("ZZZ").uids) == 1 and len(server.folder("A").uids) == 1
+    marks = {folder: mark for (_, folder), mark in sorter.db.marks.items()}
+    assert now + DAY <= marks["A"][1] <= now + DAY + 5  # young mail: at most a day ahead
+    assert now + 0.4 * DAY < marks["B"][1] < now + 0.6 * DAY
+
+    server.commands.clear()
+    assert scanned(sorter, imap) == []  # within the interval: no IMAP traffic at all
+    assert not server.commands
+
+    assert scanned(sorter, imap, force=True) == []  # nothing changed: one STATUS per folder
+    assert dict(server.commands) == {"STATUS": 2}
+
+    server.deliver("B", mail("arrived"), ("\\Seen",))
+    assert scanned(sorter, imap, force=True) == ["B"]
+
+    sorter.db.marks[("", "A")][1] = int(time.time()) - 1
+    assert scanned(sorter, imap, force=True) == ["A"]
+
+
+def test_folder_without_watermark_is_not_gated(sorter):
+    imap = sorter.imap_helper.connect()
+    sorter.archive_emails(imap, parallel=False)
+    sorter.imap_folders = ["A", "C"]  # B left the configuration, C joined it
+    assert scanned(sorter, imap) == ["C"]
+
+
+def test_archive_thread(sorter):
+    checked = threading.Event()
+    sorter.archive_emails = lambda imap, dry_run, force, parallel: checked.set()
+    stop = sorter._archive_start()
+    try:
+        assert checked.wait(5)
+    finally:
+        stop.set()
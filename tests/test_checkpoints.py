@@ -0,0 +1,83 @@
+import pytest
+
+from conftest import FakeDB
+
+TODO = "inbox.autosort"
+CATS = '[{"cta":"x"},{"label":["A:1.00"]}]'
+
+
+class CheckpointDB(FakeDB):
+    """FakeDB that also keeps the considered checkpoints."""
+
+    def __init__(self):
+        super().__init__()
+        self.considered = {}  # (account, uidvalidity, uid) -> (stage, categories, winner)
+
+    def _run(self, sql, params):
+        if sql.startswith("INSERT INTO considered"):
+            account, uidvalidity, uid, stage, cats, winner, _when = params
+            self.considered[(account, uidvalidity, str(uid))] = (stage, cats, winner)
+        elif sql.startswith("SELECT uid, stage, categories, winner FROM considered"):
+            return [(key[2],) + value for key, value in self.considered.items()
+                    if key[:2] == params and value[0] is not None]
+        else:
+            return super()._run(sql, params)
+
+
+class Killed(Exception):
+    pass
+
+
+@pytest.fixture
+def sorter(server, make_sorter, monkeypatch):
+    for i in range(3):
+        server.deliver(TODO, "From: s%d@example.org\r\nSubject: message %d\r\n\r\n" % (i, i))
+    for name in ("A", "B", TODO + ".new"):
+        server.create(name)
+    sorter = make_sorter()
+    sorter.db = CheckpointDB()
+    sorter.calls = {"llm": 0, "distances": 0}
+
+    def classify(from_addr, subject):
+        sorter.calls["llm"] += 1
+        return CATS
+
+    distances = sorter.folder_distances
+
+    def folder_distances(*args, **kwargs):
+        sorter.calls["distances"] += 1
+        return distances(*args, **kwargs)
+
+    monkeypatch.setattr(sorter, "_classify_email", classify)
+    monkeypatch.setattr(sorter, "folder_distances", folder_distances)
+    return sorter
+
+
+def interrupted(sorter, monkeypatch, stage):
+    """Run the pipeline once with *stage* raising, then restore it."""
+    def kill(run, job):
+        raise Killed(stage)
+
+    with monkeypatch.context() as m:
+        m.setattr(sorter, "_stage_" + stage, kill)
+        with pytest.raises(Killed):
+            sorter.autosort_inbox(sorter.imap_helper.connect(), quiet=True)
+
+
+@pytest.mark.parametrize("stage", ["score", "commit"])
+def test_resume_skips_finished_stages(server, sorter, monkeypatch, stage):
+    interrupted(sorter, monkeypatch, stage)
+    assert sorter.calls["llm"] >= 1
+    sorter.autosort_inbox(sorter.imap_helper.connect(), quiet=True)
+    assert server.folder(TODO).uids == [] and len(server.folder(TODO + ".new").uids) == 3
+    # every message classified and scanned exactly once across both runs
+    assert sorter.calls == {"llm": 3, "distances": 3}
+    assert {v[0] for v in sorter.db.considered.values()} == {"moved"}
+
+
+def test_uidvalidity_change_drops_checkpoints(server, sorter, monkeypatch):
+    interrupted(sorter, monkeypatch, "score")
+    classified = sorter.calls["llm"]
+    server.folder(TODO).uidvalidity += 1
+    sorter.autosort_inbox(sorter.imap_helper.connect(), quiet=True)
+    assert sorter.calls["llm"] == classified + 3
@@ -0,0 +1,51 @@
+import concurrent.futures
+
+import pytest
+
+import imap_nilsimsa
+from imap_fixture import synthetic_headers
+from imap_nilsimsa import NEVER_CLASSIFIED, hash_headers, header_md5, row_digest
+
+SOURCE = "0" * 64
+
+
+@pytest.mark.parametrize("weight_by", [0, 3])
+def test_pooled_hashes_match_the_sorter(make_sorter, weight_by):
+    sorter = make_sorter(weight_headers="from,subject", weight_headers_by=weight_by)
+    raw = [m[2] for m in synthetic_headers(40, ["A", "B"], seed=3)]
+    weights = (sorter.weight_headers_re, sorter.weight_headers_by)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=2) as pool:
+        hashed = [row for rows in pool.map(hash_headers, [raw[:20], raw[20:]], [sorter._normalize_args()] * 2,
+                                           [weights[0]] * 2, [weights[1]] * 2) for row in rows]
+    expected = []
+    for r in raw:
+        trimmed = sorter.return_header(r)
+        expected.append((trimmed, header_md5(trimmed, *weights), row_digest(NEVER_CLASSIFIED, trimmed, *weights)))
+    assert hashed == expected
+    if weight_by:
+        plain = [row_digest(NEVER_CLASSIFIED, row[0], weights[0], 0) for row in expected]
+        assert [row[2] for row in hashed] != plain
+
+
+def test_one_cold_build_pool_per_sorter(server, make_sorter, monkeypatch):
+    server.seed(synthetic_headers(30, ["A", "B"], seed=5))
+    started = []
+
+    class Pool(concurrent.futures.ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            started.append(self)
+
+    monkeypatch.setattr(imap_nilsimsa.concurrent.futures, "ProcessPoolExecutor", Pool)
+    sorter = make_sorter(cold_build_workers=2, cold_build_min=1, cold_build_chunk=4)
+    imap = sorter.imap_helper.connect()
+    for folder in ("A", "B"):
+        sorter.sync_and_distance(imap, folder, SOURCE, quiet=True)
+    assert len(started) == 1
+    assert len(sorter.db.rows) == 30
+    for row in sorter.db.rows:
+        assert row["hexdigest"] == sorter._digest(NEVER_CLASSIFIED, row["trimmed_header"])
+    sorter.close_hash_pool()
+    assert sorter._own_hash_pool is None
+    with pytest.raises(RuntimeError):
+        started[0].submit(len, "")
@@ -0,0 +1,105 @@
+import random
+
+import pytest
+
+from corpus import FolderCorpus
+from nilsimsa import compare_hexdigests
+
+
+def digest(seed):
+    return "%064x" % random.Random(seed).getrandbits(256)
+
+
+def flip(hexdigest, *bits):
+    value = int(hexdigest, 16)
+    for bit in bits:
+        value ^= 1 << bit
+    return "%064x" % value
+
+
+def with_byte(hexdigest, index, value):
+    raw = bytearray.fromhex(hexdigest)
+    raw[index] = value
+    return raw.hex()
+
+
+def test_exact_copies_share_a_slot_despite_band_collisions():
+    a = digest(1)
+    b = with_byte(a, 20, bytes.fromhex(a)[20] ^ 0xFF)  # same first 8 bytes as a
+    corpus = FolderCorpus("A", [(1, a)] + [(uid, b) for uid in range(2, 52)])
+    assert corpus.representatives == 2
+    corpus.add(100, b)
+    assert corpus.representatives == 2
+
+
+@pytest.mark.parametrize("collapse_bits", [1, 2, 3])
+def test_near_copies_collapse_with_shared_band_keys(collapse_bits):
+    base = digest(2)
+    # far differs from base only in the last byte: every other band key is owned by base first
+    far = flip(base, *range(collapse_bits + 1))
+    corpus = FolderCorpus("A", [(1, base), (2, far)], collapse_bits=collapse_bits)
+    assert corpus.representatives == 2
+    for uid in range(3, 20):
+        corpus.add(uid, flip(far, 8 + uid % 7))  # one bit from far, more than collapse_bits from base
+    assert corpus.representatives == 2
+
+
+def test_release_and_reuse_keep_the_index_consistent():
+    corpus = FolderCorpus("A")
+    a, b = digest(3), digest(4)
+    corpus.add(1, a)
+    corpus.add(2, a)
+    corpus.add(3, b)
+    corpus.discard(1)
+    corpus.discard(2)
+    assert corpus.representatives == 1
+    corpus.add(4, b)
+    corpus.add(5, a)
+    assert corpus.representatives == 2
+    assert corpus.hexdigest(5) == a
+
+
+def test_distances_match_compare_hexdigests():
+    rows = [(uid, digest(uid % 13)) for uid in range(1, 60)]
+    corpus = FolderCorpus("A", rows)
+    source = digest(99)
+    for uid, hexdigest in rows:
+        assert corpus.distance(uid, int(source, 16)) == compare_hexdigests(source, hexdigest)
+
+
+def sampled(rows, **kwargs):
+    return FolderCorpus("A", rows, sample_size=50, half_life=kwargs.pop("half_life", 200), **kwargs)
+
+
+def test_sample_is_reproducible_across_restarts():
+    rows = [(uid, digest(uid)) for uid in range(1, 1001)]
+    source = int(digest(0), 16)
+    live = sampled(rows[:600])
+    for uid, hexdigest in rows[600:]:
+        live.add(uid, hexdigest)  # mail sorted while running
+    restarted = sampled(reversed(rows))  # loaded from the DB, in any order
+    assert live.snapshot(source)[2] == restarted.snapshot(source)[2]
+    assert live._sampled == restarted._sampled and len(live._sampled) == 50
+
+
+def test_sample_favours_recent_mail():
+    rows = [(uid, digest(uid)) for uid in range(1, 2001)]
+    recent = sampled(rows, half_life=100)
+    uniform = sampled(rows, half_life=0)
+    recent.snapshot(0)
+    uniform.snapshot(0)
+    assert min(recent._sampled) > 1000
+    assert min(uniform._sampled) < 1000
+
+
+def test_scaled_counts_add_up_to_the_folder():
+    rows = [(uid, digest(uid % 97)) for uid in range(1, 1001)]
+    corpus = sampled(rows)
+    source = int(digest(5), 16)
+    assert sum(corpus.snapshot(source)[2].values()) == pytest.approx(1000)
+    live = set(range(1, 1001, 3))
+    assert sum(corpus.snapshot(source, live)[2].values()) == pytest.approx(len(live))
+    for uid in sorted(corpus._sampled)[:10]:
+        corpus.discard(uid)
+    assert sum(corpus.snapshot(source)[2].values()) == pytest.approx(990)
+    assert len(corpus._sampled) == 50
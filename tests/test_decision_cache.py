@@ -0,0 +1,45 @@
+import pytest
+
+RAW = "From: Shop <news@shop.example>\r\nSubject: Your weekly offers\r\n\r\n"
+CATS = '[{"cta":"x"},{"label":["A:1.00"]}]'
+
+
+def stored(sorter, folder, moved_from):
+    trimmed = sorter.return_header(RAW)
+    sorter.db.execute(
+        "INSERT INTO nilsimsa (uid, folder, hexdigest, md5sum, trimmed_header, categories, moved_from, account) "
+        "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+        (None, folder, sorter._digest(CATS, trimmed), sorter._md5(trimmed), trimmed, CATS, moved_from, ""))
+
+
+def job(sorter):
+    return {"uid": "1", "trimmed_header": sorter.return_header(RAW)}
+
+
+@pytest.mark.parametrize("todo", ["inbox.autosort", '"inbox.autosort"'])
+def test_sorted_copies_hit_with_quoted_or_bare_todo(make_sorter, todo):
+    sorter = make_sorter(todo=todo)
+    stored(sorter, "A", "inbox.autosort")
+    stored(sorter, "A", '"inbox.autosort"')  # written by older versions
+    stored(sorter, "A", None)
+    j = job(sorter)
+    assert sorter._cached_decision(j)
+    assert j["winner"] == "A" and j["cats"] == CATS
+
+
+def test_hand_moved_copy_disables_the_hit(make_sorter):
+    sorter = make_sorter(todo='"inbox.autosort"')
+    stored(sorter, "A", "inbox.autosort")
+    stored(sorter, "A", "B")
+    assert not sorter._cached_decision(job(sorter))
+
+
+def test_commit_stores_the_bare_todo_name(server, make_sorter):
+    server.deliver("inbox.autosort", RAW)
+    server.create("A")
+    sorter = make_sorter(todo='"inbox.autosort"')
+    imap = sorter.imap_helper.connect()
+    j = dict(job(sorter), winner="A", cats=CATS, message_id="", raw_header=RAW,
+             source_hexdigest=sorter._digest(CATS, sorter.return_header(RAW)))
+    sorter._commit_move(imap, j)
+    assert [r["moved_from"] for r in sorter.db.rows] == ["inbox.autosort"]
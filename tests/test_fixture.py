@@ -0,0 +1,40 @@
+import imaplib
+
+import pytest
+
+
+@pytest.fixture
+def imap(server):
+    for i, flags in enumerate([("\\Seen",), (), ("\\Seen",), ()]):
+        server.deliver("A", "From: a@example.org\r\nSubject: %d\r\n\r\n" % i, flags)
+    server.create("B")
+    conn = imaplib.IMAP4(*server.address)
+    conn.login("fixture", "fixture")
+    conn.select("A")
+    yield conn
+    conn.logout()
+
+
+def esearch(imap, *returns):
+    typ, _ = imap._simple_command("UID", "SEARCH", "RETURN", "(%s)" % " ".join(returns), "UNSEEN")
+    assert typ == "OK"
+    return imap._untagged_response(typ, [None], "ESEARCH")[1][0].decode()
+
+
+def test_esearch_return_options(imap):
+    assert esearch(imap, "COUNT") == "UID COUNT 2"
+    assert esearch(imap, "MIN", "MAX", "ALL") == "UID MIN 2 MAX 4 ALL 2,4"
+    typ, data = imap.uid("SEARCH", None, "UNSEEN")
+    assert data == [b"2 4"]
+
+
+def test_copy_and_move_report_copyuid(server, imap, make_sorter):
+    sorter = make_sorter()
+    uidvalidity = server.folder("B").uidvalidity
+    assert imap.uid("COPY", "1,3", "B")[0] == "OK"
+    assert imap.untagged_responses.pop("COPYUID") == [b"%d 1,3 1,2" % uidvalidity]  # tagged response code
+    assert imap.uid("MOVE", "2", "B")[0] == "OK"
+    untagged = imap.untagged_responses.get("OK", [])
+    assert sorter._extract_copyuid(("OK", untagged)) == (uidvalidity, [2], [3])
+    assert server.folder("A").uids == [1, 3, 4]
+    assert server.folder("B").uids == [1, 2, 3]
@@ -0,0 +1,26 @@
+import threading
+
+import imap_nilsimsa
+
+
+def connect(server):
+    imap = imap_nilsimsa.InstrumentedIMAP4(*server.address)
+    imap.login("fixture", "fixture")
+    return imap
+
+
+def test_new_mail_is_announced_once(server):
+    server.deliver("inbox.autosort", "Subject: waiting\r\n\r\n")
+    session = imap_nilsimsa.IdleSession(connect(server), "inbox.autosort")
+    assert session.wait(timeout=5) == ["1"]  # unseen mail present at start
+
+    timer = threading.Timer(0.3, server.deliver, ("inbox.autosort", "Subject: pushed\r\n\r\n"))
+    timer.start()
+    try:
+        assert session.wait(timeout=5) == ["2"]  # ended by the EXISTS push, not the timeout
+    finally:
+        timer.cancel()
+
+    server.deliver("inbox.autosort", "Subject: while busy\r\n\r\n")
+    server.deliver("inbox.autosort", "Subject: while busy too\r\n\r\n")
+    assert session.wait(timeout=5) == ["3", "4"]
@@ -0,0 +1,44 @@
+import configparser
+
+from metrics import BUCKETS, Metrics
+
+
+def test_disabled_records_nothing():
+    metrics = Metrics()
+    with metrics.timer("stage", stage="fetch"):
+        pass
+    metrics.inc("messages_sorted", folder="A")
+    assert metrics.render() == "\n"
+
+
+def test_render_counters_and_histograms():
+    metrics = Metrics(prefix="t")
+    metrics.enabled = True
+    metrics.inc("messages_sorted", folder="A")
+    metrics.inc("messages_sorted", 2, folder="A")
+    metrics.observe("stage", 0.003, stage="hash")
+    metrics.observe("stage", 7.0, stage="hash")
+    metrics.observe("stage", 100.0, stage="hash")
+    lines = metrics.render().splitlines()
+    assert "# TYPE t_messages_sorted_total counter" in lines
+    assert 't_messages_sorted_total{folder="A"} 3' in lines
+    assert "# TYPE t_stage_seconds histogram" in lines
+    buckets = [line for line in lines if line.startswith("t_stage_seconds_bucket")]
+    assert len(buckets) == len(BUCKETS) + 1
+    assert 't_stage_seconds_bucket{stage="hash",le="0.001"} 0' in lines
+    assert 't_stage_seconds_bucket{stage="hash",le="0.005"} 1' in lines
+    assert 't_stage_seconds_bucket{stage="hash",le="10.0"} 2' in lines
+    assert 't_stage_seconds_bucket{stage="hash",le="+Inf"} 3' in lines
+    assert 't_stage_seconds_count{stage="hash"} 3' in lines
+
+
+def test_textfile_from_config(tmp_path):
+    path = tmp_path / "metrics.prom"
+    config = configparser.ConfigParser()
+    config.read_dict({"metrics": {"enabled": "1", "textfile": str(path)}})
+    metrics = Metrics()
+    metrics.configure(config)
+    with metrics.timer("llm_request"):
+        pass
+    metrics.write_textfile()
+    assert "imap_nilsimsa_llm_request_seconds_count 1" in path.read_text()
@@ -0,0 +1,55 @@
+import random
+
+from nilsimsa import Nilsimsa
+
+
+def digest_of(*parts):
+    n = Nilsimsa()
+    for part in parts:
+        n.update(part)
+    return n.hexdigest()
+
+
+def test_merge_equals_sequential_update():
+    rng = random.Random(1)
+    for _ in range(200):
+        text = "".join(chr(rng.randrange(32, 127)) for _ in range(rng.randrange(0, 60)))
+        cut = rng.randrange(0, len(text) + 1)
+        left, right = Nilsimsa(), Nilsimsa()
+        left.update(text[:cut])
+        right.update(text[cut:])
+        assert left.merge(right).hexdigest() == digest_of(text)
+
+
+def test_state_round_trip_continues_exactly():
+    n = Nilsimsa()
+    n.update("From: a@example.org\n")
+    restored = Nilsimsa.from_state(n.state())
+    restored.update("Subject: hi\n")
+    assert restored.hexdigest() == digest_of("From: a@example.org\n", "Subject: hi\n")
+
+
+def test_merge_leaves_both_operands_alone():
+    left, right = Nilsimsa(), Nilsimsa()
+    left.update("abcdef")
+    right.update("ghijkl")
+    before = left.state(), right.state()
+    left.merge(right)
+    assert (left.state(), right.state()) == before
+
+
+def test_copy_is_independent():
+    n = Nilsimsa()
+    n.update("List-Id: <l.example.org>\n")
+    before = n.hexdigest()
+    c = n.copy()
+    c.update("more text")
+    assert n.hexdigest() == before
+
+
+def test_weighted_update_equals_repetition():
+    for weight in (0, 2, 7):
+        n = Nilsimsa()
+        n.update("X: y\n")
+        n.update("Subject: weighted\n", weight=weight)
+        assert n.hexdigest() == digest_of("X: y\n", "Subject: weighted\n" * weight)
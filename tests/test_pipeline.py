@@ -0,0 +1,48 @@
+import threading
+import time
+
+import pytest
+
+from pipeline import Pipeline
+
+
+def test_items_pass_every_stage_and_none_drops():
+    out, lock = [], threading.Lock()
+
+    def collect(x):
+        with lock:
+            out.append(x)
+
+    Pipeline([("double", lambda x: x * 2, 2), ("odd", lambda x: None if x % 4 else x, 3),
+              ("collect", collect, 1)]).run(range(20))
+    assert sorted(out) == [x * 2 for x in range(20) if x * 2 % 4 == 0]
+
+
+def test_bounded_queues_apply_back_pressure():
+    fed = []
+
+    def source():
+        for i in range(50):
+            fed.append(time.monotonic())
+            yield i
+
+    seen = []
+
+    def slow(x):
+        if x == 0:
+            time.sleep(0.3)
+            assert len(fed) <= 10  # source blocked behind the full queues
+        seen.append(x)
+
+    Pipeline([("slow", slow, 1)], maxsize=2).run(source())
+    assert seen == list(range(50))
+
+
+def test_first_error_is_raised_in_the_caller():
+    def boom(x):
+        if x == 3:
+            raise ValueError("bad item")
+        return x
+
+    with pytest.raises(ValueError, match="bad item"):
+        Pipeline([("boom", boom, 2), ("sink", lambda x: None, 1)]).run(range(1000))
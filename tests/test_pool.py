@@ -0,0 +1,56 @@
+import configparser
+import imaplib
+import socket
+
+import pytest
+
+from imap_nilsimsa import IMAPHelper
+
+
+@pytest.fixture
+def helper(server):
+    config = configparser.ConfigParser()
+    config.read_dict({"imap": {"server": server.address[0], "port": str(server.address[1]), "ssl": "0",
+                               "username": "fixture", "password": "fixture", "connections": "2"}})
+    helper = IMAPHelper(config)
+    yield helper
+    helper.close()
+
+
+def drop(imap):
+    """The connection goes away under the client, as when the server times it out."""
+    imap.sock.shutdown(socket.SHUT_RDWR)
+
+
+def test_idle_connection_is_replaced_after_a_drop(server, helper):
+    pool = helper.pool()
+    pool.check_after = 0  # health-check on every checkout
+    with pool.connection() as imap:
+        first = imap
+    drop(first)
+    with pool.connection() as imap:
+        assert imap is not first
+        assert imap.noop()[0] == "OK"
+    assert server.commands["LOGIN"] == 2
+
+
+def test_connection_dropped_in_use_is_not_reused(server, helper):
+    pool = helper.pool()
+    with pytest.raises((imaplib.IMAP4.abort, OSError)):
+        with pool.connection() as imap:
+            first = imap
+            drop(imap)
+            imap.noop()
+    with pool.connection() as imap:
+        assert imap is not first
+        assert imap.select("INBOX")[0] == "OK"
+    assert server.commands["LOGIN"] == 2
+
+
+def test_pool_is_bounded(helper):
+    pool = helper.pool()
+    with pool.connection() as a, pool.connection() as b:
+        assert a is not b
+        assert not pool._slots.acquire(timeout=0.1)  # a third caller waits
+    with pool.connection() as c:
+        assert c in (a, b)
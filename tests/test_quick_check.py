@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+import imap_nilsimsa
+
+
+class ArchiveStateDB:
+    def __init__(self, checked):
+        self.checked = checked
+
+    def fetchall(self, sql, params=()):
+        assert sql.startswith("SELECT folder, checked FROM archive_state")
+        return list(self.checked.items())
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def config(server, tmp_path, monkeypatch):
+    server.create("inbox.autosort")
+
+    def write(archive=True, checked=None):
+        monkeypatch.setattr(imap_nilsimsa, "DatabaseHelper", lambda *a: ArchiveStateDB(dict(checked or {})))
+        path = tmp_path / "imap_autosort.conf"
+        path.write_text(
+            "[imap]\nserver=%s\nport=%d\nssl=0\nusername=fixture\npassword=fixture\n"
+            "todo=inbox.autosort\nfolders=A,B\n[mysql]\npassword=x\n%s"
+            % (server.address + ("[archive]\nfolder=Archive\nafter=180\ninterval=3600\n" if archive else "",)))
+        return str(path)
+
+    return write
+
+
+def test_idle_run_without_archiving(config):
+    assert imap_nilsimsa.nothing_to_sort(config(archive=False), [])
+
+
+def test_idle_run_with_recent_archive_check(config):
+    now = int(time.time())
+    assert imap_nilsimsa.nothing_to_sort(config(checked={"A": now - 60, "B": now - 120}), [])
+
+
+NOW = int(time.time())
+
+
+@pytest.mark.parametrize("checked", [{}, {"A": NOW}, {"A": NOW, "B": NOW - 7200},
+                                     {"A": NOW, "Removed": NOW}])  # no watermark for B yet
+def test_archiving_due_takes_the_full_pass(config, checked):
+    assert not imap_nilsimsa.nothing_to_sort(config(checked=checked), [])
+
+
+def test_unseen_mail_takes_the_full_pass(config, server):
+    path = config(archive=False)
+    server.deliver("inbox.autosort", "Subject: new\r\n\r\n")
+    assert not imap_nilsimsa.nothing_to_sort(path, [])
@@ -0,0 +1,78 @@
+from routes import RouteIndex, route_keys
+
+SOURCE = "0" * 64
+
+
+def header(sender, subject="hello", list_id=None):
+    lines = ["From: Someone <%s>" % sender, "Subject: %s" % subject]
+    if list_id:
+        lines.append("List-Id: Some list <%s>" % list_id)
+    return "\r\n".join(lines) + "\r\n\r\n"
+
+
+def test_route_keys_normalized():
+    assert route_keys(header("Info@Example.ORG", list_id="News.Example.org")) == [
+        ("list", "news.example.org"), ("from", "info@example.org")]
+    assert route_keys("Subject: none\n\n") == []
+
+
+def test_decide_needs_history_and_confidence():
+    keys = [("from", "a@example.org")]
+    index = RouteIndex(confidence=0.9, min_count=3)
+    for when in (1, 2):
+        index.learn(keys, "A", when)
+    assert index.decide(keys) is None  # not enough history yet
+    index.learn(keys, "A", 3)
+    assert index.decide(keys) == ("A", keys[0], 3, 3)
+    index.learn(keys, "B", 2)
+    assert index.decide(keys) is None  # 3 of 4 is below 0.9
+
+
+def test_manual_move_suspends_routing():
+    keys = [("from", "a@example.org")]
+    index = RouteIndex([("from", "a@example.org", "A", 20, 100)], confidence=0.9, min_count=3)
+    assert index.decide(keys)[0] == "A"
+    index.learn(keys, "B", 200)
+    index.unlearn(keys, "A")
+    assert index.decide(keys) is None  # B got the latest message
+    index.learn(keys, "A", 300)
+    assert index.decide(keys)[0] == "A"
+
+
+def test_keys_must_agree():
+    sender, lst = ("from", "a@example.org"), ("list", "l.example.org")
+    index = RouteIndex(confidence=0.9, min_count=1)
+    index.learn([sender], "A", 1)
+    index.learn([lst], "B", 1)
+    assert index.decide([sender]) is not None
+    assert index.decide([sender, lst]) is None
+
+
+def test_resync_of_unchanged_folder_keeps_counts(server, make_sorter):
+    twin = header("twin@example.org", "same header twice")
+    for raw in (twin, twin, header("other@example.org")):
+        server.deliver("A", raw, ("\\Seen",))
+    server.create("B")
+    sorter = make_sorter(folders=("A", "B"))
+    imap = sorter.imap_helper.connect()
+    for _ in range(3):
+        sorter.sync_and_distance(imap, "A", SOURCE, quiet=True)
+        assert sorter.db.routes == {}
+        assert len(sorter.routes()) == 0
+
+
+def test_manual_move_is_learned(server, make_sorter):
+    server.deliver("A", header("mover@example.org"), ("\\Seen",))
+    server.create("B")
+    sorter = make_sorter(folders=("A", "B"))
+    imap = sorter.imap_helper.connect()
+    sorter.sync_and_distance(imap, "A", SOURCE, quiet=True)
+    imap.select("A")
+    assert imap.uid("MOVE", "1", "B")[0] == "OK"
+    sorter.sync_and_distance(imap, "B", SOURCE, quiet=True)
+    key = ("", "from", "mover@example.org", "B")
+    assert list(sorter.db.routes) == [key] and sorter.db.routes[key][0] == 1
+    assert sorter.routes().decide([("from", "mover@example.org")]) is None  # below route_min
+    for _ in range(2):
+        sorter.sync_and_distance(imap, "B", SOURCE, quiet=True)
+    assert sorter.db.routes[key][0] == 1
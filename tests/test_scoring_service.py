@@ -0,0 +1,62 @@
+import json
+import socket
+
+import pytest
+
+import scoring_service
+from imap_fixture import synthetic_headers
+from scoring_service import ScoringService
+
+CATS = '[{"cta":"x"},{"label":["A:1.00"]}]'
+
+
+@pytest.fixture
+def service(server, make_sorter, tmp_path, monkeypatch):
+    server.seed(synthetic_headers(120, ["A", "B"], seed=11))
+    sorter = make_sorter()
+    sorter.llm_calls = 0
+
+    def classify(from_addr, subject):
+        sorter.llm_calls += 1
+        return CATS
+
+    monkeypatch.setattr(sorter, "_classify_email", classify)
+    sorter.folder_distances(sorter.imap_helper.connect(), "0" * 64, quiet=True)  # load the corpora
+    with ScoringService(str(tmp_path / "score.sock"), {None: sorter}) as service:
+        yield service
+
+
+def test_score_round_trip(service):
+    sorter = service.sorters[None]
+    raw = next(synthetic_headers(1, ["A", "B"], seed=12))[2]
+    hexdigest = sorter._digest(CATS, sorter.return_header(raw))
+    ladder = []
+    winner = sorter.resolve_winner(sorter.folder_distances(sorter.imap_helper.imap, hexdigest, quiet=True),
+                                   quiet=True, trace=ladder)
+    reply = scoring_service.score(service.path, raw)
+    assert winner in ("A", "B")
+    assert reply["ok"] and reply["winner"] == winner  # what the sorter itself decides
+    assert reply["categories"] == CATS and reply["hexdigest"] == hexdigest
+    assert reply["ladder"] == json.loads(json.dumps(ladder)) and reply["ladder"][-1]["result"] == "winner"
+    assert reply["ranked"][0][0] == winner
+    assert scoring_service.score(service.path, raw)["winner"] == winner
+    assert sorter.llm_calls == 1  # the second request hits the classification cache
+
+
+def test_ping_and_errors(service):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(service.path)
+        with sock.makefile("rwb") as f:
+            for request in ({"op": "ping"}, {"op": "score", "header": "Subject: x\n\n", "account": "other"},
+                            {"op": "nope"}):
+                f.write(json.dumps(request).encode() + b"\n")
+            f.flush()
+            replies = [json.loads(f.readline()) for _ in range(3)]
+    assert replies[0] == {"ok": True, "accounts": [""]}
+    assert not replies[1]["ok"] and "other" in replies[1]["error"]
+    assert not replies[2]["ok"]
+
+
+def test_live_socket_is_not_taken_over(service):
+    with pytest.raises(RuntimeError):
+        ScoringService(service.path, service.sorters)
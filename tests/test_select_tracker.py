@@ -0,0 +1,54 @@
+import threading
+
+import imap_nilsimsa
+from imap_nilsimsa import IdleSession, IMAPAutoSorter, ensure_selected
+
+
+def connect(server):
+    imap = imap_nilsimsa.InstrumentedIMAP4(*server.address)
+    imap.login("fixture", "fixture")
+    return imap
+
+
+def test_select_data_is_tracked(server):
+    for i in range(3):
+        server.deliver("inbox.autosort", "Subject: %d\r\n\r\n" % i)
+    imap = connect(server)
+    assert ensure_selected(imap, '"inbox.autosort"')
+    assert imap.uidvalidity == server.folder("inbox.autosort").uidvalidity
+    assert imap.exists == 3
+    server.deliver("inbox.autosort", "Subject: more\r\n\r\n")
+    imap.noop()
+    assert imap.exists == 4
+    imap.uid("STORE", "1", "+FLAGS", "(\\Deleted)")
+    imap.expunge()
+    assert imap.exists == 3
+    assert not ensure_selected(imap, "inbox.autosort")
+
+
+def test_uidvalidity_of_the_selected_todo_needs_no_status(server):
+    server.create("inbox.autosort")
+    server.create("A")
+    imap = connect(server)
+    ensure_selected(imap, "inbox.autosort")
+    server.commands.clear()
+    assert IMAPAutoSorter._folder_uidvalidity(imap, "inbox.autosort") == server.folder("inbox.autosort").uidvalidity
+    assert not server.commands
+    assert IMAPAutoSorter._folder_uidvalidity(imap, "A") == server.folder("A").uidvalidity
+    assert server.commands["STATUS"] == 1
+
+
+def test_idle_session_reuses_the_selected_mailbox(server):
+    server.deliver("inbox.autosort", "Subject: old\r\n\r\n", ("\\Seen",))
+    imap = connect(server)
+    ensure_selected(imap, "inbox.autosort")
+    server.commands.clear()
+    session = IdleSession(imap, "inbox.autosort")
+    timer = threading.Timer(0.3, server.deliver, ("inbox.autosort", "Subject: new\r\n\r\n"))
+    timer.start()
+    try:
+        assert session.wait(timeout=5) == ["2"]
+    finally:
+        timer.cancel()
+    assert server.commands["SELECT"] == 0
+    assert imap.selected == ("inbox.autosort", False) and imap.exists == 2